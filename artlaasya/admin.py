@@ -1,8 +1,58 @@
 """artlaasya admin"""
 
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.conf.urls import patterns, url
+from django.core.urlresolvers import reverse
+from django.http import JsonResponse
+from django.db.models import Q
+from django.utils import timezone
 
-from .models import Artist, Genre, Artwork, Event
+from .models import (Artist, Genre, Artwork, SaleLedgerEntry, Event, 
+                     Reservation, OutboxEvent)
+from .reservations import cancel_reservation
+from .inventory import bulk_transition
+from .paginators import EstimatedCountPaginator
+from .registry import genre_registry
+from . import bulk
+from .exports import export_response
+from .duplicates import duplicate_index
+from .imagemeta import analyse_artwork_image
+
+
+
+AUTOCOMPLETE_LIMIT = 20
+
+
+class ArtistAutocompleteFilter(admin.SimpleListFilter):
+    """
+    Filters artworks by artist without listing every artist in the sidebar.
+    
+    Only the selected artist is offered as a choice; others are found by 
+    typing into a box backed by the artist admin's autocomplete view.
+    """
+    title = 'artist'
+    parameter_name = 'artist'
+    template = 'admin/artlaasya/autocomplete_filter.html'
+    
+    @property
+    def autocomplete_url(self):
+        return reverse('admin:%s_%s_autocomplete' % (Artist._meta.app_label, 
+                                                      Artist._meta.model_name))
+    
+    def lookups(self, request, model_admin):
+        if not self.value():
+            return ()
+        try:
+            _artist = Artist.artists.get(pk=self.value())
+        except (Artist.DoesNotExist, ValueError):
+            return ()
+        return ((str(_artist.pk), _artist.__str__()),)
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(artist_id=self.value())
+        return queryset
+# /ArtistAutocompleteFilter
 
 
 
@@ -23,6 +73,45 @@ class ArtistAdmin(admin.ModelAdmin):
         }),
     )
     readonly_fields = ('slug', 'created', 'updated',)
+    actions = ('activate', 'deactivate',)
+    
+    def activate(self, request, queryset):
+        _count = bulk.set_artists_active(queryset, True)
+        self.message_user(request, "%d artist(s) activated." % _count)
+    activate.short_description = "Activate selected artists"
+    
+    def deactivate(self, request, queryset):
+        _count = bulk.set_artists_active(queryset, False)
+        self.message_user(request, "%d artist(s) and their artworks "
+                                   "deactivated." % _count)
+    deactivate.short_description = "Deactivate selected artists and their artworks"
+    
+    def get_urls(self):
+        _urls = patterns('',
+            url(r'^autocomplete/$',
+                self.admin_site.admin_view(self.autocomplete_view),
+                name='%s_%s_autocomplete' % (self.model._meta.app_label, 
+                                             self.model._meta.model_name)),
+        )
+        return _urls + super(ArtistAdmin, self).get_urls()
+    
+    def autocomplete_view(self, request):
+        """
+        Returns JSON of artists whose first or last name starts with `term`.
+        """
+        _term = request.GET.get('term', '').strip()
+        _results = []
+        if _term:
+            _artists = Artist.artists.filter(Q(last_name__istartswith=_term) | 
+                                             Q(first_name__istartswith=_term)
+                                    ).orderly(
+                                    ).values('pk', 'first_name', 'last_name'
+                                    )[:AUTOCOMPLETE_LIMIT]
+            _results = [{'pk': _artist['pk'], 
+                         'name': '%s %s' % (_artist['first_name'], 
+                                            _artist['last_name'])} 
+                        for _artist in _artists]
+        return JsonResponse({'results': _results})
 # /ArtistAdmin
 
 admin.site.register(Artist, ArtistAdmin)
@@ -52,7 +141,10 @@ class ArtworkAdmin(admin.ModelAdmin):
     search_fields = ('title', 'artist__last_name', 'artist__first_name', 
                      'inventory_name', 'internal_name',)
     list_display = ('title', 'artist', 'is_representative', 'is_active',)
-    list_filter = ('artist', 'is_representative', 'is_active',)
+    list_filter = (ArtistAutocompleteFilter, 'is_representative', 'is_active',)
+    list_select_related = ('artist',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         ('Identity', {
             'fields': (('is_active'), ('title', 'name',), 
@@ -71,7 +163,10 @@ class ArtworkAdmin(admin.ModelAdmin):
                        'alternative_pricing_message',)
         }),
         ('Image Upload', {
-            'fields': (('uploaded_image', 'create_deepzoom'),)
+            'fields': (('uploaded_image', 'create_deepzoom'), 
+                       ('width', 'height', 'file_size'), 
+                       ('image_format', 'color_mode', 'color_profile'), 
+                       'dominant_colors',)
         }),
         (None, {
             'fields': (('slug', 'created', 'updated'),)
@@ -79,12 +174,150 @@ class ArtworkAdmin(admin.ModelAdmin):
     )
     readonly_fields = ('name', 'height_metric', 'width_metric', 
                        'metric_units', 'height_imperial', 'width_imperial', 
-                       'imperial_units', 'slug', 'created', 'updated',)
+                       'imperial_units', 'status', 'width', 
+                       'height', 'file_size', 'image_format', 
+                       'color_mode', 'color_profile', 'dominant_colors', 
+                       'slug', 'created', 'updated',)
+    actions = ('activate', 'deactivate', 'make_representative', 
+               'display_price', 'hide_price', 
+               'place_on_hold', 'mark_sold', 'release_hold', 'export_csv',)
+    
+    def export_csv(self, request, queryset):
+        return export_response('artworks', 'csv', queryset)
+    export_csv.short_description = "Export selected artworks as CSV"
+    
+    def activate(self, request, queryset):
+        _count = bulk.set_artworks_active(queryset, True)
+        self.message_user(request, "%d artwork(s) activated." % _count)
+    activate.short_description = "Activate selected artworks"
+    
+    def deactivate(self, request, queryset):
+        _count = bulk.set_artworks_active(queryset, False)
+        self.message_user(request, "%d artwork(s) deactivated." % _count)
+    deactivate.short_description = "Deactivate selected artworks"
+    
+    def make_representative(self, request, queryset):
+        _count = bulk.make_artworks_representative(queryset)
+        self.message_user(request, "%d artwork(s) made representative." % _count)
+    make_representative.short_description = "Make selected artworks representative"
+    
+    def display_price(self, request, queryset):
+        _count = bulk.set_artworks_price_displayed(queryset, True)
+        self.message_user(request, "Price displayed for %d artwork(s)." % _count)
+    display_price.short_description = "Display price of selected artworks"
+    
+    def hide_price(self, request, queryset):
+        _count = bulk.set_artworks_price_displayed(queryset, False)
+        self.message_user(request, "Price hidden for %d artwork(s)." % _count)
+    hide_price.short_description = "Hide price of selected artworks"
+    
+    def get_actions(self, request):
+        """
+        Adds a "set genre" action for each genre.
+        """
+        _actions = super(ArtworkAdmin, self).get_actions(request)
+        for _genre in genre_registry.all():
+            _name = 'set_genre_%d' % _genre.pk
+            _actions[_name] = (self._get_set_genre_action(_genre), 
+                               _name, 
+                               "Set genre of selected artworks to %s" % 
+                               _genre.name)
+        return _actions
+    
+    def _get_set_genre_action(self, genre):
+        def set_genre(modeladmin, request, queryset):
+            _count = bulk.set_artworks_genre(queryset, genre)
+            modeladmin.message_user(request, "Genre changed for %d "
+                                             "artwork(s)." % _count)
+        return set_genre
+    
+    def _transition_selected(self, request, queryset, from_status, to_status):
+        _count = bulk_transition(queryset, from_status, to_status, 
+                                 staff=request.user)
+        self.message_user(request, "%d artwork(s) changed to %s; %d skipped." % 
+                          (_count, 
+                           dict(Artwork.STATUS_CHOICES)[to_status], 
+                           queryset.count() - _count))
+    
+    def place_on_hold(self, request, queryset):
+        self._transition_selected(request, queryset, 'AVAL', 'HOLD')
+    place_on_hold.short_description = "Place selected available artworks on hold"
+    
+    def mark_sold(self, request, queryset):
+        self._transition_selected(request, queryset, 'HOLD', 'SOLD')
+    mark_sold.short_description = "Mark selected held artworks sold"
+    
+    def release_hold(self, request, queryset):
+        self._transition_selected(request, queryset, 'HOLD', 'AVAL')
+    release_hold.short_description = "Release hold on selected artworks"
+    
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Matches every term against the artwork's own searched columns, or 
+        its artist's names through a subquery on the artist table.
+        
+        Keeping each `OR` within one table lets PostgreSQL answer it from 
+        the trigram indexes made by `create_search_indexes`, which need 
+        PostgreSQL 9.5+ with `pg_trgm`.  Elsewhere the search scans.
+        """
+        for _term in search_term.split():
+            _artists = Artist.artists.filter(Q(last_name__icontains=_term) | 
+                                             Q(first_name__icontains=_term)
+                                    ).values('pk')
+            queryset = queryset.filter(Q(title__icontains=_term) | 
+                                       Q(inventory_name__icontains=_term) | 
+                                       Q(internal_name__icontains=_term) | 
+                                       Q(artist__in=_artists))
+        return queryset, False
+    
+    def save_model(self, request, obj, form, change):
+        """
+        Warns when a newly uploaded image looks like that of another artwork.
+        
+        The image is analysed here rather than waiting for the outbox, as 
+        the warning needs its hash.
+        """
+        super(ArtworkAdmin, self).save_model(request, obj, form, change)
+        if 'uploaded_image' not in form.changed_data:
+            return
+        analyse_artwork_image(obj)
+        _matches = duplicate_index.find(obj.image_phash, exclude=obj.pk)
+        if _matches:
+            _artworks = Artwork.artworks.in_bulk([_pk for _distance, _pk 
+                                                  in _matches])
+            self.message_user(request, 
+                              "The image of \"%s\" looks like that of: %s." % 
+                              (obj.title, 
+                               ', '.join('%s (%s)' % (_artworks[_pk].title, 
+                                                      _artworks[_pk].inventory_name) 
+                                         for _distance, _pk in _matches 
+                                         if _pk in _artworks)), 
+                              level=messages.WARNING)
 # /ArtworkAdmin
 
 admin.site.register(Artwork, ArtworkAdmin)
 
 
+class SaleLedgerEntryAdmin(admin.ModelAdmin):
+    ordering = ('-created',)
+    search_fields = ('inventory_name', 'note',)
+    list_display = ('inventory_name', 'from_status', 'to_status', 'price', 
+                    'staff', 'created',)
+    list_filter = ('to_status',)
+    list_select_related = ('staff',)
+    readonly_fields = ('artwork', 'inventory_name', 'from_status', 
+                       'to_status', 'price', 'staff', 'note', 'created',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+# /SaleLedgerEntryAdmin
+
+admin.site.register(SaleLedgerEntry, SaleLedgerEntryAdmin)
+
+
 class EventAdmin(admin.ModelAdmin):
     ordering = ('-created',)
     search_fields = ('title', 'start_date',)
@@ -95,7 +328,8 @@ class EventAdmin(admin.ModelAdmin):
             'fields': (('is_active'), ('title', 'image'),)
         }),
         ('Admissions', {
-            'fields': (('total_seats', 'is_admission', 'admission_price'),)
+            'fields': (('total_seats', 'seats_reserved'), 
+                       ('is_admission', 'admission_price'),)
         }),
         ('Details', {
             'fields': ('type', ('start_date', 'end_date'), 'location', 
@@ -105,10 +339,59 @@ class EventAdmin(admin.ModelAdmin):
             'fields': (('slug', 'created', 'updated'),)
         }),
     )
-    readonly_fields = ('slug', 'created', 'updated',)
+    readonly_fields = ('seats_reserved', 'slug', 'created', 'updated',)
 # /EventAdmin
 
 admin.site.register(Event, EventAdmin)
 
 
+class ReservationAdmin(admin.ModelAdmin):
+    ordering = ('-created',)
+    search_fields = ('email', 'name', 'event__title',)
+    list_display = ('email', 'name', 'event', 'seats', 'created',)
+    list_select_related = ('event',)
+    readonly_fields = ('event', 'email', 'name', 'seats', 'created',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def get_actions(self, request):
+        # Bulk deletion would bypass `cancel_reservation` and leave the 
+        # event's seat count behind.
+        _actions = super(ReservationAdmin, self).get_actions(request)
+        _actions.pop('delete_selected', None)
+        return _actions
+    
+    def delete_model(self, request, obj):
+        cancel_reservation(obj)
+# /ReservationAdmin
+
+admin.site.register(Reservation, ReservationAdmin)
+
+
+class OutboxEventAdmin(admin.ModelAdmin):
+    ordering = ('-pk',)
+    search_fields = ('=object_pk',)
+    list_display = ('model_label', 'object_pk', 'action', 'fields', 
+                    'created', 'attempts', 'processed',)
+    list_filter = ('model_label', 'action',)
+    readonly_fields = ('model_label', 'object_pk', 'action', 'fields', 
+                       'surrogate_keys', 'created', 'next_attempt', 'attempts', 'last_error', 
+                       'processed',)
+    actions = ('retry',)
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def retry(self, request, queryset):
+        _count = queryset.update(processed=None, 
+                                 attempts=0, 
+                                 next_attempt=timezone.now())
+        self.message_user(request, "%d event(s) queued for retry." % _count)
+    retry.short_description = "Retry selected events"
+# /OutboxEventAdmin
+
+admin.site.register(OutboxEvent, OutboxEventAdmin)
+
+
 #EOF - artlaasya admin
\ No newline at end of file
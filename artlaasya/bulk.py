@@ -0,0 +1,107 @@
+"""artlaasya bulk"""
+
+from django.utils import timezone
+
+from artlaasya.utils import atomic
+from artlaasya.models import Artist, Artwork, OutboxEvent
+from artlaasya.signals import catalogue_bulk_changed
+
+
+
+def announce(model, pks, fields, previous_keys=()):
+    """
+    Records a bulk change of `fields` in the outbox, with the surrogate keys 
+    of any pages the rows were moved off, and announces it once.  Callers 
+    provide the transaction.
+    """
+    OutboxEvent.record_many(model, pks, OutboxEvent.UPDATE, fields, 
+                            previous_keys)
+    catalogue_bulk_changed.send(sender=model, 
+                                pks=pks, 
+                                fields=fields)
+
+
+def _update(model, pks, previous_keys=(), **values):
+    """
+    Updates the rows in one statement, records the change in the outbox and 
+    announces it once.  Callers provide the transaction.
+    """
+    if not pks:
+        return 0
+    _fields = [_field for _field in values]
+    values['updated'] = timezone.now()
+    _count = model._default_manager.filter(pk__in=pks).update(**values)
+    announce(model, pks, _fields, previous_keys)
+    return _count
+
+
+def set_artworks_active(artworks, is_active):
+    with atomic():
+        return _update(Artwork, 
+                       list(artworks.exclude(is_active=is_active
+                                   ).values_list('pk', flat=True)), 
+                       is_active=is_active)
+
+
+def set_artworks_genre(artworks, genre):
+    with atomic():
+        _moved = artworks.exclude(genre=genre)
+        _previous_keys = ['genre-%s' % _slug 
+                          for _slug in _moved.order_by(
+                                            ).values_list('genre__slug', 
+                                                          flat=True
+                                            ).distinct()]
+        return _update(Artwork, 
+                       list(_moved.values_list('pk', flat=True)), 
+                       previous_keys=_previous_keys, 
+                       genre=genre)
+
+
+def set_artworks_price_displayed(artworks, is_price_displayed):
+    with atomic():
+        return _update(Artwork, 
+                       list(artworks.exclude(is_price_displayed=is_price_displayed
+                                   ).values_list('pk', flat=True)), 
+                       is_price_displayed=is_price_displayed)
+
+
+def make_artworks_representative(artworks):
+    """
+    Makes the given artworks representative of their artists, keeping one 
+    representative per artist: where several belong to the same artist the 
+    most recently added wins, and every other artwork of the affected 
+    artists stops being representative.
+    """
+    _chosen = {}
+    for _pk, _artist_id in artworks.order_by('pk').values_list('pk', 
+                                                               'artist_id'):
+        _chosen[_artist_id] = _pk
+    
+    with atomic():
+        _demoted = list(Artwork.artworks.filter(artist_id__in=list(_chosen),
+                                                is_representative=True
+                                       ).exclude(pk__in=list(_chosen.values())
+                                       ).values_list('pk', flat=True))
+        _update(Artwork, _demoted, is_representative=False)
+        return _update(Artwork, list(_chosen.values()), is_representative=True)
+
+
+def set_artists_active(artists, is_active):
+    """
+    Activates or deactivates artists.  Deactivating an artist also 
+    deactivates all of that artist's artworks, as a single update.
+    """
+    with atomic():
+        _pks = list(artists.exclude(is_active=is_active
+                          ).values_list('pk', flat=True))
+        _count = _update(Artist, _pks, is_active=is_active)
+        if _pks and not is_active:
+            _update(Artwork, 
+                    list(Artwork.artworks.filter(artist_id__in=_pks, 
+                                                 is_active=True
+                                        ).values_list('pk', flat=True)), 
+                    is_active=False)
+        return _count
+
+
+#EOF - artlaasya bulk
@@ -0,0 +1,227 @@
+"""artlaasya caching"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.module_loading import import_string
+from django.views.decorators.gzip import gzip_page
+
+import time
+import hashlib
+import threading
+from datetime import date
+from functools import wraps
+
+
+
+# Seconds a public page may be cached, overridable per view by policy name.
+CACHE_MAX_AGE = getattr(settings, 'CACHE_MAX_AGE', 300)
+
+CACHE_MAX_AGES = getattr(settings, 'CACHE_MAX_AGES', {})
+
+SURROGATE_KEY_HEADER = getattr(settings, 'SURROGATE_KEY_HEADER',
+                               'Surrogate-Key')
+
+# Dotted path of the class whose `purge(keys)` purges the CDN; defaults to
+# `NullCDN`, which purges nothing.
+SURROGATE_PURGE_BACKEND = getattr(settings, 'SURROGATE_PURGE_BACKEND', None)
+
+SURROGATE_VERSION_KEY = getattr(settings, 'SURROGATE_VERSION_KEY',
+                                'artlaasya:surrogate:%s')
+
+
+class NullCDN(object):
+    """
+    Purge backend for sites served without a CDN.
+    """
+
+    def purge(self, keys):
+        pass
+# /NullCDN
+
+
+class LocalCDN(object):
+    """
+    In-process stand-in for a CDN honouring surrogate keys, for tests.
+
+    `store` keeps a response under its path, tagged with the response's
+    surrogate keys; `purge` drops every stored response carrying any of the
+    keys and records the keys in `purged`.
+    """
+
+    def __init__(self):
+        self.responses = {}
+        self.purged = []
+        self._lock = threading.Lock()
+
+
+    def store(self, path, response):
+        _keys = frozenset(response.get(SURROGATE_KEY_HEADER, '').split())
+        with self._lock:
+            self.responses[path] = (_keys, response)
+
+
+    def get(self, path):
+        _entry = self.responses.get(path)
+        return _entry[1] if _entry else None
+
+
+    def purge(self, keys):
+        _keys = frozenset(keys)
+        with self._lock:
+            self.purged.extend(sorted(_keys))
+            for _path, (_tags, _response) in list(self.responses.items()):
+                if _tags & _keys:
+                    del self.responses[_path]
+# /LocalCDN
+
+
+_backend = None
+
+
+def get_purge_backend():
+    global _backend
+    if _backend is None:
+        _backend = (import_string(SURROGATE_PURGE_BACKEND)()
+                    if SURROGATE_PURGE_BACKEND else NullCDN())
+    return _backend
+
+
+def get_versions(keys):
+    """
+    Returns the current version of each surrogate key in `keys`.
+    
+    A key missing from the cache starts at the current time in milliseconds,
+    so a version lost to eviction or a restart is never reused.
+    """
+    _cache_keys = dict((SURROGATE_VERSION_KEY % _key, _key) for _key in keys)
+    _versions = cache.get_many(list(_cache_keys))
+    for _cache_key in _cache_keys:
+        if _cache_key not in _versions:
+            cache.add(_cache_key, int(time.time() * 1000), None)
+            _versions[_cache_key] = cache.get(_cache_key)
+    return [_versions[_cache_key] for _cache_key in sorted(_cache_keys)]
+
+
+def bump_versions(keys):
+    for _key in keys:
+        _cache_key = SURROGATE_VERSION_KEY % _key
+        try:
+            cache.incr(_cache_key)
+        except ValueError:
+            cache.set(_cache_key, int(time.time() * 1000), None)
+
+
+def purge_surrogate_keys(keys):
+    """
+    Purges the CDN of the pages tagged with any of `keys` and changes the 
+    ETags of those pages.
+    """
+    if keys:
+        bump_versions(keys)
+        get_purge_backend().purge(keys)
+
+
+def get_surrogate_keys(instance):
+    """
+    Returns the surrogate keys of the pages showing `instance`.
+    """
+    _name = instance._meta.model_name
+    _keys = ['%s-%s' % (_name, instance.slug)]
+    if _name == 'artwork':
+        _keys.extend(['artist-%s' % instance.artist.slug,
+                      'genre-%s' % instance.genre.slug,
+                      'artworks', 'home'])
+    elif _name == 'artist':
+        _keys.extend(['artists', 'artworks', 'home'])
+    elif _name == 'genre':
+        _keys.extend(['artists', 'artworks', 'home'])
+    elif _name == 'event':
+        _keys.append('events')
+    return _keys
+
+
+def get_previous_surrogate_keys(instance, changed_fields):
+    """
+    Returns the surrogate keys of the pages that showed `instance` before 
+    the changes in `changed_fields`: those of an artwork's previous artist 
+    and genre.  Must be called before the save resets the field diff.
+    """
+    _keys = []
+    if instance._meta.model_name != 'artwork':
+        return _keys
+    for _field_name in ('artist', 'genre'):
+        _diff = (instance.get_field_diff(_field_name) 
+                 if _field_name in changed_fields else None)
+        if not _diff or _diff[0] is None:
+            continue
+        _model = instance._meta.get_field(_field_name).rel.to
+        _keys.extend('%s-%s' % (_field_name, _slug) 
+                     for _slug in _model._default_manager.filter(
+                                             pk=_diff[0]
+                                             ).values_list('slug', flat=True))
+    return _keys
+
+
+def get_etag(request, name, keys):
+    """
+    Returns an ETag for the page at the request's path, derived from the
+    versions of its surrogate `keys` and today's date, so any purge of the
+    page or date-relative change alters it.  Costs one cache read.
+    """
+    _parts = [name, request.get_full_path(), date.today().isoformat()]
+    _parts.extend(str(_version) for _version in get_versions(keys))
+    return '"%s"' % hashlib.md5('|'.join(_parts).encode('utf-8')).hexdigest()
+
+
+def etag_matches(request, etag):
+    # GZipMiddleware and `gzip_page` mark compressed ETags with ';gzip'.
+    _sent = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return etag in [_tag.strip().replace(';gzip"', '"')
+                    for _tag in _sent.split(',')]
+
+
+def cache_policy(name, keys=(), max_age=None, etag=True):
+    """
+    Decorator making a public view cacheable by browsers and the CDN.
+
+    GET responses get `Cache-Control: public, max-age` from
+    `CACHE_MAX_AGES[name]`, else `max_age` or `CACHE_MAX_AGE`, the 
+    surrogate keys in `keys` formatted with the view's keyword arguments,
+    and gzip compression varying on Accept-Encoding.  Unless `etag` is 
+    false, they also get an ETag from the keys' versions, answering 
+    conditional requests with 304 before the view runs.
+    
+    Views whose output differs between identical requests, such as shuffled
+    listings, should pass `max_age=0, etag=False`.
+    """
+    _max_age = CACHE_MAX_AGES.get(name, 
+                                  CACHE_MAX_AGE if max_age is None else max_age)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            _keys = [_key.format(**kwargs) for _key in keys]
+            _etag = get_etag(request, name, _keys) if etag and _keys else None
+            if _etag and etag_matches(request, _etag):
+                _response = HttpResponseNotModified()
+            else:
+                _response = view(request, *args, **kwargs)
+            if _response.status_code not in (200, 304):
+                return _response
+
+            if _etag:
+                _response['ETag'] = _etag
+            patch_cache_control(_response, public=True, max_age=_max_age)
+            patch_vary_headers(_response, ('Accept-Encoding',))
+            _response[SURROGATE_KEY_HEADER] = ' '.join(_keys)
+            return _response
+        return gzip_page(wrapper)
+    return decorator
+
+
+#EOF - artlaasya caching
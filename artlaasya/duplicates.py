@@ -0,0 +1,165 @@
+"""artlaasya duplicates"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from artlaasya.registry import SharedIndex
+
+
+
+# Largest number of differing hash bits at which two images are reported 
+# as near-duplicates.  The index is split into one more band than this, so 
+# every match within it is found.
+DUPLICATE_MAX_DISTANCE = getattr(settings, 'DUPLICATE_MAX_DISTANCE', 3)
+
+DUPLICATE_INDEX_VERSION_KEY = getattr(settings, 'DUPLICATE_INDEX_VERSION_KEY',
+                                      'artlaasya:duplicate_index:version')
+
+HASH_BITS = 64
+
+if not 0 <= DUPLICATE_MAX_DISTANCE < HASH_BITS:
+    raise ImproperlyConfigured("DUPLICATE_MAX_DISTANCE must be between 0 and "
+                               "%d." % (HASH_BITS - 1))
+
+HASH_BANDS = DUPLICATE_MAX_DISTANCE + 1
+
+# (shift, width) of each band; widths differ by at most one bit when the 
+# bands do not divide the hash evenly.
+BANDS = [(HASH_BITS * _band // HASH_BANDS, 
+          HASH_BITS * (_band + 1) // HASH_BANDS - HASH_BITS * _band // HASH_BANDS)
+         for _band in range(HASH_BANDS)]
+
+
+def to_signed(value):
+    # Hashes are stored in a signed 64-bit column.
+    return value - (1 << HASH_BITS) if value >= (1 << (HASH_BITS - 1)) else value
+
+
+def to_unsigned(value):
+    return value & ((1 << HASH_BITS) - 1)
+
+
+def get_dhash(image):
+    """
+    Returns the 64-bit difference hash of a PIL image, as stored: each bit 
+    records whether a pixel of a 9x8 greyscale reduction is brighter than 
+    its right-hand neighbour.
+    
+    Rescaling, recompression and small colour or level changes leave the 
+    hash unchanged or change few bits.
+    """
+    from PIL import Image
+    
+    _resample = getattr(Image, 'LANCZOS', None) or Image.ANTIALIAS
+    _pixels = list(image.convert('L').resize((9, 8), _resample).getdata())
+    _hash = 0
+    for _row in range(8):
+        for _column in range(8):
+            _left = _pixels[_row * 9 + _column]
+            _hash = (_hash << 1) | (_left > _pixels[_row * 9 + _column + 1])
+    return to_signed(_hash)
+
+
+def hamming_distance(hash1, hash2):
+    return bin(to_unsigned(hash1) ^ to_unsigned(hash2)).count('1')
+
+
+def get_bands(phash):
+    _hash = to_unsigned(phash)
+    return [(_band, (_hash >> _shift) & ((1 << _width) - 1)) 
+            for _band, (_shift, _width) in enumerate(BANDS)]
+
+
+class DuplicateIndex(SharedIndex):
+    """
+    Process-local banded index of the perceptual hashes of every artwork 
+    image.
+    
+    Each hash is split into `DUPLICATE_MAX_DISTANCE + 1` bands, four 
+    16-bit bands by default, and filed under each band's value.  Two hashes 
+    differing in at most `DUPLICATE_MAX_DISTANCE` bits must agree on at 
+    least one band, so a lookup only compares against the few artworks 
+    sharing a band instead of the whole catalogue.  Larger distances cannot 
+    be looked up and raise `ValueError`.
+    
+    The index is invalidated by an outbox consumer after artwork changes, 
+    in every process through its shared version, and rebuilt lazily on the 
+    next lookup.
+    """
+
+    version_key = DUPLICATE_INDEX_VERSION_KEY
+
+    def _load(self):
+        from artlaasya.models import Artwork
+
+        _hashes = {}
+        _bands = {}
+        for _pk, _phash in Artwork.artworks.filter(image_phash__isnull=False
+                                          ).order_by(
+                                          ).values_list('pk', 'image_phash'
+                                          ).iterator():
+            _hashes[_pk] = _phash
+            for _band in get_bands(_phash):
+                _bands.setdefault(_band, []).append(_pk)
+        return {'hashes': _hashes, 'bands': _bands}
+
+
+    def find(self, phash, exclude=None, max_distance=DUPLICATE_MAX_DISTANCE):
+        """
+        Returns `[(distance, pk)]`, closest first, of the artworks whose 
+        image hash is within `max_distance` bits of `phash`, other than 
+        `exclude`.
+        """
+        if max_distance > DUPLICATE_MAX_DISTANCE:
+            raise ValueError("The duplicate index only finds hashes up to "
+                             "DUPLICATE_MAX_DISTANCE = %d bits apart." % 
+                             DUPLICATE_MAX_DISTANCE)
+        if phash is None:
+            return []
+        _state = self._get_state()
+        _candidates = set()
+        for _band in get_bands(phash):
+            _candidates.update(_state['bands'].get(_band, ()))
+        _candidates.discard(exclude)
+        
+        _found = []
+        for _pk in _candidates:
+            _distance = hamming_distance(phash, _state['hashes'][_pk])
+            if _distance <= max_distance:
+                _found.append((_distance, _pk))
+        _found.sort()
+        return _found
+
+
+    def find_groups(self, max_distance=DUPLICATE_MAX_DISTANCE):
+        """
+        Returns lists of primary keys, each a group of artworks linked by 
+        near-duplicate images, largest groups first.
+        """
+        _state = self._get_state()
+        _parents = {}
+        
+        def _root(pk):
+            while pk in _parents:
+                pk = _parents[pk]
+            return pk
+        
+        for _pk, _phash in _state['hashes'].items():
+            for _distance, _other_pk in self.find(_phash, _pk, max_distance):
+                _first, _second = _root(_pk), _root(_other_pk)
+                if _first != _second:
+                    _parents[max(_first, _second)] = min(_first, _second)
+        
+        _groups = {}
+        for _pk in _parents:
+            _group_root = _root(_pk)
+            _groups.setdefault(_group_root, set([_group_root])).add(_pk)
+        return sorted((sorted(_group) for _group in _groups.values()), 
+                      key=lambda _group: (-len(_group), _group[0]))
+# /DuplicateIndex
+
+
+duplicate_index = DuplicateIndex()
+
+
+#EOF - artlaasya duplicates
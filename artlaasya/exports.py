@@ -0,0 +1,109 @@
+"""artlaasya exports"""
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import six
+
+import csv
+import json
+
+from artlaasya.models import Artist, Artwork, Event
+from artlaasya.utils import iterate_in_batches
+
+
+
+EXPORTS = {
+    'artists': (Artist.artists.all,
+                ('pk', 'slug', 'first_name', 'last_name', 'is_active', 
+                 'created', 'updated')),
+    'artworks': (Artwork.artworks.all,
+                 ('pk', 'inventory_name', 'internal_name', 'title', 'slug', 
+                  'artist__slug', 'genre__name', 'year', 'style_class', 
+                  'medium_description', 'height_metric', 'width_metric', 
+                  'height_imperial', 'width_imperial', 'price', 
+                  'is_price_displayed', 'status', 'is_representative', 
+                  'is_active', 'created', 'updated')),
+    'events': (Event.events.all,
+               ('pk', 'title', 'slug', 'type', 'start_date', 'end_date', 
+                'time', 'location', 'total_seats', 'seats_reserved', 
+                'is_admission', 'admission_price', 'is_active', 'created', 
+                'updated')),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+}
+
+
+class Echo(object):
+    """
+    File-like object whose `write` returns what it is given, so `csv.writer` 
+    can produce one line at a time.
+    """
+    def write(self, value):
+        return value
+# /Echo
+
+
+def get_rows(name, queryset=None, batch_size=500):
+    """
+    Returns the field names of export `name` and an iterator over its rows 
+    as dicts, in batches of `batch_size`.
+    """
+    _get_queryset, _fields = EXPORTS[name]
+    if queryset is None:
+        queryset = _get_queryset()
+    return _fields, iterate_in_batches(queryset.values(*_fields), batch_size)
+
+
+def to_csv_value(value):
+    # Python 2's csv module only writes byte strings.
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def export_csv(name, queryset=None):
+    """
+    Yields export `name` as CSV, one line at a time: UTF-8 byte strings on 
+    Python 2, text on Python 3.
+    """
+    _fields, _rows = get_rows(name, queryset)
+    _writer = csv.writer(Echo())
+    yield _writer.writerow(_fields)
+    for _row in _rows:
+        yield _writer.writerow([to_csv_value(_row[_field]) 
+                                for _field in _fields])
+
+
+def export_json(name, queryset=None):
+    """
+    Yields export `name` as a JSON array, one object at a time.
+    """
+    _fields, _rows = get_rows(name, queryset)
+    _separator = '[\n'
+    for _row in _rows:
+        yield _separator + json.dumps(_row, cls=DjangoJSONEncoder)
+        _separator = ',\n'
+    yield '[]\n' if _separator == '[\n' else '\n]\n'
+
+
+def export(name, format='csv', queryset=None):
+    if format == 'json':
+        return export_json(name, queryset)
+    return export_csv(name, queryset)
+
+
+def export_response(name, format='csv', queryset=None):
+    """
+    Returns a streaming download of export `name`.
+    """
+    _response = StreamingHttpResponse(export(name, format, queryset),
+                                      content_type=CONTENT_TYPES[format])
+    _response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+                                       name, format)
+    return _response
+
+
+#EOF - artlaasya exports
@@ -0,0 +1,177 @@
+"""artlaasya files"""
+
+from django.conf import settings
+
+import os
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from artlaasya.utils import on_commit
+
+
+
+logger = logging.getLogger(__name__)
+
+DEEPZOOM_TILES_SUFFIX = getattr(settings, 'DEEPZOOM_TILES_SUFFIX', '_files')
+
+
+def join_storage_name(root, name):
+    """
+    Joins storage names with forward slashes, as the storage API expects.
+    """
+    if not root:
+        return name
+    return '/'.join([root.rstrip('/'), name])
+
+
+def walk_storage(storage, root=''):
+    """
+    Yields the name of every file below `root` in `storage`.
+
+    Directories are listed one at a time, so the full tree is never held in
+    memory.  A missing `root` yields nothing.
+    """
+    try:
+        _directories, _files = storage.listdir(root)
+    except (OSError, IOError):
+        return
+    for _file in _files:
+        yield join_storage_name(root, _file)
+    for _directory in _directories:
+        for _name in walk_storage(storage, join_storage_name(root, _directory)):
+            yield _name
+
+
+def get_deepzoom_tiles_root(dzi_name):
+    """
+    Returns the storage name of the tile tree belonging to a DZI file.
+    """
+    return os.path.splitext(dzi_name)[0] + DEEPZOOM_TILES_SUFFIX
+
+
+class FileLifecycleManager(object):
+    """
+    Deletes uploaded files through Django's storage API.
+
+    Deletions are scheduled with `utils.on_commit`, so a rolled back
+    save or delete never loses its file, and are then carried out by a
+    background worker thread so the request does not wait on storage I/O.
+    Set `FILE_CLEANUP_ASYNC = False` to delete synchronously on commit.
+
+    Besides single files, whole trees of derivatives can be removed in one 
+    job.  Artwork images and their deepzoom tiles are left to the deepzoom 
+    package's own signals.
+    """
+
+    def __init__(self, asynchronous=None):
+        if asynchronous is None:
+            asynchronous = getattr(settings, 'FILE_CLEANUP_ASYNC', True)
+        self.asynchronous = asynchronous
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+
+    def delete(self, field_file, derivatives=(), trees=()):
+        """
+        Schedules deletion of `field_file` along with any named derivative
+        files and trees stored beside it.
+        """
+        if not field_file:
+            return
+        self.delete_names(field_file.storage,
+                          [field_file.name] + list(derivatives),
+                          trees)
+
+
+    def delete_names(self, storage, names=(), trees=()):
+        """
+        Schedules deletion of `names` and of every file below `trees`.
+        """
+        _job = (storage,
+                tuple(_name for _name in names if _name),
+                tuple(_tree for _tree in trees if _tree))
+        if _job[1] or _job[2]:
+            on_commit(lambda: self._submit(_job))
+
+
+    def join(self):
+        """
+        Blocks until every submitted deletion has been carried out.
+        """
+        self._queue.join()
+
+
+    def _submit(self, job):
+        if not self.asynchronous:
+            self._run(job)
+            return
+        self._ensure_worker()
+        self._queue.put(job)
+
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work,
+                                                name='artlaasya-file-cleanup')
+                self._worker.daemon = True
+                self._worker.start()
+
+
+    def _work(self):
+        while True:
+            _job = self._queue.get()
+            try:
+                self._run(_job)
+            except Exception:
+                logger.exception("File cleanup job failed.")
+            finally:
+                self._queue.task_done()
+
+
+    def _run(self, job):
+        _storage, _names, _trees = job
+        for _name in _names:
+            self._delete_name(_storage, _name)
+        for _tree in _trees:
+            for _name in walk_storage(_storage, _tree):
+                self._delete_name(_storage, _name)
+            self._remove_empty_directories(_storage, _tree)
+
+
+    def _delete_name(self, storage, name):
+        try:
+            storage.delete(name)
+        except (OSError, IOError):
+            logger.warning("Unable to delete '%s' from storage.", name)
+
+
+    def _remove_empty_directories(self, storage, tree):
+        """
+        Removes directories left behind by filesystem-backed storages, which
+        the storage API itself has no call for.
+        """
+        try:
+            _root = storage.path(tree)
+        except NotImplementedError:
+            return
+        for _directory, _subdirectories, _files in os.walk(_root, topdown=False):
+            try:
+                os.rmdir(_directory)
+            except OSError:
+                pass
+# /FileLifecycleManager
+
+
+file_lifecycle = FileLifecycleManager()
+
+
+#EOF - artlaasya files
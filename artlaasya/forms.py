@@ -0,0 +1,22 @@
+"""artlaasya forms"""
+
+from django import forms
+
+
+
+class ReservationForm(forms.Form):
+    """
+    Collects the details needed to reserve seats at an event.
+    """
+    name = forms.CharField(max_length=61,
+                           required=False)
+    
+    email = forms.EmailField(max_length=254)
+    
+    seats = forms.IntegerField(min_value=1,
+                               max_value=10,
+                               initial=1)
+# /ReservationForm
+
+
+#EOF - artlaasya forms
@@ -0,0 +1,91 @@
+"""artlaasya homegrid"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from artlaasya.models import Artwork
+
+
+
+HOME_GRID_CACHE_KEY = getattr(settings, 'HOME_GRID_CACHE_KEY',
+                              'artlaasya:home_grid')
+
+# Seconds the grid may be cached; None keeps it until invalidated.
+HOME_GRID_TIMEOUT = getattr(settings, 'HOME_GRID_TIMEOUT', None)
+
+# Fields of an artwork, its artist or its genre whose change alters the grid.
+HOME_GRID_ARTWORK_FIELDS = frozenset(['is_representative', 'is_active',
+                                      'title', 'slug', 'artist', 'genre',
+                                      'uploaded_image'])
+
+HOME_GRID_ARTIST_FIELDS = frozenset(['first_name', 'last_name', 'slug'])
+
+HOME_GRID_GENRE_FIELDS = frozenset(['name', 'slug'])
+
+
+class Card(dict):
+    """
+    Plain, picklable card data keyed like the model attributes it replaces,
+    so templates render `artwork.title`, `artwork.artist.slug` or
+    `artwork.uploaded_image.url` unchanged.  Renders as `label`.
+    """
+
+    def __unicode__(self):
+        return self.get('label', '')
+
+
+    def __str__(self):
+        return self.get('label', '')
+# /Card
+
+
+def build_card(artwork):
+    _artist = artwork.artist
+    _genre = artwork.genre
+    return Card(label=artwork.title,
+                pk=artwork.pk,
+                title=artwork.title,
+                slug=artwork.slug,
+                get_absolute_url=artwork.get_absolute_url(),
+                uploaded_image=Card(label=artwork.uploaded_image.url,
+                                    url=artwork.uploaded_image.url)
+                               if artwork.uploaded_image else None,
+                artist=Card(label=_artist.__str__(),
+                            first_name=_artist.first_name,
+                            last_name=_artist.last_name,
+                            slug=_artist.slug,
+                            get_absolute_url=_artist.get_absolute_url()),
+                genre=Card(label=_genre.name,
+                           name=_genre.name,
+                           slug=_genre.slug))
+
+
+def build_home_grid():
+    """
+    Returns the cards of every active representative artwork, loading the
+    artworks, artists and genres in one query.
+    """
+    return [build_card(_artwork)
+            for _artwork in Artwork.artworks.representative(
+                                            ).active(
+                                            ).for_listing(
+                                            ).select_related('genre')]
+
+
+def get_home_grid():
+    """
+    Returns the home page cards from the cache, building and caching them
+    first if needed.
+    """
+    _grid = cache.get(HOME_GRID_CACHE_KEY)
+    if _grid is None:
+        _grid = build_home_grid()
+        cache.set(HOME_GRID_CACHE_KEY, _grid, HOME_GRID_TIMEOUT)
+    return _grid
+
+
+def invalidate_home_grid():
+    cache.delete(HOME_GRID_CACHE_KEY)
+
+
+#EOF - artlaasya homegrid
@@ -0,0 +1,143 @@
+"""artlaasya imagemeta"""
+
+from django.conf import settings
+
+import io
+import logging
+
+from artlaasya.palette import pack_palette
+from artlaasya.duplicates import get_dhash
+
+
+logger = logging.getLogger(__name__)
+
+# Number of dominant colours recorded per image; 0 skips the colour pass.
+IMAGE_DOMINANT_COLORS = getattr(settings, 'IMAGE_DOMINANT_COLORS', 5)
+
+# Longest side, in pixels, an image is reduced to before colours are counted.
+IMAGE_SAMPLE_SIZE = getattr(settings, 'IMAGE_SAMPLE_SIZE', 100)
+
+EMPTY_METADATA = {
+    'file_size': None,
+    'image_format': '',
+    'color_mode': '',
+    'color_profile': '',
+    'dominant_colors': '',
+    'palette': None,
+    'image_phash': None,
+}
+
+METADATA_FIELDS = tuple(sorted(EMPTY_METADATA))
+
+# Fields taken from a reduced copy of the image rather than its header.
+ANALYSIS_FIELDS = ('dominant_colors', 'image_phash', 'palette')
+
+
+def get_color_profile(image):
+    """
+    Returns the description of the image's embedded ICC profile, if any.
+    """
+    _icc = image.info.get('icc_profile')
+    if not _icc:
+        return ''
+    try:
+        from PIL import ImageCms
+        _profile = ImageCms.ImageCmsProfile(io.BytesIO(_icc))
+        return ImageCms.getProfileDescription(_profile).strip()[:100]
+    except Exception:
+        return 'Embedded ICC profile'
+
+
+def reduce_image(image):
+    """
+    Returns an RGB copy of `image` no larger than `IMAGE_SAMPLE_SIZE`.
+
+    JPEGs are decoded directly at a reduced scale and everything else is
+    reduced before conversion, so the cost hardly depends on the size of the
+    original.  Reduces `image` in place.
+    """
+    image.draft('RGB', (IMAGE_SAMPLE_SIZE, IMAGE_SAMPLE_SIZE))
+    image.thumbnail((IMAGE_SAMPLE_SIZE, IMAGE_SAMPLE_SIZE))
+    return image.convert('RGB')
+
+
+def get_dominant_colors(sample, count=IMAGE_DOMINANT_COLORS):
+    """
+    Returns `[(share, (r, g, b))]` for the `count` most common colours of
+    a reduced image, most common first, with `share` the fraction of pixels.
+    """
+    _sample = sample.quantize(colors=count)
+    _palette = _sample.getpalette()
+    _colors = sorted(_sample.getcolors(), reverse=True)
+    _total = float(sum(_pixels for _pixels, _index in _colors))
+    return [(_pixels / _total, tuple(_palette[_index * 3:_index * 3 + 3]))
+            for _pixels, _index in _colors[:count]]
+
+
+def format_colors(colors):
+    return ','.join('#%02x%02x%02x' % _rgb for _share, _rgb in colors)
+
+
+def extract_image_metadata(field_file, dominant_colors=IMAGE_DOMINANT_COLORS,
+                           analyse=True):
+    """
+    Returns the `EMPTY_METADATA` fields for an uploaded image, read from its
+    header, plus, if `analyse`, the `ANALYSIS_FIELDS`: its perceptual hash, 
+    dominant colours and packed palette from a reduced copy, which needs 
+    the image decoded.  The pixel size is left to the `width` and `height`
+    fields deepzoom's `UploadedImage` already keeps.
+
+    Works on files still awaiting upload as well as stored ones, and leaves
+    the file positioned at its start.  Missing, unreadable or non-image
+    files, or a missing PIL, give `EMPTY_METADATA`.
+    """
+    _metadata = dict(EMPTY_METADATA)
+    if not field_file:
+        return _metadata
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("PIL is not installed; image metadata not extracted.")
+        return _metadata
+
+    _file = field_file.file
+    _file.seek(0)
+    try:
+        _image = Image.open(_file)
+        _metadata.update(file_size=field_file.size,
+                         image_format=_image.format or '',
+                         color_mode=_image.mode,
+                         color_profile=get_color_profile(_image))
+        if analyse:
+            try:
+                _sample = reduce_image(_image)
+                _metadata['image_phash'] = get_dhash(_sample)
+                if dominant_colors:
+                    _colors = get_dominant_colors(_sample, dominant_colors)
+                    _metadata.update(dominant_colors=format_colors(_colors),
+                                     palette=pack_palette(_colors))
+            except Exception:
+                logger.exception("Unable to decode image %s.", field_file.name)
+    except (IOError, OSError, ValueError):
+        logger.warning("Unable to read image %s.", field_file.name)
+    finally:
+        _file.seek(0)
+    return _metadata
+
+
+def analyse_artwork_image(artwork, dominant_colors=IMAGE_DOMINANT_COLORS):
+    """
+    Fills in and saves the `ANALYSIS_FIELDS` of `artwork` from its image, 
+    closing the image afterwards.
+    """
+    try:
+        _metadata = extract_image_metadata(artwork.uploaded_image, 
+                                           dominant_colors)
+    finally:
+        artwork.uploaded_image.close()
+    for _field in ANALYSIS_FIELDS:
+        setattr(artwork, _field, _metadata[_field])
+    artwork.save(update_fields=ANALYSIS_FIELDS)
+
+
+#EOF - artlaasya imagemeta
@@ -0,0 +1,143 @@
+"""artlaasya inventory"""
+
+from django.db import connections
+from django.utils import timezone
+
+from artlaasya.utils import atomic
+from artlaasya.models import Artwork, SaleLedgerEntry
+from artlaasya.bulk import announce
+
+
+
+TRANSITIONS = {
+    'AVAL': ('HOLD',),
+    'HOLD': ('SOLD', 'AVAL'),
+    'SOLD': ('AVAL',),
+}
+
+
+class InvalidTransition(ValueError):
+    """
+    Raised when a status change is not one of the allowed `TRANSITIONS`.
+    """
+# /InvalidTransition
+
+
+class StatusConflict(Exception):
+    """
+    Raised when an artwork's status was changed by someone else first.
+    """
+# /StatusConflict
+
+
+def check_transition(from_status, to_status):
+    if to_status not in TRANSITIONS.get(from_status, ()):
+        raise InvalidTransition("Cannot change status from %s to %s." % 
+                                (from_status, to_status))
+
+
+def transition(artwork, to_status, from_status=None, staff=None, note=''):
+    """
+    Moves `artwork` from `from_status` (default: its current status) to 
+    `to_status` and records the change in the sale ledger.
+    
+    The row is locked and read, then changed with a compare-and-set UPDATE, 
+    so if two people act on the same artwork at once exactly one succeeds 
+    and the other gets `StatusConflict`.  The ledger records the inventory 
+    name and price read with the lock, not those of the `artwork` instance, 
+    which may be stale.  Save signals are not run; the change goes through 
+    the outbox and `catalogue_bulk_changed` instead.
+    """
+    _from_status = from_status or artwork.status
+    check_transition(_from_status, to_status)
+    
+    with atomic():
+        _row = Artwork.artworks.filter(pk=artwork.pk,
+                                       status=_from_status
+                              ).select_for_update(
+                              ).values_list('inventory_name', 'price').first()
+        if (_row is None or 
+            not Artwork.artworks.filter(pk=artwork.pk,
+                                        status=_from_status
+                               ).update(status=to_status,
+                                        updated=timezone.now())):
+            raise StatusConflict("'%s' is no longer %s." % 
+                                 (artwork, _from_status))
+        announce(Artwork, [artwork.pk], ['status'])
+        _inventory_name, _price = _row
+        _entry = SaleLedgerEntry.entries.create(artwork=artwork,
+                                                inventory_name=_inventory_name,
+                                                from_status=_from_status,
+                                                to_status=to_status,
+                                                price=_price,
+                                                staff=staff,
+                                                note=note)
+    
+    artwork.status = to_status
+    return _entry
+
+
+def hold(artwork, staff=None, note=''):
+    return transition(artwork, 'HOLD', 'AVAL', staff, note)
+
+
+def sell(artwork, staff=None, note=''):
+    return transition(artwork, 'SOLD', 'HOLD', staff, note)
+
+
+def release(artwork, staff=None, note=''):
+    return transition(artwork, 'AVAL', 'HOLD', staff, note)
+
+
+def bulk_transition(artworks, from_status, to_status, staff=None, note=''):
+    """
+    Moves every artwork in the `artworks` queryset (a consignment, say) that 
+    is currently `from_status` to `to_status`, and returns how many moved.
+    
+    The matching rows are locked and read, changed, and recorded with one 
+    bulk insert into the ledger, for the rows actually changed only.  Where 
+    the database can lock rows they are changed with one UPDATE; elsewhere 
+    each row is changed with its own compare-and-set UPDATE, so a row 
+    changed by someone else in between is left out.  Artworks in any other 
+    status are left alone.  The change goes through the outbox and 
+    `catalogue_bulk_changed` like the `bulk` actions.
+    """
+    check_transition(from_status, to_status)
+    
+    with atomic():
+        _rows = list(artworks.filter(status=from_status
+                            ).select_for_update(
+                            ).values_list('pk', 'inventory_name', 'price'))
+        if not _rows:
+            return 0
+        
+        _now = timezone.now()
+        if connections[artworks.db].features.has_select_for_update:
+            Artwork.artworks.filter(pk__in=[_row[0] for _row in _rows]
+                           ).update(status=to_status,
+                                    updated=_now)
+        else:
+            _rows = [_row for _row in _rows
+                     if Artwork.artworks.filter(pk=_row[0],
+                                                status=from_status
+                                       ).update(status=to_status,
+                                                updated=_now)]
+            if not _rows:
+                return 0
+        _pks = [_row[0] for _row in _rows]
+        
+        announce(Artwork, _pks, ['status'])
+        SaleLedgerEntry.entries.bulk_create([
+                    SaleLedgerEntry(artwork_id=_pk,
+                                    inventory_name=_inventory_name,
+                                    from_status=from_status,
+                                    to_status=to_status,
+                                    price=_price,
+                                    staff=staff,
+                                    note=note)
+                    for _pk, _inventory_name, _price in _rows])
+    
+    return len(_rows)
+
+
+#EOF - artlaasya inventory
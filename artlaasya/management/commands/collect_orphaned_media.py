@@ -0,0 +1,267 @@
+"""artlaasya collect_orphaned_media command"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.files.storage import default_storage
+from django.db.models import FileField
+from django.apps import apps
+from django.conf import settings
+
+import os
+from optparse import make_option
+from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+
+from artlaasya.models import Artist, Artwork, Event
+from artlaasya.files import walk_storage, get_deepzoom_tiles_root
+
+
+
+# deepzoom records its DZI files and tile directories in CharFields, which
+# are not found by looking for FileFields.
+DEEPZOOM_PATH_FIELDS = ('deepzoom_image', 'deepzoom_path')
+
+
+def get_file_fields(model):
+    return [_field.name for _field in model._meta.fields
+            if isinstance(_field, FileField)]
+
+
+def get_path_fields(model):
+    _names = [_field.name for _field in model._meta.fields]
+    return [_name for _name in DEEPZOOM_PATH_FIELDS if _name in _names]
+
+
+def to_storage_name(path):
+    """
+    Returns a stored path as a storage name, relative to MEDIA_ROOT.
+    """
+    _path = path.strip()
+    _media_root = getattr(settings, 'MEDIA_ROOT', '') or ''
+    _media_url = getattr(settings, 'MEDIA_URL', '') or ''
+    if _media_root and _path.startswith(_media_root):
+        _path = _path[len(_media_root):]
+    elif _media_url and _path.startswith(_media_url):
+        _path = _path[len(_media_url):]
+    return _path.strip('/')
+
+
+def chunked(iterable, size):
+    _chunk = []
+    for _item in iterable:
+        _chunk.append(_item)
+        if len(_chunk) >= size:
+            yield _chunk
+            _chunk = []
+    if _chunk:
+        yield _chunk
+
+
+class Command(BaseCommand):
+    """
+    Finds uploaded media no longer referenced by any artist biography,
+    artwork image, event image or deepzoom tile tree, reports the space it
+    occupies and deletes it.
+
+    Database references are collected once into sets and the storage tree is
+    streamed past them, so the cost is one query per file field rather than
+    one per file.
+    """
+    help = ("Reports and deletes uploaded media files that are no longer "
+            "referenced by the database.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run',
+                    action='store_true',
+                    dest='dry_run',
+                    default=False,
+                    help="Report orphaned files without deleting them."),
+        make_option('--root',
+                    action='append',
+                    dest='roots',
+                    default=None,
+                    help="Storage directory to scan.  May be repeated.  "
+                         "Defaults to the upload directories in use."),
+        make_option('--batch-size',
+                    type='int',
+                    dest='batch_size',
+                    default=200,
+                    help="Number of files deleted per batch."),
+        make_option('--workers',
+                    type='int',
+                    dest='workers',
+                    default=4,
+                    help="Number of batches deleted in parallel."),
+        make_option('--grace',
+                    type='int',
+                    dest='grace',
+                    default=60,
+                    help="Ignore files modified within this many minutes."),
+    )
+
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--batch-size and --workers must be positive.")
+
+        self.storage = default_storage
+        self.cutoff = datetime.now() - timedelta(minutes=options['grace'])
+        _referenced, _tile_roots = self.get_references()
+        _roots = options['roots'] or self.get_default_roots(_referenced,
+                                                            _tile_roots)
+
+        _orphans = self.find_orphans(_roots, _referenced, _tile_roots)
+
+        _count = 0
+        _reclaimable = 0
+        _deleted = 0
+        _batches = chunked(_orphans, options['batch_size'])
+        if options['dry_run']:
+            for _batch in _batches:
+                for _name, _size in _batch:
+                    self.report(_name, _size, options)
+                    _count += 1
+                    _reclaimable += _size
+        else:
+            _pool = ThreadPool(options['workers'])
+            try:
+                for _batch, _batch_deleted in _pool.imap_unordered(
+                                            self.delete_batch, _batches):
+                    for _name, _size in _batch:
+                        self.report(_name, _size, options)
+                        _count += 1
+                        _reclaimable += _size
+                    _deleted += _batch_deleted
+            finally:
+                _pool.close()
+                _pool.join()
+
+        self.stdout.write("%d orphaned file(s), %d byte(s) reclaimable%s." % (
+                          _count,
+                          _reclaimable,
+                          "" if options['dry_run'] else
+                          ", %d deleted" % _deleted))
+
+
+    def report(self, name, size, options):
+        if int(options['verbosity']) > 1:
+            self.stdout.write("%s (%d bytes)" % (name, size))
+
+
+    def get_models(self):
+        _models = [Artist, Artwork, Event]
+        try:
+            _models.extend(apps.get_app_config('deepzoom').get_models())
+        except LookupError:
+            pass
+        return _models
+
+
+    def get_references(self):
+        """
+        Returns the set of referenced file names and the set of tile tree
+        roots belonging to referenced DZI files.
+        
+        A referenced deepzoom directory is treated as a tile root, so 
+        nothing below it is ever collected.
+        """
+        _referenced = set()
+        _tile_roots = set()
+        for _model in self.get_models():
+            _path_fields = get_path_fields(_model)
+            for _field_name in get_file_fields(_model) + _path_fields:
+                _names = _model._default_manager.exclude(
+                                        **{_field_name: ''}
+                                        ).exclude(
+                                        **{'%s__isnull' % _field_name: True}
+                                        ).values_list(_field_name, flat=True)
+                for _name in _names.iterator():
+                    _name = to_storage_name(_name or '')
+                    if not _name:
+                        continue
+                    if _name.endswith('.dzi'):
+                        _referenced.add(_name)
+                        _tile_roots.add(get_deepzoom_tiles_root(_name))
+                    elif _field_name in _path_fields:
+                        _tile_roots.add(_name)
+                    else:
+                        _referenced.add(_name)
+        return _referenced, _tile_roots
+
+
+    def get_default_roots(self, referenced, tile_roots):
+        """
+        Returns the upload directories to scan: the configured biography and
+        event image roots plus every directory holding a referenced file.
+        """
+        _roots = set([settings.DEFAULT_ARTIST_BIOGRAPHY_ROOT,
+                      settings._DEFAULT_EVENT_IMAGE_ROOT])
+        for _name in referenced | tile_roots:
+            _roots.add(os.path.dirname(_name))
+        _roots = sorted(_root.strip('/') for _root in _roots if _root)
+        return [_root for _root in _roots
+                if not any(_root.startswith(_other + '/')
+                           for _other in _roots if _other != _root)]
+
+
+    def has_references(self, root, referenced, tile_roots):
+        _prefix = root.strip('/') + '/' if root.strip('/') else ''
+        return any(_name.startswith(_prefix) or _name == root.strip('/')
+                   for _name in referenced | tile_roots)
+
+
+    def is_within_tile_root(self, name, tile_roots):
+        _directory = os.path.dirname(name)
+        while _directory:
+            if _directory in tile_roots:
+                return True
+            _directory = os.path.dirname(_directory)
+        return False
+
+
+    def is_old_enough(self, name):
+        try:
+            return self.storage.modified_time(name) < self.cutoff
+        except NotImplementedError:
+            return True
+
+
+    def find_orphans(self, roots, referenced, tile_roots):
+        """
+        Yields `(name, size)` for every unreferenced file below `roots`.
+        
+        A root holding no referenced file at all is skipped: that more 
+        likely means its references were not found than that every file 
+        in it is an orphan.
+        """
+        for _root in roots:
+            if not self.has_references(_root, referenced, tile_roots):
+                self.stderr.write("Skipping '%s': no file below it is "
+                                  "referenced." % _root)
+                continue
+            for _name in walk_storage(self.storage, _root):
+                if _name in referenced:
+                    continue
+                if self.is_within_tile_root(_name, tile_roots):
+                    continue
+                if not self.is_old_enough(_name):
+                    continue
+                try:
+                    _size = self.storage.size(_name)
+                except (OSError, IOError):
+                    continue
+                yield _name, _size
+
+
+    def delete_batch(self, batch):
+        _deleted = 0
+        for _name, _size in batch:
+            try:
+                self.storage.delete(_name)
+                _deleted += 1
+            except (OSError, IOError):
+                self.stderr.write("Unable to delete '%s'." % _name)
+        return batch, _deleted
+# /Command
+
+
+#EOF - artlaasya collect_orphaned_media command
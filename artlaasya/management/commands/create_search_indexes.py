@@ -0,0 +1,76 @@
+"""artlaasya create_search_indexes command"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from optparse import make_option
+
+from artlaasya.models import Artist, Artwork
+
+
+
+# Columns the artwork admin search matches with `icontains`.
+SEARCH_INDEX_COLUMNS = (
+    (Artwork, ('title', 'inventory_name', 'internal_name')),
+    (Artist, ('last_name', 'first_name')),
+)
+
+
+def get_index_statements(connection):
+    """
+    Returns the SQL creating a trigram GIN index on `UPPER(column)` for each 
+    searched column, which is the expression PostgreSQL's `icontains` 
+    compares with `LIKE`.
+    """
+    _quote = connection.ops.quote_name
+    _statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+    for _model, _fields in SEARCH_INDEX_COLUMNS:
+        _table = _model._meta.db_table
+        for _field in _fields:
+            _column = _model._meta.get_field(_field).column
+            _statements.append(
+                "CREATE INDEX IF NOT EXISTS %s ON %s USING gin "
+                "(UPPER(%s::text) gin_trgm_ops)" % (
+                    _quote('%s_%s_trgm' % (_table, _column)),
+                    _quote(_table),
+                    _quote(_column)))
+    return _statements
+
+
+class Command(BaseCommand):
+    """
+    Creates the trigram indexes that let the artwork admin's substring 
+    search use an index instead of scanning the artwork and artist tables.
+
+    Requires PostgreSQL 9.5 or later with the `pg_trgm` extension available 
+    (it ships in contrib); creating the extension needs a role allowed to.  
+    Safe to run again.  Other databases fall back to table scans.
+    """
+    help = "Creates trigram indexes for the artwork admin search (PostgreSQL)."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--database',
+                    dest='database',
+                    default=DEFAULT_DB_ALIAS,
+                    help="Database to create the indexes in."),
+    )
+
+
+    def handle(self, *args, **options):
+        _connection = connections[options['database']]
+        if _connection.vendor != 'postgresql':
+            raise CommandError("Trigram indexes need PostgreSQL; '%s' is %s." % 
+                               (options['database'], _connection.vendor))
+        _statements = get_index_statements(_connection)
+        _cursor = _connection.cursor()
+        try:
+            for _statement in _statements:
+                _cursor.execute(_statement)
+        finally:
+            _cursor.close()
+        self.stdout.write("Created %d trigram index(es)." % 
+                          (len(_statements) - 1))
+# /Command
+
+
+#EOF - artlaasya create_search_indexes command
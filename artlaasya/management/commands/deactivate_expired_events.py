@@ -0,0 +1,22 @@
+"""artlaasya deactivate_expired_events command"""
+
+from django.core.management.base import BaseCommand
+
+from artlaasya.models import Event
+
+
+
+class Command(BaseCommand):
+    """
+    Deactivates every active event whose end date has passed, in a single 
+    UPDATE.  Intended to be run daily from cron or a similar scheduler.
+    """
+    help = "Deactivates active events whose end date has passed."
+
+    def handle(self, *args, **options):
+        _count = Event.events.deactivate_expired()
+        self.stdout.write("Deactivated %d expired event(s)." % _count)
+# /Command
+
+
+#EOF - artlaasya deactivate_expired_events command
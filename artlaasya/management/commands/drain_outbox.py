@@ -0,0 +1,72 @@
+"""artlaasya drain_outbox command"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+import time
+from optparse import make_option
+
+from artlaasya.outbox import OUTBOX_BATCH_SIZE, drain, purge
+
+
+
+class Command(BaseCommand):
+    """
+    Dispatches pending outbox events to their consumers in batches.
+
+    By default the outbox is drained once and the command exits, for running 
+    from cron.  With `--loop` it keeps draining, sleeping `--interval` 
+    seconds whenever the outbox is empty, as a long-running local worker.
+    """
+    help = "Dispatches pending catalogue change events to their consumers."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--loop',
+                    action='store_true',
+                    dest='loop',
+                    default=False,
+                    help="Keep draining until interrupted."),
+        make_option('--interval',
+                    type='float',
+                    dest='interval',
+                    default=5.0,
+                    help="Seconds to sleep when the outbox is empty."),
+        make_option('--batch-size',
+                    type='int',
+                    dest='batch_size',
+                    default=OUTBOX_BATCH_SIZE,
+                    help="Number of events dispatched per transaction."),
+        make_option('--purge-days',
+                    type='int',
+                    dest='purge_days',
+                    default=None,
+                    help="Also delete events processed more than this "
+                         "many days ago."),
+    )
+
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        if options['purge_days'] is not None:
+            self.stdout.write("Purged %d processed event(s)." % 
+                              purge(options['purge_days']))
+
+        _total = 0
+        try:
+            while True:
+                _count = drain(options['batch_size'])
+                _total += _count
+                if _count < options['batch_size']:
+                    if not options['loop']:
+                        break
+                    close_old_connections()
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("Dispatched %d event(s)." % _total)
+# /Command
+
+
+#EOF - artlaasya drain_outbox command
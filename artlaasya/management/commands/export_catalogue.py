@@ -0,0 +1,52 @@
+"""artlaasya export_catalogue command"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import six
+
+from optparse import make_option
+
+from artlaasya.exports import EXPORTS, CONTENT_TYPES, export
+
+
+
+class Command(BaseCommand):
+    """
+    Streams artists, artworks or events to a CSV or JSON file, or to 
+    standard output, without loading the catalogue into memory.
+    """
+    args = '<%s>' % '|'.join(sorted(EXPORTS))
+    help = "Exports artists, artworks or events as CSV or JSON."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format',
+                    dest='format',
+                    default='csv',
+                    help="Output format: csv (default) or json."),
+        make_option('--output',
+                    dest='output',
+                    default=None,
+                    help="File to write to.  Defaults to standard output."),
+    )
+
+
+    def handle(self, *args, **options):
+        if len(args) != 1 or args[0] not in EXPORTS:
+            raise CommandError("Specify one of: %s." % 
+                               ', '.join(sorted(EXPORTS)))
+        if options['format'] not in CONTENT_TYPES:
+            raise CommandError("Unknown format '%s'." % options['format'])
+
+        _chunks = export(args[0], options['format'])
+        if options['output']:
+            with open(options['output'], 'wb') as _output:
+                for _chunk in _chunks:
+                    if isinstance(_chunk, six.text_type):
+                        _chunk = _chunk.encode('utf-8')
+                    _output.write(_chunk)
+        else:
+            for _chunk in _chunks:
+                self.stdout.write(_chunk, ending='')
+# /Command
+
+
+#EOF - artlaasya export_catalogue command
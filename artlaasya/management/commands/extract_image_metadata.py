@@ -0,0 +1,55 @@
+"""artlaasya extract_image_metadata command"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from optparse import make_option
+
+from artlaasya.models import Artwork
+from artlaasya.imagemeta import METADATA_FIELDS, extract_image_metadata
+from artlaasya.utils import iterate_in_batches
+
+
+
+class Command(BaseCommand):
+    """
+    Extracts the image metadata of artworks uploaded before it was recorded 
+    on upload, or not yet analysed from the outbox, or of every artwork 
+    with `--all`.
+    
+    Each original is opened once and closed before the next, and artworks 
+    are loaded in batches, so memory use stays flat across the catalogue.
+    """
+    help = "Extracts and stores the image metadata of existing artworks."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--all',
+                    action='store_true',
+                    dest='all',
+                    default=False,
+                    help="Re-extract metadata already recorded."),
+    )
+
+
+    def handle(self, *args, **options):
+        _artworks = Artwork.artworks.exclude(Q(uploaded_image='') | 
+                                             Q(uploaded_image__isnull=True))
+        if not options['all']:
+            _artworks = _artworks.filter(Q(file_size__isnull=True) | 
+                                         Q(image_phash__isnull=True))
+
+        _count = 0
+        for _artwork in iterate_in_batches(_artworks):
+            try:
+                for _field, _value in extract_image_metadata(
+                                          _artwork.uploaded_image).items():
+                    setattr(_artwork, _field, _value)
+            finally:
+                _artwork.uploaded_image.close()
+            _artwork.save(update_fields=METADATA_FIELDS)
+            _count += 1
+        self.stdout.write("Extracted metadata of %d artwork(s)." % _count)
+# /Command
+
+
+#EOF - artlaasya extract_image_metadata command
@@ -0,0 +1,288 @@
+"""artlaasya prerender_gallery command"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import resolve, reverse, Resolver404
+from django.http import Http404
+from django.test import RequestFactory
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+import io
+import os
+import gzip
+import json
+import hashlib
+from optparse import make_option
+from multiprocessing import Pool
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from artlaasya.models import Artist, Genre, Artwork, Event
+from artlaasya.registry import genre_registry
+from artlaasya.utils import iterate_in_batches
+from artlaasya import urls as artlaasya_urls
+
+
+
+MANIFEST_NAME = '.prerender-manifest.json'
+
+LISTING_VARIANTS = ('all', 'new', 'contemporary', 'traditional')
+
+
+def get_output_path(output_dir, path):
+    _relative = path.strip('/')
+    return os.path.join(output_dir, _relative, 'index.html')
+
+
+def get_artist_path(path):
+    """
+    Returns the path of the artist page listing the artwork at `path`, or 
+    None if `path` is not an artwork page.
+    """
+    try:
+        _match = resolve(path)
+    except Resolver404:
+        return None
+    if _match.url_name != 'v_artwork':
+        return None
+    return reverse('v_artist', 
+                   kwargs={'artist_name': _match.kwargs['artist_name']})
+
+
+def render_page(args):
+    """
+    Renders `path` through its view and writes the HTML, gzip and (when
+    available) brotli variants under `output_dir`.  Runs in a worker process.
+    """
+    _output_dir, _path = args
+    try:
+        _match = resolve(_path)
+    except Resolver404:
+        try:
+            _path = _path + '/'
+            _match = resolve(_path)
+        except Resolver404:
+            return _path, 'unresolved'
+    _request = RequestFactory().get(_path)
+    try:
+        _response = _match.func(_request, *_match.args, **_match.kwargs)
+        if hasattr(_response, 'render'):
+            _response.render()
+    except Http404:
+        return _path, 404
+    except Exception as e:
+        return _path, repr(e)
+    if _response.status_code != 200:
+        return _path, _response.status_code
+
+    _content = _response.content
+    _target = get_output_path(_output_dir, _path)
+    if not os.path.isdir(os.path.dirname(_target)):
+        os.makedirs(os.path.dirname(_target))
+    with open(_target, 'wb') as _file:
+        _file.write(_content)
+    with gzip.open(_target + '.gz', 'wb', 9) as _file:
+        _file.write(_content)
+    if brotli is not None:
+        with open(_target + '.br', 'wb') as _file:
+            _file.write(brotli.compress(_content))
+    return _path, 200
+
+
+class Command(BaseCommand):
+    """
+    Pre-renders the public gallery to static, pre-compressed HTML files for a
+    front-end server to serve.
+
+    Every URL reachable from the sitemaps is rendered, along with the
+    listing pages, in parallel worker processes.  A manifest records the time
+    of each run, so later runs with `--incremental` re-render only the pages
+    of artists, artworks and events updated since, the artwork pages of 
+    updated artists, plus the listing pages if anything changed or was 
+    deleted, and remove the files of pages that no longer exist.
+    Genres carry no update time, so a change to any genre, which every page
+    may show, re-renders everything.  Pages that fail are retried on the 
+    next run.
+    """
+    help = "Pre-renders the public gallery pages to compressed static HTML."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--output',
+                    dest='output',
+                    default=None,
+                    help="Directory to write the rendered pages to."),
+        make_option('--workers',
+                    type='int',
+                    dest='workers',
+                    default=4,
+                    help="Number of worker processes."),
+        make_option('--incremental',
+                    action='store_true',
+                    dest='incremental',
+                    default=False,
+                    help="Only re-render pages changed since the last run."),
+    )
+
+
+    def handle(self, *args, **options):
+        _output_dir = options['output']
+        if not _output_dir:
+            raise CommandError("--output is required.")
+        if options['workers'] < 1:
+            raise CommandError("--workers must be positive.")
+
+        _started = timezone.now()
+        _manifest = self.read_manifest(_output_dir)
+        _genres = self.get_genres_digest()
+        _since = None
+        if (options['incremental'] and _manifest.get('rendered') and 
+            _manifest.get('genres') == _genres):
+            _since = parse_datetime(_manifest['rendered'])
+
+        _all_paths, _changed_paths = self.collect_paths(
+                                         _since, _manifest.get('paths', []))
+
+        # Worker processes must not share the parent's database connections.
+        for _connection in connections.all():
+            _connection.close()
+
+        _pool = Pool(options['workers'])
+        _failed = []
+        try:
+            for _path, _status in _pool.imap_unordered(
+                                    render_page,
+                                    [(_output_dir, _path)
+                                     for _path in sorted(_changed_paths)]):
+                if _status != 200:
+                    _failed.append(_path)
+                    self.stderr.write("%s: %s" % (_path, _status))
+        finally:
+            _pool.close()
+            _pool.join()
+
+        _removed = (set(_manifest.get('paths', [])) | 
+                    set(_manifest.get('failed', []))) - _all_paths
+        for _path in _removed:
+            self.remove_page(_output_dir, _path)
+
+        self.write_manifest(_output_dir, {'rendered': _started.isoformat(),
+                                          'genres': _genres,
+                                          'paths': sorted(_all_paths - 
+                                                          set(_failed)),
+                                          'failed': sorted(_failed)})
+        self.stdout.write("Rendered %d page(s), %d failed, %d removed." % (
+                          len(_changed_paths) - len(_failed),
+                          len(_failed),
+                          len(_removed)))
+
+
+    def get_genres_digest(self):
+        """
+        Returns a digest of every genre's fields, which changes whenever a 
+        genre is added, changed or deleted.
+        """
+        _digest = hashlib.md5()
+        for _row in Genre.genres.order_by('pk').values_list():
+            _digest.update(repr(_row).encode('utf-8'))
+        return _digest.hexdigest()
+
+
+    def get_listing_paths(self):
+        _paths = set([reverse('v_home'), reverse('v_events')])
+        for _variant in LISTING_VARIANTS:
+            _paths.add(reverse('v_artists-genre',
+                               kwargs={'artist_genre': _variant}))
+            _paths.add(reverse('v_artworks-genre',
+                               kwargs={'artwork_genre': _variant}))
+        for _genre in genre_registry.all():
+            _paths.add(reverse('v_learn',
+                               kwargs={'artwork_genre': _genre.slug}))
+        return _paths
+
+
+    def collect_paths(self, since=None, previous_paths=()):
+        """
+        Returns every page path, and the paths needing rendering: all of them
+        when `since` is None, otherwise those updated after it, the pages of
+        artists whose artworks were updated or deleted, the artwork pages of 
+        updated artists, and any page not rendered before.  A page in 
+        `previous_paths` that no longer exists counts as a catalogue change.
+        """
+        _all_paths = self.get_listing_paths()
+        _changed_paths = set()
+        _catalogue_changed = since is None
+
+        for _sitemap in artlaasya_urls.sitemaps.values():
+            _sitemap = _sitemap() if isinstance(_sitemap, type) else _sitemap
+            _items = _sitemap.items()
+            if hasattr(_items, 'model'):
+                _items = iterate_in_batches(_items)
+            for _item in _items:
+                _path = _sitemap.location(_item)
+                _all_paths.add(_path)
+                _lastmod = getattr(_item, 'updated', None)
+                if since is None or (_lastmod is not None and _lastmod > since):
+                    _changed_paths.add(_path)
+
+        if since is not None:
+            for _model in (Artist, Artwork, Event):
+                if _model._default_manager.filter(updated__gt=since).exists():
+                    _catalogue_changed = True
+                    break
+            for _artist_slug in Artwork.artworks.filter(updated__gt=since
+                                               ).order_by(
+                                               ).values_list('artist__slug',
+                                                             flat=True
+                                               ).distinct():
+                _changed_paths.add(reverse('v_artist',
+                                           kwargs={'artist_name': _artist_slug}))
+            # Artwork pages show their artist's name.
+            for _artwork in Artwork.artworks.filter(artist__updated__gt=since
+                                           ).for_listing(
+                                           ).iterator():
+                _changed_paths.add(_artwork.get_absolute_url())
+            for _path in set(previous_paths) - _all_paths:
+                _catalogue_changed = True
+                _artist_path = get_artist_path(_path)
+                if _artist_path is not None:
+                    _changed_paths.add(_artist_path)
+
+        if _catalogue_changed:
+            _changed_paths |= self.get_listing_paths()
+        _changed_paths |= (_all_paths - set(previous_paths))
+        return _all_paths, _changed_paths & _all_paths
+
+
+    def read_manifest(self, output_dir):
+        try:
+            with io.open(os.path.join(output_dir, MANIFEST_NAME),
+                         encoding='utf-8') as _file:
+                _manifest = json.load(_file)
+        except (IOError, OSError, ValueError):
+            _manifest = {}
+        return _manifest
+
+
+    def write_manifest(self, output_dir, manifest):
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        with io.open(os.path.join(output_dir, MANIFEST_NAME), 'w',
+                     encoding='utf-8') as _file:
+            _file.write(json.dumps(manifest, indent=1))
+
+
+    def remove_page(self, output_dir, path):
+        _target = get_output_path(output_dir, path)
+        for _name in (_target, _target + '.gz', _target + '.br'):
+            try:
+                os.remove(_name)
+            except OSError:
+                pass
+# /Command
+
+
+#EOF - artlaasya prerender_gallery command
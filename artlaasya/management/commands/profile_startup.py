@@ -0,0 +1,152 @@
+"""artlaasya profile_startup command"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+import os
+import sys
+import json
+import time
+import subprocess
+from optparse import make_option
+
+
+
+# Run in a fresh interpreter, so nothing is already imported.
+STARTUP_SCRIPT = '''
+import time
+_started = time.time()
+import django
+django.setup()
+_setup = time.time()
+from importlib import import_module
+from django.conf import settings
+import_module(settings.ROOT_URLCONF)
+print('%f %f' % (_setup - _started, time.time() - _setup))
+'''
+
+
+def median(values):
+    _values = sorted(values)
+    _middle = len(_values) // 2
+    if len(_values) % 2:
+        return _values[_middle]
+    return (_values[_middle - 1] + _values[_middle]) / 2.0
+
+
+def parse_import_times(output):
+    """
+    Returns `{module: (self seconds, cumulative seconds)}` from the report
+    `python -X importtime` writes to standard error.
+    """
+    _times = {}
+    for _line in output.splitlines():
+        if not _line.startswith('import time:'):
+            continue
+        _fields = _line[len('import time:'):].split('|')
+        try:
+            _self, _cumulative = int(_fields[0]), int(_fields[1])
+        except ValueError:
+            continue
+        _times[_fields[2].strip()] = (_self / 1e6, _cumulative / 1e6)
+    return _times
+
+
+class Command(BaseCommand):
+    """
+    Measures how long a new worker takes to set up Django, with this app's
+    `ready()`, and to import the URLconf, in fresh interpreters.
+
+    Reports the median of several runs and, on Python 3.7 and later, the
+    modules costing the most to import.  `--json` prints one record suitable
+    for tracking the cost from release to release, and `--append` adds it,
+    tagged with `--label`, to a JSON-lines history file.
+    """
+    help = "Measures app start-up and URLconf import time of a new worker."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--runs',
+                    type='int',
+                    dest='runs',
+                    default=5,
+                    help="Number of fresh interpreters to time."),
+        make_option('--top',
+                    type='int',
+                    dest='top',
+                    default=15,
+                    help="Number of slowest imports to list."),
+        make_option('--json',
+                    action='store_true',
+                    dest='json',
+                    default=False,
+                    help="Print the results as a JSON record."),
+        make_option('--append',
+                    dest='append',
+                    default=None,
+                    help="JSON-lines file to append the record to."),
+        make_option('--label',
+                    dest='label',
+                    default='',
+                    help="Release or revision the record is for."),
+    )
+
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("--runs must be positive.")
+
+        _command = [sys.executable]
+        _import_times = sys.version_info >= (3, 7)
+        if _import_times:
+            _command.extend(['-X', 'importtime'])
+        _command.extend(['-c', STARTUP_SCRIPT])
+        _environment = dict(os.environ,
+                            DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+
+        _setup_times = []
+        _urlconf_times = []
+        _modules = {}
+        for _run in range(options['runs']):
+            _process = subprocess.Popen(_command,
+                                        env=_environment,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE,
+                                        universal_newlines=True)
+            _output, _errors = _process.communicate()
+            if _process.returncode:
+                raise CommandError("Start-up failed:\n%s" % _errors)
+            _setup, _urlconf = _output.split()[-2:]
+            _setup_times.append(float(_setup))
+            _urlconf_times.append(float(_urlconf))
+            if _import_times:
+                _modules = parse_import_times(_errors)
+
+        _slowest = sorted(_modules.items(),
+                          key=lambda _item: _item[1][1],
+                          reverse=True)[:options['top']]
+        _record = {'label': options['label'],
+                   'recorded': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'python': sys.version.split()[0],
+                   'runs': options['runs'],
+                   'setup_seconds': median(_setup_times),
+                   'urlconf_seconds': median(_urlconf_times),
+                   'slowest_imports': [[_module, _cumulative]
+                                       for _module, (_self, _cumulative)
+                                       in _slowest]}
+
+        if options['append']:
+            with open(options['append'], 'a') as _history:
+                _history.write(json.dumps(_record, sort_keys=True) + '\n')
+        if options['json']:
+            self.stdout.write(json.dumps(_record, sort_keys=True))
+            return
+        self.stdout.write("django.setup(): %.3fs, URLconf: %.3fs "
+                          "(median of %d runs)" % (_record['setup_seconds'],
+                                                  _record['urlconf_seconds'],
+                                                  options['runs']))
+        for _module, _cumulative in _record['slowest_imports']:
+            self.stdout.write("  %8.3fs  %s" % (_cumulative, _module))
+# /Command
+
+
+#EOF - artlaasya profile_startup command
@@ -0,0 +1,24 @@
+"""artlaasya rebuild_recommendations command"""
+
+from django.core.management.base import BaseCommand
+
+from artlaasya.recommendations import rebuild_all
+
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the related-artwork neighbour table from scratch.  Saves keep 
+    it up to date incrementally; this is for first deployment or after 
+    changing the similarity weights.
+    """
+    help = "Recomputes related-artwork recommendations for every artwork."
+
+    def handle(self, *args, **options):
+        _count = rebuild_all()
+        self.stdout.write("Recomputed recommendations for %d artwork(s)." % 
+                          _count)
+# /Command
+
+
+#EOF - artlaasya rebuild_recommendations command
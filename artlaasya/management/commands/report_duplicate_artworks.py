@@ -0,0 +1,65 @@
+"""artlaasya report_duplicate_artworks command"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from optparse import make_option
+
+from artlaasya.models import Artwork
+from artlaasya.duplicates import DUPLICATE_MAX_DISTANCE, duplicate_index
+
+
+
+class Command(BaseCommand):
+    """
+    Reports groups of artworks whose uploaded images are the same or nearly 
+    the same scan, and the storage that removing all but the largest image 
+    of each group would recover.
+    
+    Artworks without a recorded image hash are not compared; run 
+    `extract_image_metadata` first to record them.
+    """
+    help = "Reports artworks with duplicate or near-duplicate images."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--distance',
+                    type='int',
+                    dest='distance',
+                    default=DUPLICATE_MAX_DISTANCE,
+                    help="Largest number of differing hash bits reported, "
+                         "at most DUPLICATE_MAX_DISTANCE."),
+    )
+
+
+    def handle(self, *args, **options):
+        if not 0 <= options['distance'] <= DUPLICATE_MAX_DISTANCE:
+            raise CommandError("--distance must be between 0 and the "
+                               "DUPLICATE_MAX_DISTANCE setting, %d." % 
+                               DUPLICATE_MAX_DISTANCE)
+
+        _groups = duplicate_index.find_groups(options['distance'])
+        _recoverable = 0
+        for _group in _groups:
+            _artworks = Artwork.artworks.select_related('artist'
+                                       ).in_bulk(_group)
+            _sizes = [_artworks[_pk].file_size or 0 for _pk in _group 
+                      if _pk in _artworks]
+            _recoverable += sum(_sizes) - max(_sizes or [0])
+            self.stdout.write("%d artworks:" % len(_group))
+            for _pk in _group:
+                if _pk not in _artworks:
+                    continue
+                _artwork = _artworks[_pk]
+                self.stdout.write("  %s  %s - %s  %sx%s  %s bytes" % (
+                                  _artwork.inventory_name, 
+                                  _artwork.artist, 
+                                  _artwork.title, 
+                                  _artwork.width, 
+                                  _artwork.height, 
+                                  _artwork.file_size))
+        self.stdout.write("%d group(s) of duplicates; about %d bytes of "
+                          "originals recoverable." % (len(_groups), 
+                                                      _recoverable))
+# /Command
+
+
+#EOF - artlaasya report_duplicate_artworks command
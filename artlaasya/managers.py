@@ -1,10 +1,14 @@
 """artlaasya managers"""
 
 from django.db import models
+from django.db.models import Q, Prefetch
 from django.utils import timezone
+from django.conf import settings
 
-from datetime import timedelta
+import calendar
+from datetime import date, timedelta
 
+from artlaasya.registry import CONTEMPORARY_GENRE_NAME, genre_registry
 
 
 class ArtistQuerySet(models.QuerySet):
@@ -26,6 +30,23 @@ class ArtistQuerySet(models.QuerySet):
     
     def distinctly(self):
         return self.distinct('last_name', 'first_name')
+    
+    def detailed(self):
+        """
+        Loads, in one query each, every artist's active artworks with genres 
+        joined as `active_artworks`, and upcoming active events as 
+        `upcoming_events`.
+        """
+        # Imported here; models imports this module.
+        from artlaasya.models import Artwork, Event
+        return self.prefetch_related(
+                   Prefetch('artworks_authored', 
+                            queryset=Artwork.artworks.active(
+                                                    ).select_related('genre'), 
+                            to_attr='active_artworks'), 
+                   Prefetch('events_presented', 
+                            queryset=Event.events.active().upcoming(), 
+                            to_attr='upcoming_events'))
 # /ArtistQuerySet
 
 
@@ -48,16 +69,19 @@ class ArtistManager(models.Manager):
     
     def distinctly(self):
         return self.get_queryset().distinctly()
+    
+    def detailed(self):
+        return self.get_queryset().detailed()
 # /ArtistManager
 
 
 class GenreQuerySet(models.QuerySet):
     
     def contemporary(self):
-        return self.filter(name="Contemporary")
+        return self.filter(name=CONTEMPORARY_GENRE_NAME)
     
     def traditional(self):
-        return self.exclude(name="Contemporary")
+        return self.exclude(name=CONTEMPORARY_GENRE_NAME)
 # /GenreQuerySet
 
 
@@ -73,6 +97,16 @@ class GenreManager(models.Manager):
         return self.get_queryset().traditional()
 # /GenreManager
 
+
+# (slug, lowest price, highest price); None leaves a band open-ended.
+PRICE_BANDS = getattr(settings, 'ARTWORK_PRICE_BANDS', (
+    ('under-1000', None, 999),
+    ('1000-4999', 1000, 4999),
+    ('5000-9999', 5000, 9999),
+    ('10000-24999', 10000, 24999),
+    ('25000-and-over', 25000, None),
+))
+
     
 class ArtworkQuerySet(models.QuerySet):
     
@@ -91,14 +125,54 @@ class ArtworkQuerySet(models.QuerySet):
     def orderly(self):
         return self.order_by('artist__last_name', 'artist__first_name')
     
+    def for_listing(self):
+        return self.select_related('artist')
+    
     def distinctly(self):
         return self.distinct('artist__last_name', 'artist__first_name')
     
     def contemporary(self):
-        return self.filter(genre__name="Contemporary")
+        return self.filter(genre_id__in=genre_registry.contemporary_ids())
     
     def traditional(self):
-        return self.exclude(genre__name="Contemporary")
+        # Excludes rather than filters, like the join on the genre name did, 
+        # so genres not yet in this process's registry are still included.
+        return self.exclude(genre_id__in=genre_registry.contemporary_ids())
+    
+    def price_displayed(self):
+        return self.filter(is_price_displayed=True)
+    
+    def price_between(self, minimum=None, maximum=None):
+        """
+        Artworks with a displayed price within the inclusive range.  Artworks 
+        whose price is hidden are never included.
+        """
+        _queryset = self.price_displayed()
+        if minimum is not None:
+            _queryset = _queryset.filter(price__gte=minimum)
+        if maximum is not None:
+            _queryset = _queryset.filter(price__lte=maximum)
+        return _queryset
+    
+    def price_band(self, band):
+        for _slug, _minimum, _maximum in PRICE_BANDS:
+            if _slug == band:
+                return self.price_between(_minimum, _maximum)
+        return self.none()
+    
+    def by_price(self, descending=False):
+        if descending:
+            return self.order_by('-price', '-pk')
+        return self.order_by('price', 'pk')
+    
+    def price_after(self, price, pk, descending=False):
+        """
+        Keyset pagination for `by_price()`: artworks ordered after the one 
+        with the given `price` and `pk`.
+        """
+        if descending:
+            return self.filter(Q(price__lt=price) | Q(price=price, pk__lt=pk))
+        return self.filter(Q(price__gt=price) | Q(price=price, pk__gt=pk))
 # /ArtworkQuerySet
 
 
@@ -119,6 +193,9 @@ class ArtworkManager(models.Manager):
     def orderly(self):
         return self.get_queryset().orderly()
     
+    def for_listing(self):
+        return self.get_queryset().for_listing()
+    
     def distinctly(self):
         return self.get_queryset().distinctly()
     
@@ -127,6 +204,21 @@ class ArtworkManager(models.Manager):
     
     def traditional(self):
         return self.get_queryset().traditional()
+    
+    def price_displayed(self):
+        return self.get_queryset().price_displayed()
+    
+    def price_between(self, minimum=None, maximum=None):
+        return self.get_queryset().price_between(minimum, maximum)
+    
+    def price_band(self, band):
+        return self.get_queryset().price_band(band)
+    
+    def by_price(self, descending=False):
+        return self.get_queryset().by_price(descending)
+    
+    def price_after(self, price, pk, descending=False):
+        return self.get_queryset().price_after(price, pk, descending)
 # /ArtworkManager
 
 
@@ -134,6 +226,46 @@ class EventQuerySet(models.QuerySet):
     
     def active(self):
         return self.filter(is_active=True)
+    
+    def upcoming(self):
+        return self.filter(start_date__gt=date.today()
+                  ).order_by('start_date')
+    
+    def ongoing(self):
+        _today = date.today()
+        return self.filter(start_date__lte=_today,
+                           end_date__gte=_today)
+    
+    def past(self):
+        return self.filter(end_date__lt=date.today())
+    
+    def in_month(self, year, month):
+        _first = date(year, month, 1)
+        _last = date(year, month, calendar.monthrange(year, month)[1])
+        return self.filter(start_date__lte=_last,
+                           end_date__gte=_first)
+    
+    def expired(self):
+        return self.active().past()
+    
+    def deactivate_expired(self):
+        """
+        Deactivates the expired events with one UPDATE, recorded in the 
+        outbox and announced like the `bulk` actions, and returns how many.
+        """
+        from artlaasya.utils import atomic
+        from artlaasya.bulk import announce
+        with atomic():
+            _pks = list(self.expired().select_for_update(
+                                     ).values_list('pk', flat=True))
+            if not _pks:
+                return 0
+            _count = self.model._default_manager.filter(pk__in=_pks,
+                                                        is_active=True
+                                               ).update(is_active=False,
+                                                        updated=timezone.now())
+            announce(self.model, _pks, ['is_active'])
+        return _count
 # /EventQuerySet
 
 
@@ -144,6 +276,24 @@ class EventManager(models.Manager):
     
     def active(self):
         return self.get_queryset().active()
+    
+    def upcoming(self):
+        return self.get_queryset().upcoming()
+    
+    def ongoing(self):
+        return self.get_queryset().ongoing()
+    
+    def past(self):
+        return self.get_queryset().past()
+    
+    def in_month(self, year, month):
+        return self.get_queryset().in_month(year, month)
+    
+    def expired(self):
+        return self.get_queryset().expired()
+    
+    def deactivate_expired(self):
+        return self.get_queryset().deactivate_expired()
 # /EventManager
 
 
@@ -2,7 +2,7 @@
 
 from django.db import models
 from django.conf import settings
-from django.core.urlresolvers import reverse
+from django.utils import six
 
 import os
 import string
@@ -12,9 +12,50 @@ import deepzoom.models as deepzoom_models
 
 import artlaasya.managers as artlaasya_managers
 from artlaasya.mixins import ModelDiffMixin
+from artlaasya.urlbuilder import build_url
+from artlaasya.utils import atomic
+from artlaasya.caching import get_previous_surrogate_keys
 
 
 
+class OutboxMixin(object):
+    """
+    Writes an `OutboxEvent` in the same transaction as each save, so a 
+    change is recorded if and only if it commits.  Deletes, including those 
+    cascaded from another object, are recorded by a `pre_delete` receiver 
+    in `artlaasya.signals`.
+    
+    Must come before `ModelDiffMixin` in the bases, since the changed fields 
+    and the pages the object is moving off are read before the save resets 
+    them.  Saves that change nothing are not recorded.
+    """
+    
+    def save(self, *args, **kwargs):
+        _adding = self._state.adding
+        _fields = set(self.changed_fields)
+        if kwargs.get('update_fields') is not None:
+            # Fields hidden from the diff, such as the image analysis, are 
+            # recorded whenever they are saved by name.
+            _fields.update(_field.name for _field in self._meta.fields 
+                           if not _field.editable)
+            _fields &= set(kwargs['update_fields'])
+        _previous_keys = ([] if _adding else 
+                          get_previous_surrogate_keys(self, _fields))
+        with atomic(using=kwargs.get('using')):
+            super(OutboxMixin, self).save(*args, **kwargs)
+            if _adding:
+                OutboxEvent.record(self, OutboxEvent.CREATE)
+            elif _fields:
+                OutboxEvent.record(self, OutboxEvent.UPDATE, _fields, 
+                                   previous_keys=_previous_keys)
+    
+    
+    def delete(self, *args, **kwargs):
+        with atomic(using=kwargs.get('using')):
+            super(OutboxMixin, self).delete(*args, **kwargs)
+# /OutboxMixin
+
+
 class ArtistRatchet(models.Model):
     """
     Provides a numerical suffix for appending to an `Artist` slug so that 
@@ -42,11 +83,12 @@ class ArtistRatchet(models.Model):
 # /ArtistRatchet
 
 
-class Artist(ModelDiffMixin, models.Model):
+class Artist(OutboxMixin, ModelDiffMixin, models.Model):
     """
     Represents an artist.
     
-    Composed with `ModelDiffMixin` mixin which tracks field changes.
+    Composed with `ModelDiffMixin` mixin which tracks field changes, and 
+    `OutboxMixin` mixin which records saves and deletes in the outbox.
     
     Uses `ArtistManager` manager class which provides friendlier manager name 
     and a set of common querysets for artists.
@@ -99,8 +141,8 @@ class Artist(ModelDiffMixin, models.Model):
     
     
     def get_absolute_url(self):
-        return reverse('v_artist',
-                       kwargs={'artist_name': self.slug})
+        return build_url('v_artist',
+                         artist_name=self.slug)
     
     
     def __unicode__(self):
@@ -112,11 +154,12 @@ class Artist(ModelDiffMixin, models.Model):
 # /Artist
 
 
-class Genre(ModelDiffMixin, models.Model):
+class Genre(OutboxMixin, ModelDiffMixin, models.Model):
     """
     Represents an artwork genre.
     
-    Composed with `ModelDiffMixin` mixin which tracks field changes.
+    Composed with `ModelDiffMixin` mixin which tracks field changes, and 
+    `OutboxMixin` mixin which records saves and deletes in the outbox.
     """
     class Meta:
         app_label = settings.APP_LABEL
@@ -179,11 +222,12 @@ class ArtworkRatchet(models.Model):
 # /ArtworkRatchet
 
 
-class Artwork(deepzoom_models.UploadedImage):
+class Artwork(OutboxMixin, deepzoom_models.UploadedImage):
     """
     Represents an artwork.
     
-    Composed with `ModelDiffMixin` mixin which tracks field changes.
+    Composed with `ModelDiffMixin` mixin which tracks field changes, and 
+    `OutboxMixin` mixin which records saves and deletes in the outbox.
     
     Uses `ArtworkManager` manager class which provides friendlier manager name 
     and a set of common querysets for artworks.
@@ -199,6 +243,7 @@ class Artwork(deepzoom_models.UploadedImage):
         app_label = settings.APP_LABEL
         get_latest_by = 'created'
         ordering = ['artist__last_name', 'artist__first_name', 'name', 'title']
+        index_together = [['is_active', 'is_price_displayed', 'price']]
     
     artworks = artlaasya_managers.ArtworkManager()
     
@@ -218,6 +263,7 @@ class Artwork(deepzoom_models.UploadedImage):
     
     STATUS_CHOICES = (
         ('AVAL', 'Available'),
+        ('HOLD', 'On hold'),
         ('SOLD', 'Sold'),
     )
     
@@ -332,13 +378,60 @@ class Artwork(deepzoom_models.UploadedImage):
     
     status = models.CharField(max_length=4,
                               choices=STATUS_CHOICES,
-                              default='AVAL')
+                              default='AVAL',
+                              db_index=True,
+                              help_text="Changed through the inventory \
+                              actions.")
+    
+    file_size = models.BigIntegerField(blank=True,
+                                       null=True,
+                                       editable=False,
+                                       help_text="Bytes. (system-extracted)")
+    
+    image_format = models.CharField(max_length=10,
+                                    blank=True,
+                                    editable=False,
+                                    db_index=True,
+                                    help_text="(system-extracted)")
+    
+    color_mode = models.CharField(max_length=10,
+                                  blank=True,
+                                  editable=False,
+                                  db_index=True,
+                                  help_text="(system-extracted)")
+    
+    color_profile = models.CharField(max_length=100,
+                                     blank=True,
+                                     editable=False,
+                                     help_text="(system-extracted)")
+    
+    dominant_colors = models.CharField(max_length=80,
+                                       blank=True,
+                                       editable=False,
+                                       help_text="Comma separated hex \
+                                       colours, most dominant first. \
+                                       (system-extracted)")
+    
+    palette = models.BinaryField(blank=True,
+                                 null=True,
+                                 editable=False)
+    
+    image_phash = models.BigIntegerField(blank=True,
+                                         null=True,
+                                         editable=False,
+                                         db_index=True,
+                                         help_text="Perceptual hash. \
+                                         (system-extracted)")
     
     
     def get_absolute_url(self):
-        return reverse('v_artwork',
-                       kwargs={'artist_name': self.artist.slug,
-                               'artwork_title': self.slug})
+        """
+        Uses the related artist's slug, so querysets rendered as lists should 
+        use `for_listing()` to load artists in the same query.
+        """
+        return build_url('v_artwork',
+                         artist_name=self.artist.slug,
+                         artwork_title=self.slug)
     
     
     def __unicode__(self):
@@ -350,6 +443,103 @@ class Artwork(deepzoom_models.UploadedImage):
 # /Artwork
 
 
+class SaleLedgerEntry(models.Model):
+    """
+    Records one change of an artwork's sale status.
+    
+    Entries are written by `artlaasya.inventory` alongside each status 
+    transition and are append-only; they cannot be changed or deleted once 
+    saved.  The inventory name and price are copied so the ledger survives 
+    the artwork itself being deleted.
+    """
+    class Meta:
+        app_label = settings.APP_LABEL
+        get_latest_by = 'created'
+        ordering = ['-created']
+        verbose_name_plural = 'sale ledger entries'
+    
+    entries = models.Manager()
+    
+    
+    artwork = models.ForeignKey(Artwork,
+                                related_name='ledger_entries',
+                                blank=True,
+                                null=True,
+                                on_delete=models.SET_NULL)
+    
+    inventory_name = models.CharField(max_length=100)
+    
+    from_status = models.CharField(max_length=4,
+                                   choices=Artwork.STATUS_CHOICES)
+    
+    to_status = models.CharField(max_length=4,
+                                 choices=Artwork.STATUS_CHOICES)
+    
+    price = models.PositiveIntegerField(blank=True,
+                                        null=True)
+    
+    staff = models.ForeignKey(settings.AUTH_USER_MODEL,
+                              related_name='+',
+                              blank=True,
+                              null=True,
+                              on_delete=models.SET_NULL)
+    
+    note = models.CharField(max_length=255,
+                            blank=True)
+    
+    created = models.DateTimeField(auto_now_add=True,
+                                   editable=False)
+    
+    
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Sale ledger entries are append-only.")
+        super(SaleLedgerEntry, self).save(*args, **kwargs)
+    
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError("Sale ledger entries are append-only.")
+    
+    
+    def __unicode__(self):
+        return six.u('%s: %s -> %s') % (self.inventory_name, 
+                                        self.from_status, 
+                                        self.to_status)
+    
+    
+    def __str__(self):
+        return '%s: %s -> %s' % (self.inventory_name, 
+                                 self.from_status, 
+                                 self.to_status)
+# /SaleLedgerEntry
+
+
+class ArtworkNeighbour(models.Model):
+    """
+    Stores one precomputed recommendation: an artwork similar to `artwork`.
+    
+    Maintained by `artlaasya.recommendations`, which keeps the top scoring 
+    neighbours for each active artwork.
+    """
+    class Meta:
+        app_label = settings.APP_LABEL
+        ordering = ['artwork', '-score']
+        unique_together = [['artwork', 'neighbour']]
+        index_together = [['artwork', 'score']]
+    
+    neighbours = models.Manager()
+    
+    
+    artwork = models.ForeignKey(Artwork,
+                                related_name='neighbours')
+    
+    neighbour = models.ForeignKey(Artwork,
+                                  related_name='+')
+    
+    score = models.FloatField()
+# /ArtworkNeighbour
+
+
 class EventRatchet(models.Model):
     """
     Provides a numerical suffix for appending to an Event slug so that 
@@ -377,11 +567,12 @@ class EventRatchet(models.Model):
 # /EventRatchet
 
 
-class Event(ModelDiffMixin, models.Model):
+class Event(OutboxMixin, ModelDiffMixin, models.Model):
     """
     Represents a gallery event.
     
-    Composed with `ModelDiffMixin` mixin which tracks field changes.
+    Composed with `ModelDiffMixin` mixin which tracks field changes, and 
+    `OutboxMixin` mixin which records saves and deletes in the outbox.
     
     Uses `EventManager` manager class which provides friendlier manager name 
     and a set of common querysets for events.
@@ -396,6 +587,8 @@ class Event(ModelDiffMixin, models.Model):
         app_label = settings.APP_LABEL
         get_latest_by = 'created'
         ordering = ['-start_date']
+        index_together = [['is_active', 'start_date'],
+                          ['is_active', 'end_date']]
     
     events = artlaasya_managers.EventManager()
     
@@ -436,6 +629,10 @@ class Event(ModelDiffMixin, models.Model):
                                               null=True,
                                               help_text="Total seats allotted.")
     
+    seats_reserved = models.PositiveIntegerField(default=0,
+                                                 editable=False,
+                                                 help_text="(system-calculated)")
+    
     is_admission = models.BooleanField(default=False)
     
     admission_price = models.PositiveIntegerField(blank=True,
@@ -444,9 +641,11 @@ class Event(ModelDiffMixin, models.Model):
                                                   admission is charged.")
     
     start_date = models.DateField(default=date.today(),
+                                  db_index=True,
                                   help_text="Set to date of event.")
     
     end_date = models.DateField(default=date.today(),
+                                db_index=True,
                                 help_text="Set to start date if one-day event.")
     
     time = models.CharField(max_length=20,
@@ -467,8 +666,19 @@ class Event(ModelDiffMixin, models.Model):
    
     
     def get_absolute_url(self):
-        return reverse('v_events', kwargs={
-                       'event_title': self.slug})
+        return build_url('v_event',
+                         event_title=self.slug)
+    
+    
+    @property
+    def seats_remaining(self):
+        """
+        Returns the number of unreserved seats, or None if seating is not 
+        limited.
+        """
+        if self.total_seats is None:
+            return None
+        return max(self.total_seats - self.seats_reserved, 0)
 
     
     def __unicode__(self):
@@ -480,4 +690,154 @@ class Event(ModelDiffMixin, models.Model):
 # /Event
 
 
+class Reservation(models.Model):
+    """
+    Represents a seat reservation for an event.
+    
+    Reservations are created and cancelled through `artlaasya.reservations`, 
+    which keeps `Event.seats_reserved` in step using conditional updates so 
+    that concurrent reservations can never oversell an event.
+    
+    Only one reservation is allowed per email address per event.
+    """
+    class Meta:
+        app_label = settings.APP_LABEL
+        get_latest_by = 'created'
+        ordering = ['-created']
+        unique_together = [['event', 'email']]
+    
+    reservations = models.Manager()
+    
+    
+    event = models.ForeignKey(Event,
+                              related_name='reservations')
+    
+    name = models.CharField(max_length=61,
+                            blank=True,
+                            help_text="Max 61 characters.")
+    
+    email = models.EmailField(max_length=254)
+    
+    seats = models.PositiveIntegerField(default=1)
+    
+    created = models.DateTimeField(auto_now_add=True,
+                                   editable=False)
+    
+    
+    def __unicode__(self):
+        return six.u('%s (%s)') % (self.email, self.event)
+    
+    
+    def __str__(self):
+        return '%s (%s)' % (self.email, self.event)
+# /Reservation
+
+
+class OutboxEvent(models.Model):
+    """
+    Records one committed change to an artist, genre, artwork or event.
+    
+    Rows are written by `OutboxMixin` and `artlaasya.bulk` inside the 
+    transaction making the change, and are dispatched to the registered 
+    consumers by `artlaasya.outbox.drain`, which retries failed events with 
+    a growing delay until `processed` is set.
+    """
+    class Meta:
+        app_label = settings.APP_LABEL
+        get_latest_by = 'created'
+        ordering = ['pk']
+        index_together = [['processed', 'next_attempt']]
+    
+    outbox = models.Manager()
+    
+    
+    CREATE = 'C'
+    UPDATE = 'U'
+    DELETE = 'D'
+    
+    ACTION_CHOICES = (
+        (CREATE, 'Create'), 
+        (UPDATE, 'Update'), 
+        (DELETE, 'Delete'), 
+    )
+    
+    
+    model_label = models.CharField(max_length=30)
+    
+    object_pk = models.PositiveIntegerField()
+    
+    action = models.CharField(max_length=1,
+                              choices=ACTION_CHOICES)
+    
+    fields = models.TextField(blank=True,
+                              help_text="Comma separated names of the fields "
+                                        "changed by an update.")
+    
+    surrogate_keys = models.TextField(blank=True,
+                                      help_text="Comma separated surrogate "
+                                                "keys of the pages that "
+                                                "showed the object before "
+                                                "the change.")
+    
+    created = models.DateTimeField(auto_now_add=True,
+                                   editable=False)
+    
+    next_attempt = models.DateTimeField(auto_now_add=True)
+    
+    attempts = models.PositiveIntegerField(default=0)
+    
+    last_error = models.TextField(blank=True)
+    
+    processed = models.DateTimeField(blank=True,
+                                     null=True)
+    
+    
+    @classmethod
+    def record(cls, instance, action, fields=(), pk=None, previous_keys=()):
+        return cls.outbox.create(model_label=instance._meta.model_name,
+                                 object_pk=instance.pk if pk is None else pk,
+                                 action=action,
+                                 fields=','.join(sorted(fields)),
+                                 surrogate_keys=','.join(sorted(set(
+                                                             previous_keys))))
+    
+    
+    @classmethod
+    def record_many(cls, model, pks, action, fields=(), previous_keys=()):
+        """
+        Records the same change to many rows of `model` in one insert.
+        """
+        _fields = ','.join(sorted(fields))
+        _keys = ','.join(sorted(set(previous_keys)))
+        return cls.outbox.bulk_create([cls(model_label=model._meta.model_name,
+                                           object_pk=_pk,
+                                           action=action,
+                                           fields=_fields,
+                                           surrogate_keys=_keys) 
+                                       for _pk in pks])
+    
+    
+    @property
+    def changed_fields(self):
+        return self.fields.split(',') if self.fields else []
+    
+    
+    @property
+    def previous_keys(self):
+        return self.surrogate_keys.split(',') if self.surrogate_keys else []
+    
+    
+    def __unicode__(self):
+        return six.u('%s %s %s') % (self.get_action_display(), 
+                                    self.model_label, 
+                                    self.object_pk)
+    
+    
+    def __str__(self):
+        return '%s %s %s' % (self.get_action_display(), 
+                             self.model_label, 
+                             self.object_pk)
+# /OutboxEvent
+
+
 #EOF - artlaasya models
@@ -0,0 +1,133 @@
+"""artlaasya outbox"""
+
+from django.conf import settings
+from django.utils import timezone
+
+import traceback
+from datetime import timedelta
+
+from artlaasya.utils import atomic
+from artlaasya.models import OutboxEvent
+
+
+
+OUTBOX_BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 100)
+
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+
+# Seconds before the first retry; doubled after every further failure.
+OUTBOX_RETRY_DELAY = getattr(settings, 'OUTBOX_RETRY_DELAY', 30)
+
+OUTBOX_RETRY_DELAY_MAX = getattr(settings, 'OUTBOX_RETRY_DELAY_MAX', 3600)
+
+# Seconds a claimed batch is left to its worker before other workers may 
+# claim it again; should exceed the longest time a batch takes.
+OUTBOX_CLAIM_TIMEOUT = getattr(settings, 'OUTBOX_CLAIM_TIMEOUT', 600)
+
+_consumers = []
+
+
+def register_consumer(model_labels=None):
+    """
+    Decorator registering `func(events)` to receive each drained batch of
+    outbox events, restricted to the events of `model_labels` (e.g.
+    `['artwork']`) if given.
+
+    A consumer that raises has its events retried, along with the other
+    consumers of those events, so consumers must be idempotent.
+    """
+    def decorator(func):
+        _consumers.append((func, frozenset(model_labels)
+                                 if model_labels is not None else None))
+        return func
+    return decorator
+
+
+def get_retry_delay(attempts):
+    return timedelta(seconds=min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1),
+                                 OUTBOX_RETRY_DELAY_MAX))
+
+
+def claim(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Claims up to `batch_size` due outbox events, oldest first, and returns 
+    them.
+
+    The rows are locked only while their `next_attempt` is pushed 
+    `OUTBOX_CLAIM_TIMEOUT` seconds ahead, and the claim is committed at 
+    once, so other workers pass over the batch without waiting on it.  
+    Events of a worker that dies are claimed again once the timeout passes.
+    """
+    _now = timezone.now()
+    with atomic():
+        _events = list(OutboxEvent.outbox.select_for_update(
+                                         ).filter(processed__isnull=True,
+                                                  next_attempt__lte=_now
+                                         ).order_by('pk')[:batch_size])
+        if _events:
+            OutboxEvent.outbox.filter(pk__in=[_event.pk for _event in _events]
+                             ).update(next_attempt=_now + timedelta(
+                                                   seconds=OUTBOX_CLAIM_TIMEOUT))
+    return _events
+
+
+def drain(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Claims one batch of due outbox events, dispatches it and returns the 
+    number of events in it.
+
+    Consumers run outside the claim's transaction, each in its own, so a 
+    slow consumer holds no locks on the outbox.  An event whose consumer 
+    fails is retried after a growing delay; after `OUTBOX_MAX_ATTEMPTS` 
+    failures it is given up on, marked processed with its `last_error` kept.
+    """
+    _events = claim(batch_size)
+    if not _events:
+        return 0
+
+    _errors = {}
+    for _func, _labels in _consumers:
+        _batch = [_event for _event in _events
+                  if _labels is None or _event.model_label in _labels]
+        if not _batch:
+            continue
+        try:
+            with atomic():
+                _func(_batch)
+        except Exception:
+            _error = traceback.format_exc()
+            for _event in _batch:
+                _errors[_event.pk] = _error
+
+    _now = timezone.now()
+    with atomic():
+        OutboxEvent.outbox.filter(pk__in=[_event.pk for _event in _events
+                                          if _event.pk not in _errors]
+                         ).update(processed=_now, last_error='')
+        for _event in _events:
+            if _event.pk in _errors:
+                _event.attempts += 1
+                _event.last_error = _errors[_event.pk]
+                if _event.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    _event.processed = _now
+                else:
+                    _event.next_attempt = _now + get_retry_delay(_event.attempts)
+                _event.save(update_fields=['attempts', 'last_error',
+                                           'processed', 'next_attempt'])
+    return len(_events)
+
+
+def purge(days):
+    """
+    Deletes events processed more than `days` days ago, except those given
+    up on.
+    """
+    _events = OutboxEvent.outbox.filter(
+                  processed__lt=timezone.now() - timedelta(days=days),
+                  last_error='')
+    _count = _events.count()
+    _events.delete()
+    return _count
+
+
+#EOF - artlaasya outbox
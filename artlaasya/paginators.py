@@ -0,0 +1,50 @@
+"""artlaasya paginators"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that, for an unfiltered queryset on PostgreSQL, takes the row 
+    count from the planner's statistics instead of running `COUNT(*)`, which 
+    must scan the whole table.
+    
+    Small tables, filtered querysets and other databases are counted 
+    exactly.
+    """
+    ESTIMATE_THRESHOLD = 10000
+    
+    def _get_estimated_count(self):
+        if getattr(self, '_estimated_count', None) is None:
+            _estimate = self._get_table_estimate()
+            if _estimate is not None and _estimate > self.ESTIMATE_THRESHOLD:
+                self._estimated_count = _estimate
+            else:
+                try:
+                    self._estimated_count = self.object_list.count()
+                except (AttributeError, TypeError):
+                    self._estimated_count = len(self.object_list)
+        return self._estimated_count
+    count = property(_get_estimated_count)
+    
+    def _get_table_estimate(self):
+        _query = getattr(self.object_list, 'query', None)
+        if _query is None or _query.where:
+            return None
+        _connection = connections[self.object_list.db]
+        if _connection.vendor != 'postgresql':
+            return None
+        _cursor = _connection.cursor()
+        try:
+            _cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s",
+                            [self.object_list.model._meta.db_table])
+            _row = _cursor.fetchone()
+        finally:
+            _cursor.close()
+        return int(_row[0]) if _row else None
+# /EstimatedCountPaginator
+
+
+#EOF - artlaasya paginators
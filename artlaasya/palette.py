@@ -0,0 +1,156 @@
+"""artlaasya palette"""
+
+from django.conf import settings
+
+from artlaasya.registry import SharedIndex
+
+
+
+# CIELAB distance within which a palette colour counts towards a match; 
+# around 2 is barely noticeable, beyond 50 colours are unrelated.
+PALETTE_TOLERANCE = getattr(settings, 'PALETTE_TOLERANCE', 25.0)
+
+PALETTE_RESULTS = getattr(settings, 'PALETTE_RESULTS', 500)
+
+PALETTE_INDEX_VERSION_KEY = getattr(settings, 'PALETTE_INDEX_VERSION_KEY',
+                                    'artlaasya:palette_index:version')
+
+# sRGB (D65) to CIE XYZ, and the D65 reference white.
+SRGB_TO_XYZ = ((0.4124, 0.3576, 0.1805),
+               (0.2126, 0.7152, 0.0722),
+               (0.0193, 0.1192, 0.9505))
+
+D65_WHITE = (0.95047, 1.0, 1.08883)
+
+
+def pack_palette(colors):
+    """
+    Packs `[(share, (r, g, b))]` into four bytes per colour: red, green, 
+    blue and the share of the image scaled to 0-255.
+    """
+    _data = bytearray()
+    for _share, (_red, _green, _blue) in colors:
+        _data.extend([_red, _green, _blue, 
+                      max(0, min(255, int(round(_share * 255))))])
+    return bytes(_data)
+
+
+def unpack_palette(data):
+    _data = bytearray(data or b'')
+    return [(_data[_index + 3] / 255.0, 
+             (_data[_index], _data[_index + 1], _data[_index + 2]))
+            for _index in range(0, len(_data) - 3, 4)]
+
+
+def parse_color(value):
+    """
+    Returns `(r, g, b)` for a '#rrggbb' or '#rgb' colour, or None.
+    """
+    _value = (value or '').strip().lstrip('#')
+    if len(_value) == 3:
+        _value = ''.join(_digit * 2 for _digit in _value)
+    if len(_value) != 6:
+        return None
+    try:
+        return tuple(int(_value[_index:_index + 2], 16) 
+                     for _index in (0, 2, 4))
+    except ValueError:
+        return None
+
+
+def rgb_to_lab(colors):
+    """
+    Converts a sequence of 0-255 sRGB colours to an (n, 3) array of CIELAB 
+    colours, in which Euclidean distance follows perceived difference.
+    """
+    import numpy
+    
+    _rgb = numpy.asarray(colors, dtype=numpy.float64).reshape(-1, 3) / 255.0
+    _linear = numpy.where(_rgb > 0.04045, 
+                          ((_rgb + 0.055) / 1.055) ** 2.4, 
+                          _rgb / 12.92)
+    _xyz = _linear.dot(numpy.array(SRGB_TO_XYZ).T) / numpy.array(D65_WHITE)
+    _f = numpy.where(_xyz > 0.008856, 
+                     _xyz ** (1.0 / 3), 
+                     7.787 * _xyz + 16.0 / 116)
+    return numpy.column_stack([116 * _f[:, 1] - 16, 
+                               500 * (_f[:, 0] - _f[:, 1]), 
+                               200 * (_f[:, 1] - _f[:, 2])
+                              ]).astype(numpy.float32)
+
+
+class PaletteIndex(SharedIndex):
+    """
+    Process-local index of the palettes of every listed artwork.
+    
+    All palette colours of the catalogue are held in one CIELAB array, 
+    with parallel arrays of each colour's share of its image and owning 
+    artwork, so a colour search is a handful of vectorized NumPy operations 
+    over the whole catalogue rather than a query.
+    
+    The index is invalidated by an outbox consumer after artwork and 
+    artist changes, in every process through its shared version, and 
+    rebuilt lazily on the next search.  NumPy is imported on first use.
+    """
+
+    version_key = PALETTE_INDEX_VERSION_KEY
+
+    def _load(self):
+        import numpy
+        from artlaasya.models import Artwork
+
+        _pks = []
+        _colors = []
+        _shares = []
+        _owners = []
+        for _pk, _palette in Artwork.artworks.active(
+                                    ).filter(artist__is_active=True, 
+                                             palette__isnull=False
+                                    ).order_by(
+                                    ).values_list('pk', 'palette'
+                                    ).iterator():
+            _entries = unpack_palette(_palette)
+            if not _entries:
+                continue
+            for _share, _rgb in _entries:
+                _colors.append(_rgb)
+                _shares.append(_share)
+                _owners.append(len(_pks))
+            _pks.append(_pk)
+
+        return {'pks': numpy.array(_pks, dtype=numpy.int64),
+                'colors': rgb_to_lab(_colors),
+                'shares': numpy.array(_shares, dtype=numpy.float32),
+                'owners': numpy.array(_owners, dtype=numpy.int64)}
+
+
+    def search(self, rgb, tolerance=PALETTE_TOLERANCE, limit=PALETTE_RESULTS):
+        """
+        Returns the primary keys of up to `limit` artworks with a palette 
+        colour within `tolerance` of `rgb`, best match first.
+        
+        Each palette colour scores its share of the image, scaled down 
+        linearly with its distance from `rgb`; an artwork scores the sum.
+        """
+        import numpy
+        
+        _state = self._get_state()
+        if not len(_state['pks']):
+            return []
+        _target = rgb_to_lab([rgb])[0]
+        _distances = numpy.sqrt(((_state['colors'] - _target) ** 2).sum(axis=1))
+        _closeness = numpy.clip(1.0 - _distances / tolerance, 0.0, None)
+        _scores = numpy.bincount(_state['owners'], 
+                                 weights=_closeness * _state['shares'], 
+                                 minlength=len(_state['pks']))
+        _matched = numpy.flatnonzero(_scores > 0)
+        _best = _matched[numpy.argsort(-_scores[_matched], 
+                                       kind='mergesort')][:limit]
+        return [int(_pk) for _pk in _state['pks'][_best]]
+# /PaletteIndex
+
+
+palette_index = PaletteIndex()
+
+
+#EOF - artlaasya palette
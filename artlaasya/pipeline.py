@@ -0,0 +1,85 @@
+"""artlaasya pipeline"""
+
+import threading
+from time import time
+
+
+
+# Returned by a handler to stop the rest of the pipeline from running.
+STOP = object()
+
+
+class SavePipeline(object):
+    """
+    Runs the handlers for one model's save signal in registration order.
+
+    The model's field diff is computed once per save and handed to every
+    handler as `changed_fields`, instead of each handler recomputing it.
+    Handlers declare the fields they read; on a save restricted with
+    `update_fields` a handler is skipped unless one of its fields is being
+    saved.  A handler may return `STOP` to end the pipeline early.
+
+    Calls, skips and cumulative run time are recorded per handler in
+    `timings`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.handlers = []
+        self.timings = {}
+        self._lock = threading.Lock()
+
+
+    def register(self, fields=None):
+        """
+        Decorator adding a handler `func(instance, changed_fields, **kwargs)`;
+        the keyword arguments include the signal's and `update_fields`.
+        `fields` lists the fields the handler depends on; None means it
+        always runs.
+        """
+        def decorator(func):
+            self.handlers.append((func, frozenset(fields)
+                                        if fields is not None else None))
+            self.timings[func.__name__] = {'calls': 0,
+                                           'skipped': 0,
+                                           'seconds': 0.0}
+            return func
+        return decorator
+
+
+    def _record(self, handler_name, seconds=None):
+        with self._lock:
+            _timing = self.timings[handler_name]
+            if seconds is None:
+                _timing['skipped'] += 1
+            else:
+                _timing['calls'] += 1
+                _timing['seconds'] += seconds
+
+
+    def run(self, instance, update_fields=None, **kwargs):
+        _update_fields = (frozenset(update_fields)
+                          if update_fields is not None else None)
+        _changed_fields = frozenset(instance.changed_fields)
+
+        for _func, _fields in self.handlers:
+            if (_update_fields is not None and _fields is not None and
+                not (_fields & _update_fields)):
+                self._record(_func.__name__)
+                continue
+            _started = time()
+            _result = _func(instance, _changed_fields, 
+                            update_fields=_update_fields, **kwargs)
+            self._record(_func.__name__, time() - _started)
+            if _result is STOP:
+                break
+
+
+    def reset_timings(self):
+        with self._lock:
+            for _timing in self.timings.values():
+                _timing.update(calls=0, skipped=0, seconds=0.0)
+# /SavePipeline
+
+
+#EOF - artlaasya pipeline
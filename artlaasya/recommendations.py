@@ -0,0 +1,260 @@
+"""artlaasya recommendations"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Count
+
+import re
+import heapq
+from bisect import bisect
+
+from artlaasya.models import Artwork, ArtworkNeighbour
+from artlaasya.managers import PRICE_BANDS
+
+
+
+RECOMMENDATIONS_COUNT = getattr(settings, 'RECOMMENDATIONS_COUNT', 8)
+
+WEIGHTS = {
+    'genre': 0.30,
+    'style': 0.20,
+    'medium': 0.25,
+    'size': 0.10,
+    'price': 0.15,
+}
+
+# Upper bounds, in square centimetres, of all but the largest size band.
+SIZE_BANDS = (900, 2500, 6400, 14400)
+
+PRICE_BAND_FLOORS = [_band[1] or 0 for _band in PRICE_BANDS][1:]
+
+MEDIUM_STOPWORDS = frozenset(['on', 'and', 'with', 'of', 'the', 'in'])
+
+FEATURE_FIELDS = ('pk',
+                  'genre_id',
+                  'style_class',
+                  'medium_description',
+                  'height_metric',
+                  'width_metric',
+                  'price')
+
+
+def tokenize_medium(medium_description):
+    return frozenset(re.findall(r'[a-z]+', medium_description.lower())
+                     ) - MEDIUM_STOPWORDS
+
+
+def get_size_band(height_metric, width_metric):
+    if height_metric is None or width_metric is None:
+        return None
+    return bisect(SIZE_BANDS, height_metric * width_metric)
+
+
+def get_price_band(price):
+    if price is None:
+        return None
+    return bisect(PRICE_BAND_FLOORS, price)
+
+
+def get_features(row):
+    """
+    Reduces a `FEATURE_FIELDS` row to the tuple compared by `similarity()`.
+    """
+    (_pk, _genre_id, _style_class, _medium_description, 
+     _height_metric, _width_metric, _price) = row
+    return (_genre_id,
+            _style_class,
+            tokenize_medium(_medium_description),
+            get_size_band(_height_metric, _width_metric),
+            get_price_band(_price))
+
+
+def band_closeness(band1, band2, band_count):
+    if band1 is None or band2 is None:
+        return 0.0
+    return 1.0 - float(abs(band1 - band2)) / band_count
+
+
+def similarity(features1, features2):
+    """
+    Returns a score between 0 and 1 for how alike two artworks are.
+    """
+    _genre1, _style1, _medium1, _size1, _price1 = features1
+    _genre2, _style2, _medium2, _size2, _price2 = features2
+    
+    _score = 0.0
+    if _genre1 == _genre2:
+        _score += WEIGHTS['genre']
+    if _style1 == _style2:
+        _score += WEIGHTS['style']
+    if _medium1 and _medium2:
+        _score += WEIGHTS['medium'] * (float(len(_medium1 & _medium2)) / 
+                                       len(_medium1 | _medium2))
+    _score += WEIGHTS['size'] * band_closeness(_size1, _size2, 
+                                               len(SIZE_BANDS) + 1)
+    _score += WEIGHTS['price'] * band_closeness(_price1, _price2, 
+                                                len(PRICE_BAND_FLOORS) + 1)
+    return _score
+
+
+def load_features():
+    """
+    Returns `{pk: features}` for every artwork that may be recommended.
+    """
+    _rows = Artwork.artworks.active().filter(artist__is_active=True
+                                    ).order_by(
+                                    ).values_list(*FEATURE_FIELDS)
+    return dict((_row[0], get_features(_row)) for _row in _rows.iterator())
+
+
+def get_top_neighbours(pk, features, count=RECOMMENDATIONS_COUNT):
+    """
+    Returns `[(score, neighbour_pk)]` for the `count` artworks most similar 
+    to `pk`.
+    """
+    _features = features[pk]
+    return heapq.nlargest(count, 
+                          ((similarity(_features, _other_features), _other_pk) 
+                           for _other_pk, _other_features in features.items() 
+                           if _other_pk != pk))
+
+
+def build_rows(pk, features):
+    return [ArtworkNeighbour(artwork_id=pk, neighbour_id=_neighbour_pk, 
+                             score=_score)
+            for _score, _neighbour_pk in get_top_neighbours(pk, features)]
+
+
+def rebuild_all():
+    """
+    Recomputes the neighbours of every artwork.
+    """
+    _features = load_features()
+    with transaction.atomic():
+        ArtworkNeighbour.neighbours.all().delete()
+        _rows = []
+        for _pk in _features:
+            _rows.extend(build_rows(_pk, _features))
+            if len(_rows) >= 1000:
+                ArtworkNeighbour.neighbours.bulk_create(_rows)
+                _rows = []
+        ArtworkNeighbour.neighbours.bulk_create(_rows)
+    return len(_features)
+
+
+def refresh_artworks(pks, features=None):
+    """
+    Incrementally brings the neighbour table up to date after the artworks 
+    in `pks` were saved, or their artist's status changed.
+    
+    The artworks' own lists, and the lists that held any of them, are 
+    recomputed.  Every other list gains an artwork only if it now beats 
+    that list's weakest neighbours, which are then dropped.  The cost grows 
+    with the number of changed artworks, never with the square of the 
+    catalogue.  Pass `features` from `load_features` to reuse them.
+    """
+    _changed = set(pks)
+    if not _changed:
+        return
+    _features = load_features() if features is None else features
+    _count = RECOMMENDATIONS_COUNT
+    _present = [_pk for _pk in _changed if _pk in _features]
+    
+    with transaction.atomic():
+        _affected = set(ArtworkNeighbour.neighbours.filter(
+                                         neighbour_id__in=_changed
+                                         ).values_list('artwork_id', 
+                                                       flat=True))
+        _rebuilt = _affected | _changed
+        ArtworkNeighbour.neighbours.filter(artwork_id__in=_rebuilt).delete()
+        
+        _rows = []
+        for _pk in _rebuilt:
+            if _pk in _features:
+                _rows.extend(build_rows(_pk, _features))
+        
+        _candidates = {}
+        if _present:
+            _stats = dict((_row['artwork_id'], (_row['count'], _row['lowest']))
+                          for _row in ArtworkNeighbour.neighbours.order_by(
+                                                   ).values('artwork_id'
+                                                   ).annotate(count=Count('pk'),
+                                                              lowest=Min('score')))
+            for _other_pk, _other_features in _features.items():
+                if _other_pk in _rebuilt:
+                    continue
+                _other_count, _lowest = _stats.get(_other_pk, (0, None))
+                for _pk in _present:
+                    _score = similarity(_other_features, _features[_pk])
+                    if _other_count < _count or _score > _lowest:
+                        _candidates.setdefault(_other_pk, []
+                                               ).append((_score, _pk))
+        
+        if _candidates:
+            _current = {}
+            for _artwork_id, _row_pk, _neighbour_id, _score in (
+                    ArtworkNeighbour.neighbours.filter(
+                                     artwork_id__in=list(_candidates)
+                                     ).values_list('artwork_id', 'pk', 
+                                                   'neighbour_id', 'score')):
+                _current.setdefault(_artwork_id, []
+                                    ).append((_score, _neighbour_id, _row_pk))
+            _dropped = []
+            for _other_pk, _scored in _candidates.items():
+                _kept = heapq.nlargest(_count, 
+                                       _current.get(_other_pk, []) + 
+                                       [(_score, _pk, None) 
+                                        for _score, _pk in _scored])
+                _kept_row_pks = set(_row_pk for _score, _pk, _row_pk in _kept)
+                _dropped.extend(_row_pk 
+                                for _score, _pk, _row_pk 
+                                in _current.get(_other_pk, []) 
+                                if _row_pk not in _kept_row_pks)
+                _rows.extend(ArtworkNeighbour(artwork_id=_other_pk, 
+                                              neighbour_id=_pk, 
+                                              score=_score)
+                             for _score, _pk, _row_pk in _kept 
+                             if _row_pk is None)
+            ArtworkNeighbour.neighbours.filter(pk__in=_dropped).delete()
+        
+        ArtworkNeighbour.neighbours.bulk_create(_rows)
+
+
+def refresh_artwork(pk, features=None):
+    """
+    Brings the neighbour table up to date after artwork `pk` was saved.
+    """
+    refresh_artworks([pk], features)
+
+
+def refresh_lists(pks):
+    """
+    Recomputes the neighbours of each artwork in `pks`, e.g. after one of 
+    their neighbours was deleted.
+    """
+    _features = load_features()
+    with transaction.atomic():
+        ArtworkNeighbour.neighbours.filter(artwork_id__in=pks).delete()
+        _rows = []
+        for _pk in pks:
+            if _pk in _features:
+                _rows.extend(build_rows(_pk, _features))
+        ArtworkNeighbour.neighbours.bulk_create(_rows)
+
+
+def get_recommendations(artwork, count=RECOMMENDATIONS_COUNT):
+    """
+    Returns the recommended artworks for `artwork`, with artists joined, in 
+    one query.
+    """
+    return [_row.neighbour 
+            for _row in ArtworkNeighbour.neighbours.filter(
+                                         artwork=artwork,
+                                         neighbour__is_active=True,
+                                         neighbour__artist__is_active=True
+                                         ).select_related('neighbour', 
+                                                          'neighbour__artist'
+                                         ).order_by('-score')[:count]]
+
+
+#EOF - artlaasya recommendations
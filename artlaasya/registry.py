@@ -0,0 +1,217 @@
+"""artlaasya registry"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+import time
+import threading
+
+
+
+CONTEMPORARY_GENRE_NAME = getattr(settings, 'CONTEMPORARY_GENRE_NAME',
+                                  "Contemporary")
+
+GENRE_REGISTRY_VERSION_KEY = getattr(settings, 'GENRE_REGISTRY_VERSION_KEY',
+                                     'artlaasya:genre_registry:version')
+
+# Seconds between checks of a shared version; 0 checks on every lookup.
+INDEX_CHECK_INTERVAL = getattr(settings, 'INDEX_CHECK_INTERVAL', 1)
+
+GENRE_REGISTRY_CHECK_INTERVAL = getattr(settings, 
+                                        'GENRE_REGISTRY_CHECK_INTERVAL', 
+                                        INDEX_CHECK_INTERVAL)
+
+
+class SharedVersion(object):
+    """
+    Version number kept in the shared cache, by which a process-local index 
+    learns that another process changed what it holds.
+
+    The first version is taken from the clock, so a version evicted from 
+    the cache is never reissued.
+    """
+
+    def __init__(self, key, check_interval=INDEX_CHECK_INTERVAL):
+        self.key = key
+        self.check_interval = check_interval
+        self._checked = 0
+
+
+    def get(self):
+        _version = cache.get(self.key)
+        if _version is None:
+            cache.add(self.key, int(time.time() * 1000), None)
+            _version = cache.get(self.key)
+        return _version
+
+
+    def bump(self):
+        """
+        Advances the version and returns the new one, or None if it had 
+        been evicted and was started afresh.
+        """
+        try:
+            return cache.incr(self.key)
+        except ValueError:
+            cache.set(self.key, int(time.time() * 1000), None)
+            return None
+
+
+    def has_changed(self, version):
+        """
+        Returns True if the shared version is no longer `version`; the cache 
+        is read at most once per `check_interval`.
+        """
+        _now = time.time()
+        if _now - self._checked < self.check_interval:
+            return False
+        self._checked = _now
+        return self.get() != version
+# /SharedVersion
+
+
+class SharedIndex(object):
+    """
+    Base of the process-local indexes that are loaded whole on first use.
+
+    `invalidate` discards the index in this process and bumps its shared 
+    version, so every other process reloads it on its next lookup after at 
+    most `check_interval` seconds.  Subclasses give `version_key` and 
+    implement `_load`.
+    """
+
+    version_key = None
+    check_interval = INDEX_CHECK_INTERVAL
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = SharedVersion(self.version_key, self.check_interval)
+        self._loaded = None
+
+
+    def _load(self):
+        raise NotImplementedError
+
+
+    def _get_state(self):
+        _loaded = self._loaded
+        if _loaded is not None and self._version.has_changed(_loaded[0]):
+            self._loaded = _loaded = None
+        if _loaded is None:
+            with self._lock:
+                _loaded = self._loaded
+                if _loaded is None:
+                    # The version is read first, so a change committed 
+                    # during the load is not mistaken as included in it.
+                    _version = self._version.get()
+                    _loaded = self._loaded = (_version, self._load())
+        return _loaded[1]
+
+
+    def invalidate(self):
+        """
+        Discards the index in this and every other process; the next 
+        lookup reloads it.
+        """
+        with self._lock:
+            self._loaded = None
+        self._version.bump()
+# /SharedIndex
+
+
+class GenreRegistry(SharedIndex):
+    """
+    Process-local registry of genres.
+
+    The genre table is tiny and changes rarely, so it is loaded once per
+    process and kept in memory.  Lookups by slug or name, and the split of
+    genres into contemporary and traditional, are then answered without
+    touching the database, which lets artwork querysets filter on
+    `genre_id__in` instead of joining to `Genre`.
+
+    The registry is invalidated by the `Genre` save and delete signals, and
+    reloads itself lazily on the next lookup.  Invalidation also bumps a
+    version kept in the shared cache, which every process compares with
+    its own at most once per `GENRE_REGISTRY_CHECK_INTERVAL`, so genres
+    changed in one worker are reloaded by the others.
+    """
+
+    version_key = GENRE_REGISTRY_VERSION_KEY
+    check_interval = GENRE_REGISTRY_CHECK_INTERVAL
+
+    def _load(self):
+        from artlaasya.models import Genre
+
+        _by_slug = {}
+        _by_name = {}
+        _contemporary_ids = []
+        _traditional_ids = []
+        for _genre in Genre.genres.all():
+            _by_slug[_genre.slug] = _genre
+            _by_name[_genre.name] = _genre
+            if _genre.name == CONTEMPORARY_GENRE_NAME:
+                _contemporary_ids.append(_genre.pk)
+            else:
+                _traditional_ids.append(_genre.pk)
+
+        return {'by_slug': _by_slug,
+                'by_name': _by_name,
+                'contemporary_ids': tuple(_contemporary_ids),
+                'traditional_ids': tuple(_traditional_ids)}
+
+
+    def get_by_slug(self, slug):
+        """
+        Returns the `Genre` with the given slug, or None.
+        """
+        return self._get_state()['by_slug'].get(slug)
+
+
+    def get_by_name(self, name):
+        """
+        Returns the `Genre` with the given name, or None.
+        """
+        return self._get_state()['by_name'].get(name)
+
+
+    def is_contemporary(self, genre_id):
+        return genre_id in self._get_state()['contemporary_ids']
+
+
+    def contemporary_ids(self):
+        """
+        Returns a tuple of the primary keys of contemporary genres.
+        """
+        return self._get_state()['contemporary_ids']
+
+
+    def traditional_ids(self):
+        """
+        Returns a tuple of the primary keys of traditional genres.
+        """
+        return self._get_state()['traditional_ids']
+
+
+    def all(self):
+        """
+        Returns every genre ordered by name.
+        """
+        return sorted(self._get_state()['by_slug'].values(),
+                      key=lambda _genre: _genre.name)
+
+
+    def traditional(self):
+        """
+        Returns the traditional genres ordered by name.
+        """
+        _state = self._get_state()
+        return sorted((_genre for _genre in _state['by_slug'].values()
+                       if _genre.pk in _state['traditional_ids']),
+                      key=lambda _genre: _genre.name)
+# /GenreRegistry
+
+
+genre_registry = GenreRegistry()
+
+
+#EOF - artlaasya registry
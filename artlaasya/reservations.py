@@ -0,0 +1,102 @@
+"""artlaasya reservations"""
+
+from django.db import transaction, IntegrityError
+from django.db.models import F, Q
+
+from artlaasya.models import Event, Reservation
+from artlaasya.utils import atomic, on_commit
+from artlaasya.caching import purge_surrogate_keys
+
+
+
+class ReservationError(Exception):
+    """
+    Base class for reservation failures.
+    """
+# /ReservationError
+
+
+class SeatsUnavailable(ReservationError):
+    """
+    Raised when an event does not have enough unreserved seats, or is no 
+    longer active.
+    """
+# /SeatsUnavailable
+
+
+class AlreadyReserved(ReservationError):
+    """
+    Raised when the email address already holds a reservation for the event.
+    """
+# /AlreadyReserved
+
+
+def reserve_seats(event, email, seats=1, name=''):
+    """
+    Reserves `seats` seats at `event` for `email` and returns the new 
+    `Reservation`.
+    
+    The seat count is claimed with a single conditional UPDATE, which only 
+    succeeds while enough seats remain, so any number of concurrent callers 
+    can never reserve more than `total_seats`.  The reservation row is 
+    written in the same transaction and the claim is rolled back if it 
+    cannot be.  The event's page, which shows the seats left, is purged 
+    once the reservation commits.
+    """
+    if seats < 1:
+        raise ValueError("At least one seat must be reserved.")
+    
+    _email = email.strip().lower()
+    
+    with atomic():
+        _claimed = Event.events.active().filter(
+                           Q(total_seats__isnull=True) |
+                           Q(seats_reserved__lte=F('total_seats') - seats),
+                           pk=event.pk
+                           ).update(seats_reserved=F('seats_reserved') + seats)
+        if not _claimed:
+            raise SeatsUnavailable("Not enough seats remain for this event.")
+        
+        try:
+            with transaction.atomic():
+                _reservation = Reservation.reservations.create(event_id=event.pk,
+                                                               email=_email,
+                                                               name=name,
+                                                               seats=seats)
+        except IntegrityError:
+            raise AlreadyReserved("This email address already holds a "
+                                  "reservation for this event.")
+        
+        _keys = ['event-%s' % event.slug]
+        on_commit(lambda: purge_surrogate_keys(_keys))
+    
+    return _reservation
+
+
+def cancel_reservation(reservation):
+    """
+    Cancels `reservation` and returns its seats to the event.
+    
+    Cancelling a reservation that no longer exists does nothing.  The 
+    event's page is purged once the cancellation commits.
+    """
+    with atomic():
+        try:
+            _reservation = Reservation.reservations.select_for_update(
+                                                 ).get(pk=reservation.pk)
+        except Reservation.DoesNotExist:
+            return
+        
+        Event.events.filter(pk=_reservation.event_id,
+                            seats_reserved__gte=_reservation.seats
+                            ).update(seats_reserved=F('seats_reserved') - 
+                                                    _reservation.seats)
+        _reservation.delete()
+        
+        _keys = ['event-%s' % _slug 
+                 for _slug in Event.events.filter(pk=_reservation.event_id
+                                         ).values_list('slug', flat=True)]
+        on_commit(lambda: purge_surrogate_keys(_keys))
+
+
+#EOF - artlaasya reservations
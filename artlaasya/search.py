@@ -0,0 +1,214 @@
+"""artlaasya search"""
+
+from django.conf import settings
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+
+import re
+
+from artlaasya.models import Artist, Artwork
+from artlaasya.palette import palette_index
+
+
+
+# Fields searched, most important first, with the weight a term found in the
+# field adds to a result's score.  The last field is never tested for
+# ranking; a term not found in the others must have matched there.
+ARTWORK_SEARCH_WEIGHTS = (
+    ('title', 16),
+    ('artist__first_name', 8),
+    ('artist__last_name', 8),
+    ('genre__name', 4),
+    ('medium_description', 2),
+    ('description', 1),
+)
+
+ARTIST_SEARCH_WEIGHTS = (
+    ('last_name', 2),
+    ('first_name', 1),
+)
+
+SNIPPET_LENGTH = 160
+
+
+def normalize_query(query_string,
+                    findterms=re.compile(r'"([^"]+)"|(\S+)').findall,
+                    normspace=re.compile(r'\s{2,}').sub):
+    terms = [normspace(' ', (t[0] or t[1]).strip()) for t in findterms(query_string)]
+    return [term for term in terms if term]
+# /normalize_query
+
+
+def get_query(query_string, search_fields):
+    """
+    Compound query compiler.  Every term must be found in at least one of the
+    fields.
+    """
+    query = None # Query to search for every search term
+    terms = normalize_query(query_string)
+    for term in terms:
+        or_query = None # Query to search for a given term in each field
+        for field_name in search_fields:
+            q = Q(**{"%s__icontains" % field_name: term})
+            if or_query is None:
+                or_query = q
+            else:
+                or_query = or_query | q
+        if query is None:
+            query = or_query
+        else:
+            query = query & or_query
+    return query
+# /get_query
+
+
+def get_score(terms, search_weights):
+    """
+    Returns an expression scoring a row, where each term scores the weight 
+    of the most important field containing it.
+    """
+    _score = None
+    for _term in terms:
+        _term_score = Case(*[When(then=Value(_weight), 
+                                  **{"%s__icontains" % _field: _term})
+                             for _field, _weight in search_weights[:-1]],
+                           default=Value(search_weights[-1][1]),
+                           output_field=IntegerField())
+        _score = _term_score if _score is None else _score + _term_score
+    return _score
+
+
+def rank(queryset, terms, search_weights):
+    """
+    Returns the primary keys of `queryset` ordered by descending score.
+
+    The score is computed and sorted on by the database, so every match is 
+    ranked and only the rows of the requested page are fetched.  Ties keep 
+    the queryset's own order.
+    """
+    _ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return queryset.annotate(search_score=get_score(terms, search_weights)
+                  ).order_by('-search_score', *_ordering
+                  ).values_list('pk', flat=True)
+
+
+def highlight(text, terms, length=None):
+    """
+    Returns `text` escaped, with every occurrence of `terms` wrapped in
+    `<mark>`.  If `length` is given the text is cut to a window of about
+    that many characters around the first match.
+    """
+    if not text:
+        return ''
+    _pattern = re.compile('|'.join(re.escape(_term) for _term in terms),
+                          re.IGNORECASE)
+
+    if length and len(text) > length:
+        _first = _pattern.search(text)
+        _start = max((_first.start() if _first else 0) - length // 4, 0)
+        _end = _start + length
+        text = ''.join(['...' if _start else '',
+                        text[_start:_end],
+                        '...' if _end < len(text) else ''])
+
+    _parts = []
+    _position = 0
+    for _match in _pattern.finditer(text):
+        _parts.append(escape(text[_position:_match.start()]))
+        _parts.append('<mark>%s</mark>' % escape(_match.group(0)))
+        _position = _match.end()
+    _parts.append(escape(text[_position:]))
+    return mark_safe(''.join(_parts))
+
+
+def get_page(items, page_number, per_page):
+    _paginator = Paginator(items, per_page)
+    try:
+        return _paginator.page(page_number)
+    except PageNotAnInteger:
+        return _paginator.page(1)
+    except EmptyPage:
+        return _paginator.page(_paginator.num_pages)
+
+
+def load_page(page):
+    """
+    Replaces the primary keys on `page` with their artworks, artists and
+    genres joined, in one query.
+    """
+    _pks = list(page.object_list)
+    _loaded = Artwork.artworks.select_related('artist', 'genre').in_bulk(_pks)
+    page.object_list = [_loaded[_pk] for _pk in _pks if _pk in _loaded]
+    return page
+
+
+def search_artworks(query_string, page_number=1, per_page=24, color=None):
+    """
+    Returns a page of active artworks matching `query_string`, ranked by
+    field weight, and limited to those with `color`, an `(r, g, b)`, in
+    their palette if given.
+
+    Only the artworks on the page are loaded in full, and only they are given
+    the highlighted `search_title` and `search_snippet` attributes.
+    """
+    _terms = normalize_query(query_string)
+    if not _terms:
+        return get_page([], page_number, per_page)
+    _fields = [_field for _field, _weight in ARTWORK_SEARCH_WEIGHTS]
+    _artworks = Artwork.artworks.filter(get_query(query_string, _fields)
+                               ).active().orderly()
+    if color is not None:
+        _artworks = _artworks.filter(pk__in=palette_index.search(color))
+
+    _page = load_page(get_page(rank(_artworks, _terms, ARTWORK_SEARCH_WEIGHTS),
+                               page_number, per_page))
+
+    _pattern = re.compile('|'.join(re.escape(_term) for _term in _terms),
+                          re.IGNORECASE)
+    for _artwork in _page.object_list:
+        _artwork.search_title = highlight(_artwork.title, _terms)
+        if _pattern.search(_artwork.description or ''):
+            _artwork.search_snippet = highlight(_artwork.description, _terms,
+                                                SNIPPET_LENGTH)
+        else:
+            _artwork.search_snippet = highlight(_artwork.medium_description,
+                                                _terms)
+    return _page
+
+
+def search_artworks_by_color(color, page_number=1, per_page=24):
+    """
+    Returns a page of listed artworks with `color`, an `(r, g, b)`, in their
+    palette, closest and most prominent first.
+    """
+    _page = load_page(get_page(palette_index.search(color),
+                               page_number, per_page))
+    for _artwork in _page.object_list:
+        _artwork.search_title = escape(_artwork.title)
+        _artwork.search_snippet = escape(_artwork.medium_description)
+    return _page
+
+
+def search_artists(query_string):
+    """
+    Returns the active artists matching `query_string`, ranked by field
+    weight, each with a highlighted `search_name`.
+    """
+    _terms = normalize_query(query_string)
+    if not _terms:
+        return []
+    _fields = [_field for _field, _weight in ARTIST_SEARCH_WEIGHTS]
+    _artists = Artist.artists.filter(get_query(query_string, _fields)
+                            ).active().orderly()
+
+    _ranked = list(rank(_artists, _terms, ARTIST_SEARCH_WEIGHTS))
+    _loaded = Artist.artists.in_bulk(_ranked)
+    _found = [_loaded[_pk] for _pk in _ranked if _pk in _loaded]
+    for _artist in _found:
+        _artist.search_name = highlight(_artist.__str__(), _terms)
+    return _found
+
+
+#EOF - artlaasya search
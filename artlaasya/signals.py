@@ -1,7 +1,10 @@
 '''artlaasya signals'''
 
-from django.dispatch import receiver
-from django.db.models.signals import pre_save, post_save, pre_delete
+from django.dispatch import receiver, Signal
+from django.core.urlresolvers import reverse
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.core.signals import (request_started, request_finished, 
+                                 got_request_exception)
 
 try:
     from django.utils.text import slugify
@@ -15,29 +18,112 @@ except:
 
 from decimal import Decimal
 
-from artlaasya.utils import is_django_version_greater_than, delete_uploaded_file
+from artlaasya.utils import (is_django_version_greater_than, 
+                             on_commit, 
+                             begin_deferring_on_commit, 
+                             run_deferred_on_commit, 
+                             discard_deferred_on_commit)
+from artlaasya.files import file_lifecycle
+from artlaasya.registry import genre_registry
+from artlaasya.typeahead import typeahead_index
+from artlaasya.pipeline import SavePipeline
+from artlaasya.outbox import register_consumer
+from artlaasya.homegrid import (HOME_GRID_ARTWORK_FIELDS, 
+                                HOME_GRID_ARTIST_FIELDS, 
+                                HOME_GRID_GENRE_FIELDS, 
+                                invalidate_home_grid)
+from artlaasya.caching import get_surrogate_keys, purge_surrogate_keys
+from artlaasya.imagemeta import extract_image_metadata, analyse_artwork_image
+from artlaasya.palette import palette_index
+from artlaasya.duplicates import duplicate_index
+from artlaasya import recommendations
 
 from artlaasya.models import (Artist,
                               ArtistRatchet,
                               Genre,
                               Artwork,
                               ArtworkRatchet,
+                              ArtworkNeighbour,
                               Event,
-                              EventRatchet)
+                              EventRatchet,
+                              OutboxEvent)
 
 
 
 DJANGO_SAVE_UPDATEABLE = is_django_version_greater_than(1, 4)
 
+# Sent once by `artlaasya.bulk` after a set-based update that bypassed the 
+# per-object save signals.
+catalogue_bulk_changed = Signal(providing_args=['pks', 'fields'])
 
-@receiver(pre_save, sender=Artist)
-def slugify__artist(sender, instance, slugify=slugify, **kwargs):
+# One pipeline per model and signal; handlers run in the order registered.
+artist_pre_save = SavePipeline('artist pre_save')
+artist_post_save = SavePipeline('artist post_save')
+genre_pre_save = SavePipeline('genre pre_save')
+genre_post_save = SavePipeline('genre post_save')
+artwork_pre_save = SavePipeline('artwork pre_save')
+artwork_post_save = SavePipeline('artwork post_save')
+event_pre_save = SavePipeline('event pre_save')
+event_post_save = SavePipeline('event post_save')
+
+PIPELINES = (artist_pre_save,
+             artist_post_save,
+             genre_pre_save,
+             genre_post_save,
+             artwork_pre_save,
+             artwork_post_save,
+             event_pre_save,
+             event_post_save)
+
+
+@receiver(pre_save, sender=Artist, dispatch_uid="p__a_pre")
+def run__artist_pre_save(sender, instance, update_fields=None, **kwargs):
+    artist_pre_save.run(instance, update_fields, **kwargs)
+
+
+@receiver(post_save, sender=Artist, dispatch_uid="p__a_post")
+def run__artist_post_save(sender, instance, update_fields=None, **kwargs):
+    artist_post_save.run(instance, update_fields, **kwargs)
+
+
+@receiver(pre_save, sender=Genre, dispatch_uid="p__g_pre")
+def run__genre_pre_save(sender, instance, update_fields=None, **kwargs):
+    genre_pre_save.run(instance, update_fields, **kwargs)
+
+
+@receiver(post_save, sender=Genre, dispatch_uid="p__g_post")
+def run__genre_post_save(sender, instance, update_fields=None, **kwargs):
+    genre_post_save.run(instance, update_fields, **kwargs)
+
+
+@receiver(pre_save, sender=Artwork, dispatch_uid="p__aw_pre")
+def run__artwork_pre_save(sender, instance, update_fields=None, **kwargs):
+    artwork_pre_save.run(instance, update_fields, **kwargs)
+
+
+@receiver(post_save, sender=Artwork, dispatch_uid="p__aw_post")
+def run__artwork_post_save(sender, instance, update_fields=None, **kwargs):
+    artwork_post_save.run(instance, update_fields, **kwargs)
+
+
+@receiver(pre_save, sender=Event, dispatch_uid="p__e_pre")
+def run__event_pre_save(sender, instance, update_fields=None, **kwargs):
+    event_pre_save.run(instance, update_fields, **kwargs)
+
+
+@receiver(post_save, sender=Event, dispatch_uid="p__e_post")
+def run__event_post_save(sender, instance, update_fields=None, **kwargs):
+    event_post_save.run(instance, update_fields, **kwargs)
+
+
+@artist_pre_save.register(fields=['first_name', 'last_name'])
+def slugify__artist(instance, changed_fields, slugify=slugify, **kwargs):
     """
     Manages the uniquely numbered suffix for `name`.
     Artist [`first_name` + `last_name` + suffix] --> `slug`.
     """
-    name_fields_changed = ('first_name' in instance.changed_fields  or
-                           'last_name' in instance.changed_fields)
+    name_fields_changed = ('first_name' in changed_fields  or
+                           'last_name' in changed_fields)
     
     if (name_fields_changed or not instance.slug):
         _name = instance.__str__().lower()
@@ -49,35 +135,31 @@ def slugify__artist(sender, instance, slugify=slugify, **kwargs):
         instance.slug = slugify('-'.join([_name, _suffix]))
 
 
-@receiver(post_save, sender=Artist)
-def deactivate_artworks_of_inactive_artist(sender, instance, created, **kwargs):
+@artist_pre_save.register(fields=['biography'])
+def delete__artist_biography(instance, changed_fields, **kwargs):
     """
-    Ensures that all artworks of an artist are deactivated when artist is
-    deactivated.
+    If file already exists, but new file uploaded, delete existing file.
     """
-    is_active_field_changed = ('is_active' in instance.changed_fields)
+    biography_field_changed = ('biography' in changed_fields)
     
-    if (is_active_field_changed and not instance.is_active):
-        for _artwork in instance.artworks_authored.all():
-            if _artwork.is_active:
-                _artwork.is_active = False
-                if DJANGO_SAVE_UPDATEABLE:
-                    _artwork.save(update_fields=['is_active'])
-                else:
-                    _artwork.save()
+    if biography_field_changed:
+        previous_file = instance.get_field_diff('biography')[0]
+        if previous_file:
+            file_lifecycle.delete(previous_file)
 
 
-@receiver(pre_save, sender=Artist, dispatch_uid="d__a_b")
-def delete__artist_biography(sender, instance, **kwargs):
+@artist_post_save.register(fields=['is_active'])
+def deactivate_artworks_of_inactive_artist(instance, changed_fields, **kwargs):
     """
-    If file already exists, but new file uploaded, delete existing file.
+    Ensures that all artworks of an artist are deactivated when artist is
+    deactivated, as a single bulk update.
     """
-    biography_field_changed = ('biography' in instance.changed_fields)
+    from artlaasya.bulk import set_artworks_active
     
-    if biography_field_changed:
-        previous_file = instance.get_field_diff('biography')[0]
-        if previous_file:
-            delete_uploaded_file(previous_file.path)
+    is_active_field_changed = ('is_active' in changed_fields)
+    
+    if (is_active_field_changed and not instance.is_active):
+        set_artworks_active(instance.artworks_authored.all(), False)
 
 
 @receiver(pre_delete, sender=Artist, dispatch_uid="d__a")
@@ -86,30 +168,48 @@ def delete__artist(sender, instance, **kwargs):
     Deletes `biography` uploaded file when Artist is deleted.
     """
     if instance.biography:
-        delete_uploaded_file(instance.biography.path)
+        file_lifecycle.delete(instance.biography)
 
 
-@receiver(pre_save, sender=Genre)
-def slugify__genre(sender, instance, slugify=slugify, **kwargs):
+@genre_pre_save.register(fields=['name'])
+def slugify__genre(instance, changed_fields, slugify=slugify, **kwargs):
     """
     Manages the slugifying of `name`.
     Genre [`name`] --> `slug`.
     """
-    name_fields_changed = ('name' in instance.changed_fields)
+    name_fields_changed = ('name' in changed_fields)
     
     if (name_fields_changed or not instance.slug):
         _name = instance.__str__().lower()
         instance.slug = slugify(_name)
 
 
-@receiver(pre_save, sender=Artwork)
-def name_slugify__artwork(sender, instance, slugify=slugify, **kwargs):
+@genre_post_save.register()
+def refresh__genre_registry(instance, changed_fields, **kwargs):
+    """
+    Invalidates the genre registry of every process once a genre change 
+    commits.
+    """
+    on_commit(genre_registry.invalidate)
+
+
+@receiver(post_delete, sender=Genre, dispatch_uid="r__g")
+def refresh__genre_registry_on_delete(sender, instance, **kwargs):
+    """
+    Invalidates the genre registry of every process once a genre delete 
+    commits.
+    """
+    on_commit(genre_registry.invalidate)
+
+
+@artwork_pre_save.register(fields=['title'])
+def name_slugify__artwork(instance, changed_fields, slugify=slugify, **kwargs):
     """
     Manages the uniquely numbered suffix for `title`.
     Artwork [`title` + suffix] --> `name' --> `slug`.
     UploadedImage provides `name` and `slug`.
     """
-    title_field_changed = ('title' in instance.changed_fields)
+    title_field_changed = ('title' in changed_fields)
     if (title_field_changed or not instance.name):
         _title=instance.title.lower()
         _ratchet, _created = ArtworkRatchet.ratchets.get_or_create(title=_title)
@@ -121,14 +221,15 @@ def name_slugify__artwork(sender, instance, slugify=slugify, **kwargs):
         instance.slug = slugify(instance.name)
 
 
-@receiver(pre_save, sender=Artwork)
-def calculate_artwork_dimensions(sender, instance, **kwargs):
+@artwork_pre_save.register(fields=['image_height', 'image_width', 
+                                   'measurement_units'])
+def calculate_artwork_dimensions(instance, changed_fields, **kwargs):
     """
     Calculates artwork measurements in other measurement system.
     """
-    dimension_fields_changed = ('image_height' in instance.changed_fields or 
-                                'image_width' in instance.changed_fields or 
-                                'measurement_units' in instance.changed_fields)
+    dimension_fields_changed = ('image_height' in changed_fields or 
+                                'image_width' in changed_fields or 
+                                'measurement_units' in changed_fields)
     
     if (dimension_fields_changed or 
         not instance.image_height and not instance.image_width):
@@ -148,8 +249,24 @@ def calculate_artwork_dimensions(sender, instance, **kwargs):
             instance.imperial_units = 'I'
 
 
-@receiver(post_save, sender=Artwork)
-def ensure_artwork_uniquely_representative(sender, instance, created, **kwargs):
+@artwork_pre_save.register(fields=['uploaded_image'])
+def extract__artwork_image_metadata(instance, changed_fields, **kwargs):
+    """
+    Records the file size, format, colour mode and profile of a newly 
+    uploaded image from its header, and clears the colours and hash of the 
+    previous one; `analyse__artwork_images` fills those in from the outbox, 
+    so the save never decodes the image.  An image passed to the 
+    constructor of a new artwork is not among `changed_fields`, so new 
+    artworks are always read.
+    """
+    if instance._state.adding or 'uploaded_image' in changed_fields:
+        for _field, _value in extract_image_metadata(instance.uploaded_image,
+                                                     analyse=False).items():
+            setattr(instance, _field, _value)
+
+
+@artwork_post_save.register(fields=['is_representative', 'artist'])
+def ensure_artwork_uniquely_representative(instance, changed_fields, **kwargs):
     """
     Ensures that only one artwork is representative for any one artist.
     """
@@ -165,13 +282,31 @@ def ensure_artwork_uniquely_representative(sender, instance, created, **kwargs):
                     _artwork.save()
 
 
-@receiver(pre_save, sender=Event)
-def slugify__event(sender, instance, slugify=slugify, **kwargs):
+RECOMMENDATION_FIELDS = frozenset(['is_active', 'artist', 'genre', 'style_class', 
+                                   'medium_description', 'image_height', 
+                                   'image_width', 'measurement_units', 'price'])
+
+
+@receiver(pre_delete, sender=Artwork, dispatch_uid="r__aw")
+def refresh__artwork_recommendations_on_delete(sender, instance, **kwargs):
+    """
+    Recomputes, once the delete commits, the neighbour lists that included 
+    the deleted artwork.
+    """
+    _affected = list(ArtworkNeighbour.neighbours.filter(neighbour=instance
+                                               ).values_list('artwork_id', 
+                                                             flat=True))
+    if _affected:
+        on_commit(lambda: recommendations.refresh_lists(_affected))
+
+
+@event_pre_save.register(fields=['title'])
+def slugify__event(instance, changed_fields, slugify=slugify, **kwargs):
     """
     Manages the uniquely numbered suffix for `title`.
     Event [`title` + suffix] --> `slug`.
     """
-    title_field_changed = ('title' in instance.changed_fields)
+    title_field_changed = ('title' in changed_fields)
     
     if (title_field_changed or not instance.title):
         _title=instance.title.lower()
@@ -183,17 +318,17 @@ def slugify__event(sender, instance, slugify=slugify, **kwargs):
         instance.slug = slugify('-'.join([_title, _suffix]))
 
 
-@receiver(pre_save, sender=Event, dispatch_uid="d__e_i")
-def delete__event_image(sender, instance, **kwargs):
+@event_pre_save.register(fields=['image'])
+def delete__event_image(instance, changed_fields, **kwargs):
     """
     If image already exists, but new image uploaded, deletes existing image file.
     """
-    image_field_changed = ('image' in instance.changed_fields)
+    image_field_changed = ('image' in changed_fields)
     
     if image_field_changed:
         previous_image = instance.get_field_diff('image')[0]
         if previous_image:
-            delete_uploaded_file(previous_image.path)
+            file_lifecycle.delete(previous_image)
 
 
 @receiver(pre_delete, sender=Event, dispatch_uid="d__e")
@@ -201,7 +336,247 @@ def delete__event(sender, instance, **kwargs):
     """
     Deletes `image` uploaded file when Event is deleted.
     """
-    delete_uploaded_file(instance.image.path)
+    file_lifecycle.delete(instance.image)
+
+
+@receiver(pre_delete, sender=Artist, dispatch_uid="o__a")
+@receiver(pre_delete, sender=Genre, dispatch_uid="o__g")
+@receiver(pre_delete, sender=Artwork, dispatch_uid="o__aw")
+@receiver(pre_delete, sender=Event, dispatch_uid="o__e")
+def record__deletion(sender, instance, **kwargs):
+    """
+    Records the delete of an object in the outbox, including deletes 
+    cascaded from another object, with the surrogate keys of the pages that 
+    showed it.  The keys are taken before the delete cascades.
+    """
+    OutboxEvent.record(instance, OutboxEvent.DELETE, 
+                       previous_keys=get_surrogate_keys(instance))
+
+
+@receiver(catalogue_bulk_changed)
+def refresh__after_bulk_change(sender, pks, fields, **kwargs):
+    """
+    Invalidates the genre registry once per bulk update of genres.  The 
+    rest of the derived state follows the outbox.
+    """
+    if sender is Genre:
+        on_commit(genre_registry.invalidate)
+
+
+@receiver(request_started, dispatch_uid="oc__rs")
+def begin__deferred_on_commit(sender, **kwargs):
+    begin_deferring_on_commit()
+
+
+@receiver(request_finished, dispatch_uid="oc__rf")
+def run__deferred_on_commit(sender, **kwargs):
+    """
+    Runs `on_commit` callbacks deferred on Django versions without 
+    `transaction.on_commit` once the request's transaction has ended.
+    """
+    run_deferred_on_commit()
+
+
+@receiver(got_request_exception, dispatch_uid="oc__re")
+def discard__deferred_on_commit(sender, **kwargs):
+    discard_deferred_on_commit()
+
+
+@register_consumer(['artist', 'artwork'])
+def refresh__recommendations(events):
+    """
+    Updates the related-artwork neighbour table from the outbox, for created 
+    artworks and any whose similarity inputs changed.  An artist's change of 
+    status refreshes that artist's artworks and the lists holding them.
+    
+    Deletes are handled in `refresh__artwork_recommendations_on_delete`, 
+    which needs the neighbour rows the delete cascades away.
+    """
+    _pks = set()
+    _artist_pks = set()
+    for _event in events:
+        if _event.model_label == 'artist':
+            if 'is_active' in _event.changed_fields:
+                _artist_pks.add(_event.object_pk)
+        elif (_event.action == OutboxEvent.CREATE or 
+              (_event.action == OutboxEvent.UPDATE and 
+               RECOMMENDATION_FIELDS.intersection(_event.changed_fields))):
+            _pks.add(_event.object_pk)
+    if _artist_pks:
+        _pks.update(Artwork.artworks.filter(artist_id__in=_artist_pks
+                                   ).values_list('pk', flat=True))
+    if _pks:
+        recommendations.refresh_artworks(_pks)
+
+
+@register_consumer(['artwork'])
+def analyse__artwork_images(events):
+    """
+    Records the dominant colours, palette and perceptual hash of newly 
+    uploaded images from the outbox, off the request that saved them.  
+    Images already analysed, e.g. by the admin, are skipped.
+    """
+    _pks = set(_event.object_pk for _event in events 
+               if (_event.action == OutboxEvent.CREATE or 
+                   (_event.action == OutboxEvent.UPDATE and 
+                    'uploaded_image' in _event.changed_fields)))
+    if not _pks:
+        return
+    for _artwork in Artwork.artworks.filter(pk__in=_pks, 
+                                            image_phash__isnull=True
+                                   ).exclude(uploaded_image=''):
+        analyse_artwork_image(_artwork)
+
+
+def is_relevant(event, fields):
+    """
+    Whether `event` creates or deletes its object, or updates any of 
+    `fields`.
+    """
+    return (event.action != OutboxEvent.UPDATE or 
+            bool(fields.intersection(event.changed_fields)))
+
+
+TYPEAHEAD_FIELDS = {'artist': frozenset(['first_name', 'last_name', 'slug', 
+                                         'is_active']),
+                    'artwork': frozenset(['title', 'slug', 'artist', 
+                                          'is_active']),
+                    'genre': frozenset(['name', 'slug', 'is_active'])}
+
+
+@register_consumer(['artist', 'artwork', 'genre'])
+def update__typeahead(events):
+    """
+    Keeps the typeahead entries of artists, artworks and genres in step with 
+    their names and status from the outbox, under one version bump per 
+    batch.  Deleted or unlisted objects lose their entries.
+    
+    Artwork entries link through the artist's slug and are listed only 
+    while the artist is active, so an artist's change of either updates the 
+    artist's artworks too.
+    """
+    _pks = dict((_label, set()) for _label in TYPEAHEAD_FIELDS)
+    _artist_pks = set()
+    for _event in events:
+        if not is_relevant(_event, TYPEAHEAD_FIELDS[_event.model_label]):
+            continue
+        _pks[_event.model_label].add(_event.object_pk)
+        if (_event.model_label == 'artist' and 
+            _event.action == OutboxEvent.UPDATE and 
+            ('slug' in _event.changed_fields or 
+             'is_active' in _event.changed_fields)):
+            _artist_pks.add(_event.object_pk)
+    if _artist_pks:
+        _pks['artwork'].update(Artwork.artworks.filter(
+                                                artist_id__in=_artist_pks
+                                              ).values_list('pk', flat=True))
+    
+    _entries = {}
+    for _artist in Artist.artists.active().filter(pk__in=_pks['artist']):
+        _entries[('artist', _artist.pk)] = (_artist.__str__(), 
+                                            _artist.get_absolute_url())
+    for _artwork in Artwork.artworks.active(
+                                   ).filter(pk__in=_pks['artwork'], 
+                                            artist__is_active=True
+                                   ).select_related('artist'):
+        _entries[('artwork', _artwork.pk)] = (_artwork.title, 
+                                              _artwork.get_absolute_url())
+    for _genre in Genre.genres.filter(pk__in=_pks['genre'], is_active=True):
+        _entries[('genre', _genre.pk)] = (_genre.name, 
+                                          reverse('v_learn', kwargs={
+                                                  'artwork_genre': _genre.slug}))
+    typeahead_index.update_many([(_label, _pk) + 
+                                 _entries.get((_label, _pk), (None, None))
+                                 for _label in sorted(_pks) 
+                                 for _pk in sorted(_pks[_label])])
+
+
+HOME_GRID_FIELDS = {'artist': HOME_GRID_ARTIST_FIELDS,
+                    'artwork': HOME_GRID_ARTWORK_FIELDS,
+                    'genre': HOME_GRID_GENRE_FIELDS}
+
+
+@register_consumer(['artist', 'artwork', 'genre'])
+def invalidate__home_grid(events):
+    """
+    Rebuilds the home grid from the outbox when a representative artwork is 
+    created, an artwork leaves or changes on it, or an artist or genre 
+    shown on it is renamed or deleted.
+    """
+    _created = set()
+    for _event in events:
+        if _event.action == OutboxEvent.CREATE:
+            if _event.model_label == 'artwork':
+                _created.add(_event.object_pk)
+        elif is_relevant(_event, HOME_GRID_FIELDS[_event.model_label]):
+            invalidate_home_grid()
+            return
+    if (_created and 
+        Artwork.artworks.representative().filter(pk__in=_created).exists()):
+        invalidate_home_grid()
+
+
+PALETTE_FIELDS = frozenset(['uploaded_image', 'palette', 'is_active', 
+                            'artist'])
+
+
+@register_consumer(['artist', 'artwork'])
+def refresh__palette_index(events):
+    """
+    Reloads the colour search index from the outbox when an artwork's 
+    palette or listing changed, or an artist's status.
+    """
+    for _event in events:
+        if (_event.model_label == 'artwork' and 
+            is_relevant(_event, PALETTE_FIELDS) or 
+            _event.model_label == 'artist' and 
+            'is_active' in _event.changed_fields):
+            palette_index.invalidate()
+            return
+
+
+DUPLICATE_FIELDS = frozenset(['uploaded_image', 'image_phash'])
+
+
+@register_consumer(['artwork'])
+def refresh__duplicate_index(events):
+    """
+    Reloads the duplicate image index from the outbox when an artwork's 
+    image hash may have changed.
+    """
+    if any(is_relevant(_event, DUPLICATE_FIELDS) for _event in events):
+        duplicate_index.invalidate()
+
+
+@register_consumer(['artist', 'genre', 'artwork', 'event'])
+def purge__cached_pages(events):
+    """
+    Purges the CDN from the outbox, once per batch, of the pages showing 
+    each changed object and of those it was moved off or deleted from.
+    """
+    _keys = set()
+    _pks = {}
+    for _event in events:
+        _keys.update(_event.previous_keys)
+        if _event.action != OutboxEvent.DELETE:
+            _pks.setdefault(_event.model_label, set()).add(_event.object_pk)
+    for _objects in (Artist.artists.filter(pk__in=_pks.get('artist', ())),
+                     Genre.genres.filter(pk__in=_pks.get('genre', ())),
+                     Artwork.artworks.filter(pk__in=_pks.get('artwork', ())
+                                    ).select_related('artist', 'genre'),
+                     Event.events.filter(pk__in=_pks.get('event', ()))):
+        for _object in _objects:
+            _keys.update(get_surrogate_keys(_object))
+    purge_surrogate_keys(sorted(_keys))
+
+
+def get_pipeline_timings():
+    """
+    Returns `{pipeline name: {handler name: timing}}` for every save 
+    pipeline.
+    """
+    return dict((_pipeline.name, dict(_pipeline.timings)) 
+                for _pipeline in PIPELINES)
 
 
 #EOF - artlaasya signals
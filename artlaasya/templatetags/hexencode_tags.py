@@ -4,16 +4,53 @@ from django.utils.encoding import force_bytes, force_str
 from django import template
 
 import binascii
+import threading
+from collections import OrderedDict
 
 
 register = template.Library()
 
 
+HEXENCODE_CACHE_SIZE = 512
+
+_hexencoded = OrderedDict()
+_hexencoded_lock = threading.Lock()
+
+
+def _hexencode(unencoded_string):
+    """
+    Percent-encodes every byte of the UTF-8 encoded string, so multibyte 
+    characters become one `%xx` escape per byte.
+    """
+    _hex = force_str(binascii.hexlify(force_bytes(unencoded_string)))
+    return ''.join(['%' + _hex[_index:_index + 2] 
+                    for _index in range(0, len(_hex), 2)])
+# /_hexencode
+
+
 @register.filter
 def hexencode(unencoded_string):
-    return "".join(["%" + force_str(binascii.hexlify(force_bytes(char))) 
-                    for char in unencoded_string])
+    """
+    Returns the string with every byte percent-encoded, memoizing recent 
+    results in a bounded LRU cache.
+    """
+    with _hexencoded_lock:
+        try:
+            _encoded = _hexencoded.pop(unencoded_string)
+        except KeyError:
+            _encoded = None
+        if _encoded is not None:
+            _hexencoded[unencoded_string] = _encoded
+            return _encoded
+    
+    _encoded = _hexencode(unencoded_string)
+    
+    with _hexencoded_lock:
+        _hexencoded[unencoded_string] = _encoded
+        if len(_hexencoded) > HEXENCODE_CACHE_SIZE:
+            _hexencoded.popitem(last=False)
+    return _encoded
 # /hexencode
 
 
-#EOF - artlassya templatetags
\ No newline at end of file
+#EOF - artlassya templatetags
@@ -2,7 +2,8 @@
 
 from django import template
 
-from artlaasya.models import Artist, Artwork, Genre
+from artlaasya.models import Artist, Artwork
+from artlaasya.registry import genre_registry
 
 
 register = template.Library()
@@ -13,9 +14,8 @@ def get_genres_menu():
     '''
     Retrieves 'name', and 'slug' of Traditional genres.
     '''
-    return Genre.genres.traditional(
-                      ).values_list('name',
-                                    'slug')
+    return [(_genre.name, _genre.slug)
+            for _genre in genre_registry.traditional()]
 #end get_genres_menu
 
 
@@ -55,19 +55,18 @@ def get_sidebar_TRAD_menu():
     Retrieves 'first_name', 'last_name', and 'slug' of Artists 
     categorized as TRADITIONAL.
     '''
-    _genres_TRAD = Genre.genres.traditional(
-                              ).values_list('name',
-                                            'slug')
+    _genres_TRAD = genre_registry.traditional()
     _artists_TRAD = []
     for _genre_TRAD in _genres_TRAD:
-        _artists_TRAD.append(Artwork.artworks.filter(genre__name=_genre_TRAD[0]
+        _artists_TRAD.append(Artwork.artworks.filter(genre_id=_genre_TRAD.pk
                                             ).orderly(
                                             ).distinctly(
                                             ).active(
                                             ).values('artist__slug',
                                                      'artist__first_name',
                                                      'artist__last_name'))
-    return list(zip(_genres_TRAD, _artists_TRAD))
+    return list(zip([(_genre.name, _genre.slug) for _genre in _genres_TRAD],
+                    _artists_TRAD))
 #end get_sidebar_TRAD_menu
 
 
@@ -0,0 +1,1365 @@
+"""artlaasya tests"""
+
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase, 
+                         RequestFactory)
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.template import Template, Context
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.core.urlresolvers import reverse
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.encoding import force_bytes, force_str
+from django.utils import timezone
+
+import io
+import sys
+import json
+import shutil
+import tempfile
+import timeit
+import binascii
+import threading
+from datetime import date, timedelta
+from unittest import skipIf, skipUnless
+
+from artlaasya.models import (Artist, Genre, Artwork, ArtworkNeighbour, 
+                              SaleLedgerEntry, Event, Reservation, 
+                              OutboxEvent)
+from artlaasya.reservations import (reserve_seats, cancel_reservation, 
+                                    SeatsUnavailable)
+from artlaasya.caching import LocalCDN, SURROGATE_KEY_HEADER
+from artlaasya import caching
+from artlaasya.inventory import hold, bulk_transition, StatusConflict
+from artlaasya.registry import GenreRegistry, genre_registry
+from artlaasya.homegrid import (build_home_grid, get_home_grid, 
+                                invalidate_home_grid)
+from artlaasya.search import search_artworks, search_artists
+from artlaasya.admin import ArtworkAdmin
+from artlaasya.typeahead import TypeaheadIndex, typeahead_index
+from artlaasya.duplicates import DuplicateIndex, get_dhash, hamming_distance
+from artlaasya.palette import pack_palette, unpack_palette
+from artlaasya.imagemeta import extract_image_metadata
+from artlaasya import outbox
+from artlaasya.outbox import drain, claim, register_consumer
+from artlaasya.bulk import set_artworks_genre
+from artlaasya.pipeline import SavePipeline, STOP
+from artlaasya.utils import (atomic, on_commit, begin_deferring_on_commit, 
+                             run_deferred_on_commit, 
+                             discard_deferred_on_commit)
+from artlaasya import recommendations
+from artlaasya.templatetags import hexencode_tags
+from artlaasya import views
+from artlaasya.management.commands.prerender_gallery import (
+                                       Command as PrerenderGalleryCommand)
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+# The fields and relations a listing card shows.
+CARD_TEMPLATE = Template(
+    '{% for artwork in artworks %}'
+    '<a href="{{ artwork.get_absolute_url }}">'
+    '<img src="{{ artwork.uploaded_image.url }}" alt="{{ artwork.title }}">'
+    '</a>'
+    '<a href="{{ artwork.artist.get_absolute_url }}">'
+    '{{ artwork.artist.first_name }} {{ artwork.artist.last_name }}</a>'
+    '{{ artwork.genre.name }}'
+    '{% endfor %}')
+
+
+def create_genre(name='Contemporary'):
+    return Genre.genres.create(name=name)
+
+
+def create_artists(count, prefix='artist'):
+    """
+    Inserts `count` active artists in one query, bypassing save signals.
+    """
+    Artist.artists.bulk_create([Artist(first_name='First',
+                                       last_name='%s%d' % (prefix, _index),
+                                       slug='%s-%d' % (prefix, _index))
+                                for _index in range(count)])
+    return list(Artist.artists.filter(slug__startswith=prefix + '-'
+                             ).order_by('pk'))
+
+
+def create_artworks(artist, genre, count, is_representative=False):
+    """
+    Inserts `count` active artworks of `artist` in one query, bypassing save
+    signals.  The image dimensions are given, so no image file is opened.
+    """
+    _prefix = '%s-%d' % (artist.slug, artist.pk)
+    Artwork.artworks.bulk_create([
+        Artwork(title='Work %d' % _index,
+                name='%s-work-%d' % (_prefix, _index),
+                slug='%s-work-%d' % (_prefix, _index),
+                uploaded_image='artworks/%s-%d.jpg' % (_prefix, _index),
+                height=10,
+                width=10,
+                inventory_name='%s-inv-%d' % (_prefix, _index),
+                internal_name='%s-int-%d' % (_prefix, _index),
+                artist=artist,
+                genre=genre,
+                medium_description='Oil on canvas',
+                price=1000,
+                is_representative=is_representative)
+        for _index in range(count)])
+
+
+ARTIST_PAGE_TEMPLATE = Template(
+    '{{ artist.first_name }} {{ artist.last_name }}'
+    '{% for artwork in artworks %}'
+    '<a href="{{ artwork.get_absolute_url }}">{{ artwork.title }}</a>'
+    '{{ artwork.genre.name }}'
+    '{% endfor %}'
+    '{% for event in events %}'
+    '<a href="{{ event.get_absolute_url }}">{{ event.title }}</a>'
+    '{% endfor %}')
+
+
+def count_queries(func, *args, **kwargs):
+    with CaptureQueriesContext(connection) as _queries:
+        func(*args, **kwargs)
+    return len(_queries)
+
+
+def create_event(title='Opening', total_seats=None):
+    return Event.events.create(title=title,
+                               type='Opening',
+                               image='events/opening.jpg',
+                               total_seats=total_seats,
+                               location='Gallery',
+                               details='Opening night.')
+
+
+class OnCommitTest(TestCase):
+    """
+    Each test already runs inside a plain `transaction.atomic` block, as 
+    code under `ATOMIC_REQUESTS` or the admin does.
+    """
+
+    def setUp(self):
+        self.called = []
+
+
+    def tearDown(self):
+        discard_deferred_on_commit()
+        run_deferred_on_commit()
+
+
+    def test_runs_when_outermost_block_commits(self):
+        with atomic():
+            on_commit(lambda: self.called.append('outer'))
+            with atomic():
+                on_commit(lambda: self.called.append('inner'))
+            self.assertEqual(self.called, [])
+        self.assertEqual(self.called, ['outer', 'inner'])
+
+
+    def test_rolled_back_block_drops_its_callbacks(self):
+        with atomic():
+            on_commit(lambda: self.called.append('outer'))
+            try:
+                with atomic():
+                    on_commit(lambda: self.called.append('inner'))
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(self.called, ['outer'])
+
+
+    def test_rolled_back_outermost_block_drops_all(self):
+        try:
+            with atomic():
+                on_commit(lambda: self.called.append('outer'))
+                with atomic():
+                    on_commit(lambda: self.called.append('inner'))
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(self.called, [])
+
+
+    def test_runs_at_once_outside_request(self):
+        on_commit(lambda: self.called.append('command'))
+        self.assertEqual(self.called, ['command'])
+
+
+    def test_deferred_to_end_of_request(self):
+        begin_deferring_on_commit()
+        with atomic():
+            on_commit(lambda: self.called.append('request'))
+        on_commit(lambda: self.called.append('signal'))
+        self.assertEqual(self.called, [])
+        run_deferred_on_commit()
+        self.assertEqual(self.called, ['request', 'signal'])
+        on_commit(lambda: self.called.append('after'))
+        self.assertEqual(self.called, ['request', 'signal', 'after'])
+
+
+    def test_failed_request_discards_deferred(self):
+        begin_deferring_on_commit()
+        on_commit(lambda: self.called.append('request'))
+        discard_deferred_on_commit()
+        run_deferred_on_commit()
+        self.assertEqual(self.called, [])
+
+
+    def test_thread_started_by_request_runs_at_once(self):
+        begin_deferring_on_commit()
+        _thread = threading.Thread(
+                      target=lambda: on_commit(
+                                         lambda: self.called.append('thread')))
+        _thread.start()
+        _thread.join()
+        self.assertEqual(self.called, ['thread'])
+# /OnCommitTest
+
+
+@skipIf(connection.vendor == 'sqlite',
+        "SQLite test databases cannot be shared between threads.")
+class ReservationLoadTest(TransactionTestCase):
+    """
+    Hundreds of visitors reserving seats at one event at the same moment.
+    """
+
+    VISITORS = 300
+
+    # Concurrent connections; kept below the usual server connection limit.
+    THREADS = 50
+
+    TOTAL_SEATS = 120
+
+    def setUp(self):
+        self.event = create_event(total_seats=self.TOTAL_SEATS)
+
+
+    def reserve_all(self, seats=1):
+        """
+        Has `THREADS` threads, released together, reserve for `VISITORS`
+        visitors between them, and returns the number of reservations made
+        and refused.
+        """
+        _start = threading.Event()
+        _results = []
+        _lock = threading.Lock()
+
+        def _visit(visitors):
+            _start.wait()
+            try:
+                for _index in visitors:
+                    try:
+                        reserve_seats(self.event, 
+                                      'visitor%d@example.com' % _index,
+                                      seats)
+                        _result = 'reserved'
+                    except SeatsUnavailable:
+                        _result = 'refused'
+                    except Exception as e:
+                        _result = repr(e)
+                    with _lock:
+                        _results.append(_result)
+            finally:
+                connection.close()
+
+        _threads = [threading.Thread(target=_visit,
+                                     args=(range(_thread, self.VISITORS, 
+                                                 self.THREADS),))
+                    for _thread in range(self.THREADS)]
+        for _thread in _threads:
+            _thread.start()
+        _start.set()
+        for _thread in _threads:
+            _thread.join()
+
+        self.assertEqual(len(_results), self.VISITORS)
+        _unexpected = [_result for _result in _results
+                       if _result not in ('reserved', 'refused')]
+        self.assertEqual(_unexpected, [])
+        return _results.count('reserved'), _results.count('refused')
+
+
+    def test_never_oversells(self):
+        _reserved, _refused = self.reserve_all()
+
+        self.assertEqual(_reserved, self.TOTAL_SEATS)
+        self.assertEqual(_refused, self.VISITORS - self.TOTAL_SEATS)
+        self.assertEqual(Event.events.get(pk=self.event.pk).seats_reserved,
+                         self.TOTAL_SEATS)
+        self.assertEqual(Reservation.reservations.filter(event=self.event
+                                                ).count(),
+                         self.TOTAL_SEATS)
+
+
+    def test_never_oversells_multiple_seats(self):
+        _reserved, _refused = self.reserve_all(seats=7)
+
+        self.assertEqual(_reserved, self.TOTAL_SEATS // 7)
+        self.assertEqual(Event.events.get(pk=self.event.pk).seats_reserved,
+                         self.TOTAL_SEATS // 7 * 7)
+
+
+    def test_unlimited_event_takes_everyone(self):
+        Event.events.filter(pk=self.event.pk).update(total_seats=None)
+
+        _reserved, _refused = self.reserve_all()
+
+        self.assertEqual(_reserved, self.VISITORS)
+        self.assertEqual(Event.events.get(pk=self.event.pk).seats_reserved,
+                         self.VISITORS)
+# /ReservationLoadTest
+
+
+class ReservationTest(TestCase):
+
+    def setUp(self):
+        self.event = create_event(total_seats=2)
+
+
+    def test_refuses_when_full(self):
+        reserve_seats(self.event, 'one@example.com', 2)
+
+        with self.assertRaises(SeatsUnavailable):
+            reserve_seats(self.event, 'two@example.com')
+        self.assertEqual(Event.events.get(pk=self.event.pk).seats_reserved, 2)
+
+
+    def test_refuses_inactive_event(self):
+        Event.events.filter(pk=self.event.pk).update(is_active=False)
+
+        with self.assertRaises(SeatsUnavailable):
+            reserve_seats(self.event, 'one@example.com')
+# /ReservationTest
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EventsViewTest(TestCase):
+    """
+    An empty or out of range events listing is a 404, never a 500.
+    """
+
+    def get(self, page):
+        return views.events(RequestFactory().get('/events/', {'page': page}))
+
+
+    def test_no_events_with_invalid_page(self):
+        with self.assertRaises(Http404):
+            self.get('abc')
+
+
+    def test_no_events(self):
+        with self.assertRaises(Http404):
+            self.get('1')
+
+
+    def test_page_out_of_range(self):
+        create_event()
+        with self.assertRaises(Http404):
+            self.get('2')
+# /EventsViewTest
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SurrogatePurgeTest(TestCase):
+    """
+    Saves purge, from the outbox, every cached page that showed the changed 
+    object.
+    """
+
+    def setUp(self):
+        self.cdn = caching._backend = LocalCDN()
+        genre_registry.invalidate()
+        self.genres = [create_genre('Miniature'), create_genre('Tanjore')]
+        self.artists = create_artists(2)
+        create_artworks(self.artists[0], self.genres[0], 1)
+        self.artwork = Artwork.artworks.get()
+        self.artwork.image_height = self.artwork.image_width = 40
+        self.event = create_event(total_seats=1)
+        self.event_path = self.event.get_absolute_url()
+        drain()
+
+
+    def tearDown(self):
+        caching._backend = None
+
+
+    def cache_page(self, path, *keys):
+        _response = HttpResponse(path)
+        _response[SURROGATE_KEY_HEADER] = ' '.join(keys)
+        self.cdn.store(path, _response)
+
+
+    def cache_pages(self):
+        for _artist in self.artists:
+            self.cache_page(_artist.get_absolute_url(), 
+                            'artist-%s' % _artist.slug)
+        for _genre in self.genres:
+            self.cache_page('/learn/%s/' % _genre.slug, 
+                            'genre-%s' % _genre.slug)
+        self.cache_page(self.event_path, 'event-%s' % self.event.slug)
+
+
+    def test_moving_artwork_purges_previous_pages(self):
+        self.cache_pages()
+        self.artwork.artist = self.artists[1]
+        self.artwork.genre = self.genres[1]
+        self.artwork.save()
+        self.assertEqual(len(self.cdn.responses), 5)
+        drain()
+        self.assertEqual(sorted(self.cdn.responses), [self.event_path])
+
+
+    def test_deleting_artist_purges_artwork_pages(self):
+        self.cache_page(self.artwork.get_absolute_url(), 
+                        'artwork-%s' % self.artwork.slug)
+        self.artists[0].delete()
+        drain()
+        self.assertIsNone(self.cdn.get(self.artwork.get_absolute_url()))
+        self.assertEqual(OutboxEvent.outbox.filter(
+                             action=OutboxEvent.DELETE, model_label='artwork'
+                                          ).count(), 1)
+
+
+    def test_bulk_genre_change_purges_previous_genre(self):
+        self.cache_pages()
+        set_artworks_genre(Artwork.artworks.all(), self.genres[1])
+        drain()
+        self.assertIsNone(self.cdn.get('/learn/%s/' % self.genres[0].slug))
+        self.assertIsNotNone(self.cdn.get(self.artists[1].get_absolute_url()))
+
+
+    def test_unrelated_pages_stay_cached(self):
+        self.cache_pages()
+        self.artwork.description = 'Gold leaf.'
+        self.artwork.save()
+        drain()
+        self.assertIsNone(self.cdn.get(self.artists[0].get_absolute_url()))
+        self.assertIsNotNone(self.cdn.get(self.artists[1].get_absolute_url()))
+        self.assertIsNotNone(self.cdn.get('/learn/tanjore/'))
+
+
+    def test_reservations_purge_event_page(self):
+        self.cache_pages()
+        _reservation = reserve_seats(self.event, 'one@example.com')
+        self.assertIsNone(self.cdn.get(self.event_path))
+
+        self.cache_pages()
+        cancel_reservation(_reservation)
+        self.assertIsNone(self.cdn.get(self.event_path))
+        self.assertIsNotNone(self.cdn.get('/learn/tanjore/'))
+
+
+    def test_refused_reservation_purges_nothing(self):
+        reserve_seats(self.event, 'one@example.com')
+        self.cache_pages()
+        with self.assertRaises(SeatsUnavailable):
+            reserve_seats(self.event, 'two@example.com')
+        self.assertIsNotNone(self.cdn.get(self.event_path))
+# /SurrogatePurgeTest
+
+
+class InventoryTest(TestCase):
+
+    def setUp(self):
+        create_artworks(create_artists(1)[0], create_genre(), 4)
+        self.artworks = list(Artwork.artworks.order_by('pk'))
+
+
+    def test_ledger_records_current_price(self):
+        _artwork = self.artworks[0]
+        Artwork.artworks.filter(pk=_artwork.pk).update(price=2500)
+        _entry = hold(_artwork)
+        self.assertEqual((_entry.price, _entry.from_status, _entry.to_status),
+                         (2500, 'AVAL', 'HOLD'))
+        self.assertEqual(Artwork.artworks.get(pk=_artwork.pk).status, 'HOLD')
+
+
+    def test_stale_status_conflicts(self):
+        _artwork = self.artworks[0]
+        _stale = Artwork.artworks.get(pk=_artwork.pk)
+        hold(_artwork)
+        with self.assertRaises(StatusConflict):
+            hold(_stale)
+        self.assertEqual(SaleLedgerEntry.entries.count(), 1)
+
+
+    def test_bulk_transition_moves_only_matching_rows(self):
+        hold(self.artworks[0])
+        Artwork.artworks.filter(pk=self.artworks[1].pk).update(price=4000)
+        SaleLedgerEntry.entries.all().delete()
+
+        _moved = bulk_transition(Artwork.artworks.all(), 'AVAL', 'HOLD')
+        self.assertEqual(_moved, 3)
+        self.assertEqual(Artwork.artworks.filter(status='HOLD').count(), 4)
+        self.assertEqual(sorted(SaleLedgerEntry.entries.values_list(
+                                                'artwork_id', 'price')),
+                         [(self.artworks[1].pk, 4000), 
+                          (self.artworks[2].pk, 1000), 
+                          (self.artworks[3].pk, 1000)])
+
+
+    def test_bulk_transition_with_nothing_to_move(self):
+        self.assertEqual(bulk_transition(Artwork.artworks.all(), 
+                                         'HOLD', 'SOLD'), 0)
+        self.assertEqual(SaleLedgerEntry.entries.count(), 0)
+# /InventoryTest
+
+
+class SavePipelineTest(TestCase):
+    """
+    Save pipeline handler selection, field diffs and early stopping.
+    """
+
+    def setUp(self):
+        self.pipeline = SavePipeline('test')
+        self.calls = []
+        
+        @self.pipeline.register(fields=['title'])
+        def title_handler(instance, changed_fields, **kwargs):
+            self.calls.append(('title', changed_fields, 
+                               kwargs['update_fields']))
+        
+        @self.pipeline.register()
+        def any_handler(instance, changed_fields, **kwargs):
+            self.calls.append(('any', changed_fields, kwargs['update_fields']))
+            return getattr(instance, 'stop', None)
+        
+        @self.pipeline.register(fields=['price'])
+        def price_handler(instance, changed_fields, **kwargs):
+            self.calls.append(('price', changed_fields, 
+                               kwargs['update_fields']))
+
+
+    def instance(self, *changed_fields, **attributes):
+        _instance = type('Instance', (object,), attributes)()
+        _instance.changed_fields = list(changed_fields)
+        return _instance
+
+
+    def test_handlers_run_in_order_with_changed_fields(self):
+        self.pipeline.run(self.instance('title', 'price'))
+        _changed = frozenset(['title', 'price'])
+        self.assertEqual(self.calls, [('title', _changed, None), 
+                                      ('any', _changed, None), 
+                                      ('price', _changed, None)])
+
+
+    def test_update_fields_skips_unrelated_handlers(self):
+        self.pipeline.run(self.instance('price'), update_fields=['price'])
+        self.assertEqual([_call[0] for _call in self.calls], ['any', 'price'])
+        self.assertEqual(self.calls[0][2], frozenset(['price']))
+        self.assertEqual(self.pipeline.timings['title_handler']['skipped'], 1)
+        self.assertEqual(self.pipeline.timings['price_handler']['calls'], 1)
+
+
+    def test_stop_ends_the_pipeline(self):
+        self.pipeline.run(self.instance('title', stop=STOP))
+        self.assertEqual([_call[0] for _call in self.calls], ['title', 'any'])
+        self.pipeline.reset_timings()
+        self.assertEqual(self.pipeline.timings['any_handler']['calls'], 0)
+
+
+    def test_deactivating_artist_deactivates_artworks_in_bulk(self):
+        _artist = create_artists(1)[0]
+        create_artworks(_artist, create_genre(), 3)
+        _artist.is_active = False
+        with CaptureQueriesContext(connection) as _queries:
+            _artist.save()
+        _updates = [_query['sql'] for _query in _queries.captured_queries 
+                    if 'UPDATE "artlaasya_artwork"' in _query['sql']]
+        self.assertEqual(len(_updates), 1)
+        self.assertFalse(Artwork.artworks.filter(is_active=True).exists())
+# /SavePipelineTest
+
+
+class OutboxTest(TestCase):
+    """
+    Outbox batches are claimed before they are dispatched, and failed events 
+    are retried.
+    """
+
+    def setUp(self):
+        self.consumers = list(outbox._consumers)
+        self.batches = []
+        self.fail = False
+        
+        @register_consumer(['genre'])
+        def record_batch(events):
+            self.batches.append([_event.object_pk for _event in events])
+            if self.fail:
+                raise ValueError
+        
+        self.genre = create_genre()
+
+
+    def tearDown(self):
+        outbox._consumers[:] = self.consumers
+
+
+    def test_claimed_batch_is_skipped_by_other_workers(self):
+        _claimed = claim()
+        self.assertEqual([_event.object_pk for _event in _claimed], 
+                         [self.genre.pk])
+        self.assertEqual(claim(), [])
+        self.assertEqual(drain(), 0)
+        self.assertEqual(self.batches, [])
+
+
+    def test_consumers_run_outside_the_claim(self):
+        self.assertEqual(drain(), 1)
+        self.assertEqual(self.batches, [[self.genre.pk]])
+        self.assertIsNotNone(OutboxEvent.outbox.get().processed)
+
+
+    def test_failed_event_is_retried(self):
+        self.fail = True
+        self.assertEqual(drain(), 1)
+        _event = OutboxEvent.outbox.get()
+        self.assertIsNone(_event.processed)
+        self.assertEqual(_event.attempts, 1)
+        self.assertIn('ValueError', _event.last_error)
+        self.assertEqual(drain(), 0)
+# /OutboxTest
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HomeGridQueryTest(TestCase):
+    """
+    The home grid renders in a constant number of queries, however many 
+    cards it has.
+    """
+
+    def setUp(self):
+        genre_registry.invalidate()
+        invalidate_home_grid()
+        self.genre = create_genre()
+
+
+    def add_cards(self, count, prefix):
+        for _artist in create_artists(count, prefix):
+            create_artworks(_artist, self.genre, 1, is_representative=True)
+
+
+    def render_grid(self):
+        return CARD_TEMPLATE.render(Context({'artworks': build_home_grid()}))
+
+
+    def render_listing(self):
+        return CARD_TEMPLATE.render(Context(
+                   {'artworks': Artwork.artworks.representative(
+                                               ).active(
+                                               ).for_listing(
+                                               ).select_related('genre')}))
+
+
+    def test_500_card_grid(self):
+        self.add_cards(500, 'grid')
+
+        with self.assertNumQueries(1):
+            _html = self.render_grid()
+        self.assertEqual(_html.count('<img '), 500)
+
+
+    def test_grid_queries_do_not_grow(self):
+        self.add_cards(1, 'one')
+        _one = count_queries(self.render_grid)
+        self.add_cards(499, 'many')
+
+        self.assertEqual(count_queries(self.render_grid), _one)
+
+
+    def test_listing_queries_do_not_grow(self):
+        self.add_cards(1, 'one')
+        _one = count_queries(self.render_listing)
+        self.add_cards(499, 'many')
+
+        self.assertEqual(count_queries(self.render_listing), _one)
+        self.assertEqual(self.render_listing().count('<img '), 500)
+
+
+    def test_cached_grid_needs_no_queries(self):
+        self.add_cards(500, 'grid')
+        with self.assertNumQueries(1):
+            get_home_grid()
+
+        with self.assertNumQueries(0):
+            _html = CARD_TEMPLATE.render(Context({'artworks': 
+                                                  get_home_grid()}))
+        self.assertEqual(_html.count('<img '), 500)
+# /HomeGridQueryTest
+
+
+class ArtistPageQueryTest(TestCase):
+    """
+    The artist page loads the artist, its active works with their genres 
+    and its upcoming events in three queries, however many works it has.
+    """
+
+    def setUp(self):
+        genre_registry.invalidate()
+        self.genre = create_genre()
+        self.artist = create_artists(1)[0]
+        _event = create_event()
+        Event.events.filter(pk=_event.pk).update(
+                                    start_date=date.today() + timedelta(7),
+                                    end_date=date.today() + timedelta(7))
+        _event.artist.add(self.artist)
+
+
+    def render_page(self):
+        _artist = Artist.artists.active().detailed().get(slug=self.artist.slug)
+        return ARTIST_PAGE_TEMPLATE.render(Context(
+                   {'artist': _artist,
+                    'artworks': _artist.active_artworks,
+                    'events': _artist.upcoming_events}))
+
+
+    def assert_page_queries(self, works):
+        create_artworks(self.artist, self.genre, works)
+
+        with self.assertNumQueries(3):
+            _html = self.render_page()
+        self.assertEqual(_html.count('Work '), works)
+        self.assertIn('Opening', _html)
+
+
+    def test_1_work(self):
+        self.assert_page_queries(1)
+
+
+    def test_100_works(self):
+        self.assert_page_queries(100)
+
+
+    def test_1000_works(self):
+        self.assert_page_queries(1000)
+
+
+    def test_artist_without_works(self):
+        with self.assertNumQueries(3):
+            self.render_page()
+# /ArtistPageQueryTest
+
+
+class SearchTest(TestCase):
+    """
+    Matches are ranked by the database, so every match is ranked, however 
+    far down the artist order it falls.
+    """
+
+    def setUp(self):
+        _genre = create_genre()
+        _first = create_artists(1, 'aaa')[0]
+        _last = create_artists(1, 'zzz')[0]
+        create_artworks(_first, _genre, 1100)
+        create_artworks(_last, _genre, 1)
+        Artwork.artworks.filter(artist=_last).update(title='Canvas study')
+
+
+    def test_title_match_ranks_first(self):
+        _page = search_artworks('canvas')
+        self.assertEqual(_page.paginator.count, 1101)
+        self.assertEqual(_page.object_list[0].title, 'Canvas study')
+        self.assertEqual(_page.object_list[0].search_title,
+                         '<mark>Canvas</mark> study')
+
+
+    def test_every_term_must_match(self):
+        _page = search_artworks('canvas study')
+        self.assertEqual([_artwork.title for _artwork in _page.object_list],
+                         ['Canvas study'])
+
+
+    def test_blank_quoted_term_is_ignored(self):
+        _page = search_artworks('"   " study')
+        self.assertEqual(_page.object_list[0].search_title,
+                         'Canvas <mark>study</mark>')
+
+
+    def test_blank_query_finds_nothing(self):
+        self.assertEqual(list(search_artworks('"   "').object_list), [])
+        self.assertEqual(search_artists('"   "'), [])
+
+
+    def test_artists_ranked_by_last_name(self):
+        _found = search_artists('aaa0')
+        self.assertEqual([_artist.last_name for _artist in _found], ['aaa0'])
+# /SearchTest
+
+
+class ArtworkAdminSearchTest(TestCase):
+
+    def setUp(self):
+        _genre = create_genre()
+        create_artworks(create_artists(1, 'pablo')[0], _genre, 3)
+        create_artworks(create_artists(1, 'frida')[0], _genre, 3)
+        self.admin = ArtworkAdmin(Artwork, None)
+
+
+    def search(self, search_term):
+        _queryset, _use_distinct = self.admin.get_search_results(
+                                       None, Artwork.artworks.all(), search_term)
+        self.assertFalse(_use_distinct)
+        return sorted(_queryset.values_list('slug', flat=True))
+
+
+    def test_matches_artist_name_substring(self):
+        self.assertEqual(len(self.search('RID')), 3)
+
+
+    def test_every_term_must_match(self):
+        self.assertEqual([_slug.split('-work-')[1] 
+                          for _slug in self.search('abl work 2')], ['2'])
+
+
+    def test_matches_inventory_name(self):
+        self.assertEqual(len(self.search('inv-1')), 2)
+# /ArtworkAdminSearchTest
+
+
+MEDIUMS = ('Oil on canvas', 'Acrylic on canvas', 'Watercolour on paper', 
+           'Ink on paper', 'Oil and gold leaf on board')
+
+
+class RecommendationsTest(TestCase):
+    """
+    Incremental refreshes leave the neighbour table as a full rebuild would.
+    """
+
+    def setUp(self):
+        self.genres = [create_genre('Genre %d' % _index) for _index in range(3)]
+        self.artists = create_artists(4)
+        for _index, _artist in enumerate(self.artists):
+            create_artworks(_artist, self.genres[_index % 3], 10)
+        self.pks = list(Artwork.artworks.order_by('pk'
+                                       ).values_list('pk', flat=True))
+        for _index, _pk in enumerate(self.pks):
+            Artwork.artworks.filter(pk=_pk).update(
+                            medium_description=MEDIUMS[_index % len(MEDIUMS)],
+                            price=1000 * (_index % 7))
+        recommendations.rebuild_all()
+
+
+    def get_table(self):
+        """
+        Returns `{artwork pk: sorted scores}`; ties may pick either neighbour.
+        """
+        _table = {}
+        for _artwork_id, _score in ArtworkNeighbour.neighbours.values_list(
+                                                    'artwork_id', 'score'):
+            _table.setdefault(_artwork_id, []).append(round(_score, 6))
+        return dict((_pk, sorted(_scores)) for _pk, _scores in _table.items())
+
+
+    def assert_matches_rebuild(self):
+        _refreshed = self.get_table()
+        recommendations.rebuild_all()
+        self.assertEqual(_refreshed, self.get_table())
+
+
+    def test_refresh_changed_artworks(self):
+        _changed = self.pks[::6]
+        Artwork.artworks.filter(pk__in=_changed).update(
+                        genre=self.genres[0], 
+                        medium_description='Bronze')
+        recommendations.refresh_artworks(_changed)
+        self.assert_matches_rebuild()
+
+
+    def test_refresh_after_artist_deactivated(self):
+        Artist.artists.filter(pk=self.artists[0].pk).update(is_active=False)
+        recommendations.refresh_artworks(Artwork.artworks.filter(
+                                         artist=self.artists[0]
+                                         ).values_list('pk', flat=True))
+        self.assert_matches_rebuild()
+
+
+    def test_inactive_artist_not_recommended(self):
+        Artist.artists.filter(pk=self.artists[1].pk).update(is_active=False)
+        for _pk in self.pks:
+            _artwork = Artwork.artworks.get(pk=_pk)
+            self.assertNotIn(self.artists[1].pk, 
+                             [_neighbour.artist_id for _neighbour 
+                              in recommendations.get_recommendations(_artwork)])
+# /RecommendationsTest
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SharedIndexTest(TestCase):
+    """
+    Process-local indexes follow changes made in other processes, and only 
+    once they commit.  Each index instance stands for one process.
+    """
+
+    def setUp(self):
+        typeahead_index.invalidate()
+        self.artist = create_artists(1, 'pablo')[0]
+
+
+    def get_index(self, index_class):
+        _index = index_class()
+        _index._version.check_interval = 0
+        return _index
+
+
+    def test_typeahead_update_reaches_other_process(self):
+        _local = self.get_index(TypeaheadIndex)
+        _other = self.get_index(TypeaheadIndex)
+        self.assertEqual(len(_local.lookup('pab')), 1)
+        self.assertEqual(len(_other.lookup('pab')), 1)
+
+        Artist.artists.filter(pk=self.artist.pk).update(last_name='Picasso')
+        _local.update('artist', self.artist.pk, 'First Picasso', '/picasso/')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(_local.lookup('pic')), 1)
+        self.assertEqual([_entry['label'] for _entry in _other.lookup('pic')],
+                         ['First Picasso'])
+        self.assertEqual(_other.lookup('pab'), [])
+
+
+    def test_typeahead_ignores_rolled_back_save(self):
+        self.assertEqual(typeahead_index.lookup('ghost'), [])
+        try:
+            with atomic():
+                Artist.artists.create(first_name='Ghost', last_name='Painter')
+                raise ValueError
+        except ValueError:
+            pass
+        drain()
+        self.assertEqual(typeahead_index.lookup('ghost'), [])
+
+
+    def test_typeahead_applies_committed_save(self):
+        self.assertEqual(typeahead_index.lookup('ghost'), [])
+        with atomic():
+            Artist.artists.create(first_name='Ghost', last_name='Painter')
+            self.assertEqual(typeahead_index.lookup('ghost'), [])
+        self.assertEqual(typeahead_index.lookup('ghost'), [])
+        drain()
+        self.assertEqual(len(typeahead_index.lookup('ghost')), 1)
+
+
+    def test_duplicate_index_reloads_in_other_process(self):
+        create_artworks(self.artist, create_genre(), 2)
+        _first, _second = Artwork.artworks.order_by('pk')
+        Artwork.artworks.filter(pk=_first.pk).update(image_phash=0x0f0f)
+        _local = self.get_index(DuplicateIndex)
+        _other = self.get_index(DuplicateIndex)
+        self.assertEqual(_other.find(0x0f0f, exclude=_second.pk), 
+                         [(0, _first.pk)])
+
+        Artwork.artworks.filter(pk=_second.pk).update(image_phash=0x0f0e)
+        _local.invalidate()
+        self.assertEqual(_other.find(0x0f0f, exclude=_first.pk), 
+                         [(1, _second.pk)])
+# /SharedIndexTest
+
+
+def create_image(size=(90, 80), flip=False, image_format='PNG'):
+    """
+    Returns the bytes of a red to blue gradient image.
+    """
+    from PIL import Image
+
+    _width, _height = size
+    _image = Image.new('RGB', size)
+    _image.putdata([(255 * _x // _width, 0, 255 - 255 * _x // _width)
+                    for _y in range(_height) for _x in range(_width)])
+    if flip:
+        _image = _image.transpose(Image.FLIP_LEFT_RIGHT)
+    _data = io.BytesIO()
+    _image.save(_data, image_format)
+    return _data.getvalue()
+
+
+class ImageAnalysisTest(TestCase):
+    """
+    Image header reads, reduced-image analysis, palettes and duplicate 
+    hashes.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        create_artworks(create_artists(1)[0], create_genre(), 2)
+        self.artworks = list(Artwork.artworks.order_by('pk'))
+
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+
+    def upload(self, artwork, data):
+        artwork.uploaded_image.name = default_storage.save(
+                                          artwork.uploaded_image.name, 
+                                          ContentFile(data))
+        Artwork.artworks.filter(pk=artwork.pk
+                       ).update(uploaded_image=artwork.uploaded_image.name)
+        return artwork.uploaded_image
+
+
+    def test_header_only(self):
+        _metadata = extract_image_metadata(
+                        self.upload(self.artworks[0], create_image()), 
+                        analyse=False)
+        self.assertEqual((_metadata['image_format'], _metadata['color_mode']), 
+                         ('PNG', 'RGB'))
+        self.assertTrue(_metadata['file_size'] > 0)
+        self.assertEqual((_metadata['image_phash'], _metadata['palette'], 
+                          _metadata['dominant_colors']), (None, None, ''))
+
+
+    def test_analysis(self):
+        _metadata = extract_image_metadata(
+                        self.upload(self.artworks[0], create_image()), 2)
+        self.assertIsNotNone(_metadata['image_phash'])
+        _palette = unpack_palette(_metadata['palette'])
+        self.assertEqual(len(_palette), 2)
+        self.assertAlmostEqual(sum(_share for _share, _rgb in _palette), 1.0, 
+                               delta=0.01)
+        self.assertEqual(_metadata['dominant_colors'].count('#'), 2)
+
+
+    def test_unreadable_image(self):
+        _metadata = extract_image_metadata(
+                        self.upload(self.artworks[0], b'not an image'))
+        self.assertEqual(_metadata['image_format'], '')
+        self.assertIsNone(_metadata['image_phash'])
+
+
+    def test_pack_palette_round_trip(self):
+        _colors = [(0.6, (255, 0, 0)), (0.4, (0, 10, 250))]
+        self.assertEqual(len(pack_palette(_colors)), 8)
+        _unpacked = unpack_palette(pack_palette(_colors))
+        self.assertEqual([_rgb for _share, _rgb in _unpacked], 
+                         [(255, 0, 0), (0, 10, 250)])
+        for (_share, _rgb), (_expected, _rgb) in zip(_unpacked, _colors):
+            self.assertAlmostEqual(_share, _expected, delta=1 / 255.0)
+        self.assertEqual(unpack_palette(None), [])
+
+
+    def test_dhash_survives_rescaling(self):
+        from PIL import Image
+
+        _original = Image.open(io.BytesIO(create_image()))
+        _smaller = Image.open(io.BytesIO(create_image((45, 40), 
+                                                      image_format='JPEG')))
+        _flipped = Image.open(io.BytesIO(create_image(flip=True)))
+        self.assertTrue(hamming_distance(get_dhash(_original), 
+                                         get_dhash(_smaller)) <= 3)
+        self.assertTrue(hamming_distance(get_dhash(_original), 
+                                         get_dhash(_flipped)) > 3)
+
+
+    def test_duplicate_index_finds_near_duplicates(self):
+        _first, _second = self.artworks
+        Artwork.artworks.filter(pk=_first.pk).update(image_phash=0x00ff00ff)
+        Artwork.artworks.filter(pk=_second.pk).update(image_phash=0x00ff00fe)
+        _index = DuplicateIndex()
+        self.assertEqual(_index.find(0x00ff00ff, exclude=_first.pk), 
+                         [(1, _second.pk)])
+        self.assertEqual(_index.find(0x00ff00ff, max_distance=0), 
+                         [(0, _first.pk)])
+        self.assertEqual(_index.find(-0x00ff00ff), [])
+        self.assertEqual(_index.find_groups(), [[_first.pk, _second.pk]])
+
+
+    def test_duplicate_index_recall(self):
+        _first, _second = self.artworks
+        # Three flipped bits spread over three of the four bands.
+        _phash = 0x0123456789abcdef
+        _other = _phash ^ (1 | (1 << 20) | (1 << 40))
+        Artwork.artworks.filter(pk=_first.pk).update(image_phash=_phash)
+        Artwork.artworks.filter(pk=_second.pk).update(image_phash=_other)
+        self.assertEqual(DuplicateIndex().find(_phash, exclude=_first.pk), 
+                         [(3, _second.pk)])
+        with self.assertRaises(ValueError):
+            DuplicateIndex().find(_phash, max_distance=4)
+        with self.assertRaises(CommandError):
+            call_command('report_duplicate_artworks', distance=4, 
+                         stdout=StringIO())
+
+
+    def test_outbox_analyses_uploaded_image(self):
+        _artwork = self.artworks[0]
+        self.upload(_artwork, create_image())
+        OutboxEvent.record(_artwork, OutboxEvent.UPDATE, ['uploaded_image'])
+        drain()
+        _artwork = Artwork.artworks.get(pk=_artwork.pk)
+        self.assertIsNotNone(_artwork.image_phash)
+        self.assertTrue(_artwork.dominant_colors)
+        self.assertEqual(Artwork.artworks.get(pk=self.artworks[1].pk
+                                     ).image_phash, None)
+
+
+    def test_extract_image_metadata_command(self):
+        for _artwork in self.artworks:
+            self.upload(_artwork, create_image())
+        _out = StringIO()
+        call_command('extract_image_metadata', stdout=_out)
+        self.assertIn('2 artwork(s)', _out.getvalue())
+        self.assertEqual(Artwork.artworks.filter(image_phash__isnull=True, 
+                                                 image_format='PNG').count(), 
+                         0)
+        self.assertEqual(Artwork.artworks.filter(image_format='PNG').count(), 2)
+# /ImageAnalysisTest
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GenreRegistryTest(TestCase):
+
+    def setUp(self):
+        genre_registry.invalidate()
+        self.contemporary = create_genre('Contemporary')
+        self.miniature = create_genre('Miniature')
+        _first, _second = create_artists(2)
+        create_artworks(_first, self.contemporary, 2)
+        create_artworks(_second, self.miniature, 3)
+
+
+    def test_contemporary_and_traditional_artworks(self):
+        self.assertEqual(Artwork.artworks.contemporary().count(), 2)
+        self.assertEqual(Artwork.artworks.traditional().count(), 3)
+
+
+    def test_traditional_includes_genres_not_yet_loaded(self):
+        genre_registry.contemporary_ids()
+        # Inserted without signals, so the registry does not know it yet.
+        Genre.genres.bulk_create([Genre(name='Tanjore', slug='tanjore')])
+        Artwork.artworks.filter(genre=self.miniature
+                       ).update(genre=Genre.genres.get(slug='tanjore'))
+        self.assertEqual(Artwork.artworks.traditional().count(), 3)
+
+
+    def test_change_during_load_is_not_missed(self):
+        _registry = GenreRegistry()
+        _registry._version.check_interval = 0
+        _load = _registry._load
+
+        def _load_while_changing():
+            _state = _load()
+            Genre.genres.create(name='Pattachitra')
+            GenreRegistry().invalidate()
+            return _state
+
+        _registry._load = _load_while_changing
+        self.assertIsNone(_registry.get_by_name('Pattachitra'))
+        _registry._load = _load
+        self.assertIsNotNone(_registry.get_by_name('Pattachitra'))
+# /GenreRegistryTest
+
+
+class PrerenderPathsTest(TestCase):
+
+    def setUp(self):
+        genre_registry.invalidate()
+        _genre = create_genre()
+        self.artist, _other = create_artists(2)
+        create_artworks(self.artist, _genre, 2)
+        create_artworks(_other, _genre, 1)
+        self.command = PrerenderGalleryCommand()
+        self.all_paths, _changed = self.command.collect_paths()
+        self.since = timezone.now()
+
+
+    def get_changed(self):
+        return self.command.collect_paths(self.since, self.all_paths)[1]
+
+
+    def test_nothing_changed(self):
+        self.assertEqual(self.get_changed(), set())
+
+
+    def test_deleted_artwork_rerenders_listings_and_artist(self):
+        Artwork.artworks.filter(artist=self.artist).first().delete()
+        _changed = self.get_changed()
+        self.assertIn(self.artist.get_absolute_url(), _changed)
+        self.assertIn(reverse('v_home'), _changed)
+
+
+    def test_updated_artist_rerenders_its_artworks(self):
+        Artist.artists.filter(pk=self.artist.pk).update(
+                              updated=timezone.now())
+        _changed = self.get_changed()
+        for _artwork in Artwork.artworks.filter(artist=self.artist):
+            self.assertIn(_artwork.get_absolute_url(), _changed)
+        self.assertEqual(len([_path for _path in _changed 
+                              if '-work-' in _path]), 2)
+# /PrerenderPathsTest
+
+
+def hexencode_per_char(unencoded_string):
+    # The filter as it was, hexlifying one character at a time.
+    return "".join(["%" + force_str(binascii.hexlify(force_bytes(char))) 
+                    for char in unencoded_string])
+
+
+class HexencodeTest(SimpleTestCase):
+
+    def test_ascii(self):
+        self.assertEqual(hexencode_tags.hexencode('a@b.c'), 
+                         '%61%40%62%2e%63')
+        self.assertEqual(hexencode_tags.hexencode('a@b.c'), 
+                         hexencode_per_char('a@b.c'))
+
+
+    def test_multibyte(self):
+        self.assertEqual(hexencode_tags.hexencode(u'r\xe9sum\xe9'), 
+                         '%72%c3%a9%73%75%6d%c3%a9')
+        self.assertEqual(hexencode_tags.hexencode(u'\u0915'), '%e0%a4%95')
+
+
+    def test_memo_is_bounded(self):
+        for _index in range(hexencode_tags.HEXENCODE_CACHE_SIZE * 2):
+            hexencode_tags.hexencode('visitor%d@example.com' % _index)
+        self.assertEqual(len(hexencode_tags._hexencoded), 
+                         hexencode_tags.HEXENCODE_CACHE_SIZE)
+# /HexencodeTest
+
+
+# Whether the hexencode benchmark fails when the faster encoders are not 
+# faster; timings on shared machines are too noisy to gate on by default.
+HEXENCODE_BENCHMARK_ASSERT = getattr(settings, 'HEXENCODE_BENCHMARK_ASSERT', 
+                                     False)
+
+
+class HexencodeBenchmark(SimpleTestCase):
+    """
+    Times the per-character encoder against the whole-string encoder, with 
+    and without memoization, on a typical contact address and a long 
+    non-ASCII string, and reports the timings on standard error.  The 
+    timings are only compared if `HEXENCODE_BENCHMARK_ASSERT` is set.
+    
+    On non-ASCII input the whole-string encoder writes an escape per byte 
+    rather than per character, so only its ASCII timing is compared.
+    """
+
+    NUMBER = 2000
+
+    INPUTS = (
+        ('email', 'gallery.contact@artlaasya.example.com'),
+        ('non-ascii', u'\u0915\u0932\u093e \u0926\u0940\u0930'
+                      u'\u094d\u0918\u093e' * 20),
+    )
+
+    def time(self, func, value):
+        return min(timeit.repeat(lambda: func(value), 
+                                 number=self.NUMBER, 
+                                 repeat=3))
+
+
+    def test_memoized_results(self):
+        _encode = hexencode_tags._hexencode
+        _encoded = []
+        
+        def _counting_hexencode(value):
+            _encoded.append(value)
+            return _encode(value)
+        
+        hexencode_tags._hexencode = _counting_hexencode
+        try:
+            for _name, _value in self.INPUTS:
+                hexencode_tags._hexencoded.pop(_value, None)
+                for _repeat in range(self.NUMBER):
+                    self.assertEqual(hexencode_tags.hexencode(_value), 
+                                     _encode(_value))
+        finally:
+            hexencode_tags._hexencode = _encode
+        self.assertEqual(_encoded, [_value for _name, _value in self.INPUTS])
+        self.assertEqual(hexencode_tags._hexencode(self.INPUTS[0][1]), 
+                         hexencode_per_char(self.INPUTS[0][1]))
+
+
+    def test_benchmark(self):
+        for _name, _value in self.INPUTS:
+            hexencode_tags.hexencode(_value)
+            _timings = [('per-char', self.time(hexencode_per_char, _value)),
+                        ('whole-string', 
+                         self.time(hexencode_tags._hexencode, _value)),
+                        ('memoized', 
+                         self.time(hexencode_tags.hexencode, _value))]
+            for _label, _seconds in _timings:
+                sys.stderr.write("\nhexencode %-9s %-12s %8.2f us" % (
+                                 _name, _label, 
+                                 _seconds / self.NUMBER * 1e6))
+            if not HEXENCODE_BENCHMARK_ASSERT:
+                continue
+            _per_char, _whole, _memoized = [_seconds 
+                                            for _label, _seconds in _timings]
+            self.assertLess(_memoized, _per_char)
+            if _name == 'email':
+                self.assertLess(_whole, _per_char)
+# /HexencodeBenchmark
+
+
+# JSON-lines file each start-up benchmark run is appended to, and the label
+# (release or revision) it is recorded under.
+STARTUP_BENCHMARK_FILE = getattr(settings, 'STARTUP_BENCHMARK_FILE', None)
+
+STARTUP_BENCHMARK_LABEL = getattr(settings, 'STARTUP_BENCHMARK_LABEL', '')
+
+# Seconds a new worker may take to set up Django and import the URLconf.
+STARTUP_BUDGET_SECONDS = getattr(settings, 'STARTUP_BUDGET_SECONDS', None)
+
+# Modules only this app's image code uses, which the start-up path must 
+# leave to be imported on first use.  PIL itself is not among them: 
+# deepzoom.models imports it when the app registry is populated.
+LAZY_MODULES = ('numpy', 'brotli', 'PIL.ImageCms')
+
+
+class StartupBenchmark(SimpleTestCase):
+    """
+    Times the start-up of a new worker in fresh interpreters through the
+    `profile_startup` command, appending each record to 
+    `STARTUP_BENCHMARK_FILE`, if set, so the cost can be followed from 
+    release to release.
+    """
+
+    RUNS = 3
+
+    def profile(self):
+        _output = StringIO()
+        call_command('profile_startup', 
+                     runs=self.RUNS, 
+                     top=100000, 
+                     json=True, 
+                     append=STARTUP_BENCHMARK_FILE, 
+                     label=STARTUP_BENCHMARK_LABEL, 
+                     stdout=_output)
+        return json.loads(_output.getvalue())
+
+
+    def test_startup_time(self):
+        _record = self.profile()
+        _total = _record['setup_seconds'] + _record['urlconf_seconds']
+        sys.stderr.write("\nstart-up: django.setup() %.3fs, URLconf %.3fs" % 
+                         (_record['setup_seconds'], 
+                          _record['urlconf_seconds']))
+        if STARTUP_BUDGET_SECONDS is not None:
+            self.assertLessEqual(_total, STARTUP_BUDGET_SECONDS)
+
+
+    @skipUnless(sys.version_info >= (3, 7), 
+                "Import times need `python -X importtime`.")
+    def test_image_libraries_load_lazily(self):
+        _modules = set(_module for _module, _seconds 
+                       in self.profile()['slowest_imports'])
+        self.assertEqual(_modules.intersection(LAZY_MODULES), set())
+# /StartupBenchmark
+
+
+#EOF - artlaasya tests
@@ -0,0 +1,195 @@
+"""artlaasya typeahead"""
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+
+import threading
+from bisect import bisect_left, insort
+
+from artlaasya.registry import SharedVersion
+
+
+
+TYPEAHEAD_LIMIT = getattr(settings, 'TYPEAHEAD_LIMIT', 10)
+
+TYPEAHEAD_VERSION_KEY = getattr(settings, 'TYPEAHEAD_VERSION_KEY',
+                                'artlaasya:typeahead:version')
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def get_keys(label):
+    """
+    Returns the keys a label is found under: the whole label and the label
+    starting from each later word, so "Pablo Picasso" matches "pic".
+    """
+    _words = normalize(label).split(' ')
+    return set(' '.join(_words[_index:]) for _index in range(len(_words))
+               if _words[_index])
+
+
+def get_entry(kind, label, url):
+    return ({'kind': kind, 'label': label, 'url': url}, get_keys(label))
+
+
+class TypeaheadIndex(object):
+    """
+    In-memory prefix index of active artist names, artwork titles and genre
+    names.
+
+    Keys are held in a sorted list, so a prefix lookup is a `bisect` to the
+    first candidate followed by a short scan.  The index is built on first
+    use and kept current by an outbox consumer once changes commit.
+
+    Every change bumps a version kept in the shared cache.  The process 
+    making it applies it in place; every other process finds the version 
+    moved on and rebuilds on its next lookup.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = SharedVersion(TYPEAHEAD_VERSION_KEY)
+        self._built_version = None
+        self._keys = None
+        self._entries = None
+
+
+    def _build(self):
+        """
+        Builds the index into new structures and swaps them in whole, so a 
+        failed build leaves no partial index behind.
+        """
+        from artlaasya.models import Artist, Artwork, Genre
+
+        _version = self._version.get()
+        _keys = []
+        _entries = {}
+        
+        def _add(kind, pk, label, url):
+            _entries[(kind, pk)] = get_entry(kind, label, url)
+            _keys.extend((_key, kind, pk) for _key in _entries[(kind, pk)][1])
+        
+        for _pk, _first_name, _last_name, _slug in Artist.artists.active(
+                                                   ).values_list('pk',
+                                                                 'first_name',
+                                                                 'last_name',
+                                                                 'slug'):
+            _add('artist', _pk, '%s %s' % (_first_name, _last_name),
+                 reverse('v_artist', kwargs={'artist_name': _slug}))
+        for _pk, _title, _slug, _artist_slug in Artwork.artworks.active(
+                                                ).filter(artist__is_active=True
+                                                ).order_by(
+                                                ).values_list('pk',
+                                                              'title',
+                                                              'slug',
+                                                              'artist__slug'):
+            _add('artwork', _pk, _title,
+                 reverse('v_artwork',
+                         kwargs={'artist_name': _artist_slug,
+                                 'artwork_title': _slug}))
+        for _pk, _name, _slug in Genre.genres.filter(is_active=True
+                                            ).values_list('pk',
+                                                          'name',
+                                                          'slug'):
+            _add('genre', _pk, _name,
+                 reverse('v_learn', kwargs={'artwork_genre': _slug}))
+        _keys.sort()
+        self._keys, self._entries = _keys, _entries
+        self._built_version = _version
+
+
+    def _ensure_built(self):
+        if (self._keys is not None and 
+            self._version.has_changed(self._built_version)):
+            self._keys = self._entries = None
+        if self._keys is None:
+            self._build()
+
+
+    def _add(self, kind, pk, label, url):
+        self._entries[(kind, pk)] = get_entry(kind, label, url)
+        for _key in self._entries[(kind, pk)][1]:
+            insort(self._keys, (_key, kind, pk))
+
+
+    def _remove(self, kind, pk):
+        _existing = self._entries.pop((kind, pk), None)
+        if _existing is None:
+            return
+        for _key in _existing[1]:
+            _index = bisect_left(self._keys, (_key, kind, pk))
+            if (_index < len(self._keys) and
+                self._keys[_index] == (_key, kind, pk)):
+                del self._keys[_index]
+
+
+    def update(self, kind, pk, label=None, url=None):
+        """
+        Replaces the entry for `(kind, pk)`; passing no label removes it.
+        """
+        self.update_many([(kind, pk, label, url)])
+
+
+    def update_many(self, updates):
+        """
+        Applies `[(kind, pk, label, url)]` as `update` does, under one 
+        version bump.  Call once the change has committed.
+        """
+        if not updates:
+            return
+        with self._lock:
+            _version = self._version.bump()
+            if self._keys is None:
+                return
+            if _version is None or _version != self._built_version + 1:
+                # Another process changed the index too; rebuild it whole.
+                self._keys = self._entries = None
+                return
+            for _kind, _pk, _label, _url in updates:
+                self._remove(_kind, _pk)
+                if _label:
+                    self._add(_kind, _pk, _label, _url)
+            self._built_version = _version
+
+
+    def invalidate(self):
+        """
+        Discards the index in this and every other process; the next 
+        lookup rebuilds it.
+        """
+        with self._lock:
+            self._keys = None
+            self._entries = None
+        self._version.bump()
+
+
+    def lookup(self, prefix, limit=TYPEAHEAD_LIMIT):
+        """
+        Returns up to `limit` entries with a key starting with `prefix`.
+        """
+        _prefix = normalize(prefix)
+        if not _prefix:
+            return []
+        with self._lock:
+            self._ensure_built()
+            _found = []
+            _seen = set()
+            _index = bisect_left(self._keys, (_prefix,))
+            while _index < len(self._keys) and len(_found) < limit:
+                _key, _kind, _pk = self._keys[_index]
+                if not _key.startswith(_prefix):
+                    break
+                if (_kind, _pk) not in _seen:
+                    _seen.add((_kind, _pk))
+                    _found.append(self._entries[(_kind, _pk)][0])
+                _index += 1
+            return _found
+# /TypeaheadIndex
+
+
+typeahead_index = TypeaheadIndex()
+
+
+#EOF - artlaasya typeahead
@@ -0,0 +1,56 @@
+"""artlaasya urlbuilder"""
+
+from django.core.urlresolvers import reverse, get_script_prefix, get_urlconf
+from django.utils.http import urlquote
+
+import threading
+
+
+
+PLACEHOLDER = 'zzzplaceholder%dzzz'
+
+# Characters `reverse()` leaves unquoted in URL arguments.
+SAFE_CHARACTERS = "!$&'()*+,;=/~:@"
+
+_templates = {}
+_lock = threading.Lock()
+
+
+def get_url_template(view_name, kwarg_names):
+    """
+    Returns a `%`-format template for the URL of `view_name`, reversing the 
+    URL pattern only the first time for each set of keyword arguments, 
+    script prefix and URLconf.
+    """
+    _key = (view_name, tuple(kwarg_names), get_script_prefix(), get_urlconf())
+    _template = _templates.get(_key)
+    if _template is None:
+        _placeholders = dict((_name, PLACEHOLDER % _index) 
+                             for _index, _name in enumerate(kwarg_names))
+        _template = reverse(view_name, kwargs=_placeholders).replace('%', '%%')
+        for _name, _placeholder in _placeholders.items():
+            _template = _template.replace(_placeholder, '%%(%s)s' % _name)
+        with _lock:
+            _templates[_key] = _template
+    return _template
+
+
+def build_url(view_name, **kwargs):
+    """
+    Builds the URL of `view_name` from already loaded values, without 
+    resolving the URLconf.
+    
+    Unlike `reverse()` the values are not checked against the URL pattern, 
+    so they must be values the pattern accepts, such as model slugs.
+    """
+    _template = get_url_template(view_name, sorted(kwargs))
+    return _template % dict((_name, urlquote(_value, safe=SAFE_CHARACTERS)) 
+                            for _name, _value in kwargs.items())
+
+
+def clear_url_templates():
+    with _lock:
+        _templates.clear()
+
+
+#EOF - artlaasya urlbuilder
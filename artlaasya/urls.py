@@ -5,10 +5,13 @@ from django.contrib import admin
 from django.conf import settings
 
 from artlaasya import views
+from artlaasya.utils import is_django_version_greater_than
 
 
 
-admin.autodiscover()
+# Django 1.7+ autodiscovers admin modules once, from the admin app's ready().
+if not is_django_version_greater_than(1, 6):
+    admin.autodiscover()
 
 # Dynamic page URL patterns.
 urlpatterns = patterns('', 
@@ -22,15 +25,30 @@ urlpatterns = patterns('',
   url(r'^artwork/(?P<artist_name>\b[a-z0-9\-]+\b)/(?P<artwork_title>\b[a-z0-9\-\'\(\.\)\!\?]+\b)',
       views.artwork,
       name="v_artwork"), 
+  url(r'^artworks/price/$',
+      views.artworks_by_price,
+      name="v_artworks-price"), 
   url(r'^artworks/(?P<artwork_genre>\b[a-z\-]+\b)',
       views.artworks,
       name="v_artworks-genre"), 
+  url(r'^event/(?P<event_title>\b[a-z0-9\-\'\(\)\!\?]+\b)/reserve/$',
+      views.reserve,
+      name="v_event-reserve"), 
   url(r'^event/(?P<event_title>\b[a-z0-9\-\'\(\)\!\?]+\b)',
       views.event,
       name="v_event"), 
   url(r'^events/$',
       views.events,
       name="v_events"), 
+  url(r'^events/(?P<event_period>upcoming|ongoing|past)/$',
+      views.events,
+      name="v_events-period"), 
+  url(r'^events/calendar/$',
+      views.events_calendar,
+      name="v_events-calendar"), 
+  url(r'^events/calendar/(?P<year>\d{4})/(?P<month>\d{1,2})/$',
+      views.events_calendar,
+      name="v_events-calendar-month"), 
   url(r'^learn/(?P<artwork_genre>\b[a-z\-]+\b)',
       views.learn,
       name="v_learn"), 
@@ -40,6 +58,9 @@ urlpatterns = patterns('',
   url(r'^searching/$',
       views.searching,
       name="v_searching"), 
+  url(r'^typeahead/$',
+      views.typeahead,
+      name="v_typeahead"), 
 )
 
 # Static page URL patterns. 
@@ -82,8 +103,8 @@ urlpatterns += patterns('',
         name='sitemap'), 
 )
 
-# Debug toolbar URL patterns.
-if settings.DEBUG:
+# Debug toolbar URL patterns, only where the toolbar is installed.
+if settings.DEBUG and 'debug_toolbar' in settings.INSTALLED_APPS:
     import debug_toolbar
     urlpatterns += patterns('',
         url(r'^__debug__/', include(debug_toolbar.urls)),
@@ -1,8 +1,9 @@
 """artlaasya utils """
 
 from django import get_version
+from django.db import transaction
 
-import os
+import threading
 
 
 
@@ -15,14 +16,140 @@ def is_django_version_greater_than(major=1, minor=4):
     return (int(_major) >= major and int(_minor) > minor)
 
 
-def delete_uploaded_file(path_of_file_to_delete=None):
+def iterate_in_batches(queryset, batch_size=500):
     """
-    Deletes uploaded file from storage.
+    Yields every row of `queryset` in primary key order while holding at 
+    most `batch_size` rows in memory.
+    
+    Batches are fetched by keyset (`pk > last pk seen`) rather than by 
+    offset, so each batch costs the same however deep into the table it is.  
+    `values()` querysets must include 'pk' among their fields.
     """
-    try:
-        os.remove(path_of_file_to_delete)
-    except OSError:
-        pass
+    _queryset = queryset.order_by('pk')
+    _last_pk = None
+    while True:
+        if _last_pk is None:
+            _batch = list(_queryset[:batch_size])
+        else:
+            _batch = list(_queryset.filter(pk__gt=_last_pk)[:batch_size])
+        for _row in _batch:
+            yield _row
+        if len(_batch) < batch_size:
+            return
+        _last_pk = (_batch[-1]['pk'] if isinstance(_batch[-1], dict) 
+                    else _batch[-1].pk)
+
+
+_pending = threading.local()
+
+
+def _get_blocks():
+    if not hasattr(_pending, 'blocks'):
+        _pending.blocks = []
+        _pending.deferred = []
+        _pending.in_request = False
+    return _pending.blocks
+
+
+class atomic(object):
+    """
+    `transaction.atomic` that also honours `on_commit` on Django versions 
+    without `transaction.on_commit`: callbacks registered inside the block 
+    are dropped if it rolls back and run once the outermost block commits.
+    
+    Callbacks still inside a plain `transaction.atomic` block when this one 
+    exits are, during a request, deferred to `run_deferred_on_commit`.  
+    Outside a request, in management commands, the outbox drain and 
+    threads, nothing would run them later, so they run when the outermost 
+    block exits; such code should open its transactions with this class.
+    """
+    
+    def __init__(self, using=None, savepoint=True):
+        self.using = using
+        self._atomic = transaction.atomic(using=using, savepoint=savepoint)
+    
+    
+    def __enter__(self):
+        self._atomic.__enter__()
+        if not hasattr(transaction, 'on_commit'):
+            _get_blocks().append([])
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            _result = self._atomic.__exit__(exc_type, exc_value, traceback)
+        except Exception:
+            exc_type = True
+            raise
+        finally:
+            if not hasattr(transaction, 'on_commit'):
+                _callbacks = _get_blocks().pop()
+                if exc_type is None:
+                    _commit(_callbacks, self.using)
+        return _result
+# /atomic
+
+
+def _commit(callbacks, using):
+    _blocks = _get_blocks()
+    if _blocks:
+        _blocks[-1].extend(callbacks)
+    elif (_pending.in_request and 
+          transaction.get_connection(using).in_atomic_block):
+        _pending.deferred.extend(callbacks)
+    else:
+        for _func in callbacks:
+            _func()
+
+
+def begin_deferring_on_commit():
+    """
+    Marks the start of a request, whose transaction may outlast any 
+    `atomic` block; connected to `request_started`.
+    """
+    _get_blocks()
+    _pending.in_request = True
+    _pending.deferred = []
+
+
+def run_deferred_on_commit():
+    """
+    Runs the callbacks deferred past the end of an `atomic` block once the 
+    request's transaction has ended; connected to `request_finished`.
+    """
+    _get_blocks()
+    _pending.in_request = False
+    _deferred, _pending.deferred = _pending.deferred, []
+    for _func in _deferred:
+        _func()
+
+
+def discard_deferred_on_commit():
+    """
+    Drops deferred callbacks whose transaction may have rolled back; 
+    connected to `got_request_exception`.
+    """
+    _get_blocks()
+    _pending.deferred = []
+
+
+def on_commit(func, using=None):
+    """
+    Runs `func` once the current transaction commits, or immediately when no 
+    transaction is open.
+    
+    Django versions without `transaction.on_commit` keep `func` with the 
+    innermost `artlaasya.utils.atomic` block, or, inside a plain 
+    `transaction.atomic` block during a request, until 
+    `run_deferred_on_commit`.  Outside a request, a plain block's end cannot 
+    be seen, so `func` then runs at once.
+    """
+    _on_commit = getattr(transaction, 'on_commit', None)
+    if _on_commit is not None:
+        _on_commit(func, using=using)
+    else:
+        _commit([func], using)
 
 
 #EOF - artlaasya utils
\ No newline at end of file
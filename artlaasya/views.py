@@ -6,17 +6,35 @@ from django.template import RequestContext
 from django.views.generic import TemplateView
 from django.contrib.sitemaps import Sitemap
 from django.conf import settings
-from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
-import re
 import os.path
+import calendar
 import operator
+from datetime import date, MINYEAR, MAXYEAR
 from random import shuffle
 
-from artlaasya.models import Artist, Genre, Artwork, Event
+from artlaasya.models import Artist, Artwork, Event
+from artlaasya.managers import PRICE_BANDS
+from artlaasya.forms import ReservationForm
+from artlaasya.reservations import reserve_seats, ReservationError
+from artlaasya.registry import genre_registry
+from artlaasya.recommendations import get_recommendations
+from artlaasya.typeahead import typeahead_index
+from artlaasya.homegrid import get_home_grid
+from artlaasya.caching import cache_policy
+from artlaasya.search import (search_artworks, search_artworks_by_color, 
+                              search_artists)
+from artlaasya.palette import parse_color
 
 
 
+EVENTS_PER_PAGE = getattr(settings, 'EVENTS_PER_PAGE', 20)
+
+ARTWORKS_PER_PAGE = getattr(settings, 'ARTWORKS_PER_PAGE', 24)
+
+
 class BaseSitemap(Sitemap):
     """
     Base class for other Sitemap classes.
@@ -69,7 +87,7 @@ class ArtworkSitemap(BaseSitemap):
     priority = 1.0
  
     def items(self):
-        return Artwork.artworks.active()
+        return Artwork.artworks.active().for_listing()
 # /ArtworkSitemap
 
 
@@ -82,33 +100,6 @@ class EventSitemap(BaseSitemap):
 # /EventSitemap
 
 
-def normalize_query(query_string,
-                    findterms=re.compile(r'"([^"]+)"|(\S+)').findall,
-                    normspace=re.compile(r'\s{2,}').sub):
-    return [normspace(' ', (t[0] or t[1]).strip()) for t in findterms(query_string)] 
-# /normalize_query
-
-
-def get_query(query_string, search_fields):
-    """
-    Compound query compiler.
-    """
-    query = None # Query to search for every search term        
-    terms = normalize_query(query_string)
-    for term in terms:
-        or_query = None # Query to search for a given term in each field
-        for field_name in search_fields:
-            q = Q(**{"%s__icontains" % field_name: term})
-            if or_query is None:
-                or_query = q
-            else:
-                or_query = or_query | q
-        if query is None:
-            query = or_query
-    return query
-# /get_query
-
-
 def merge_lists(list1, list2):
     """
     Alternative list merge function to `zip_longest()`.  It does not extend 
@@ -124,15 +115,64 @@ def merge_lists(list1, list2):
 # /merge_lists
 
 
+class ArtworksOfArtists(object):
+    """
+    All artworks of each artist, artist by artist in the given order, 
+    evaluated lazily a chunk at a time.
+    
+    Iterating fetches artists `chunk_size` at a time with one query per 
+    chunk, so at most one chunk of artworks is held in memory, and may be 
+    repeated.  Length and truth take one COUNT query, made once, so 
+    templates can use `{% if %}`, `|length` and several loops as they would 
+    with a list.
+    """
+    
+    def __init__(self, artist_slugs, chunk_size=50):
+        self.artist_slugs = list(artist_slugs)
+        self.chunk_size = chunk_size
+        self._count = None
+    
+    
+    def __iter__(self):
+        for _start in range(0, len(self.artist_slugs), self.chunk_size):
+            _chunk = self.artist_slugs[_start:_start + self.chunk_size]
+            _by_artist = dict((_slug, []) for _slug in _chunk)
+            for _artwork in Artwork.artworks.for_listing(
+                                           ).filter(artist__slug__in=_chunk):
+                _by_artist[_artwork.artist.slug].append(_artwork)
+            for _slug in _chunk:
+                for _artwork in _by_artist[_slug]:
+                    yield _artwork
+    
+    
+    def __len__(self):
+        if self._count is None:
+            self._count = (Artwork.artworks.filter(
+                                   artist__slug__in=self.artist_slugs
+                                   ).count() if self.artist_slugs else 0)
+        return self._count
+    
+    
+    def __bool__(self):
+        return len(self) > 0
+    
+    __nonzero__ = __bool__
+# /ArtworksOfArtists
+
+
 #===============================================================================
 
+@cache_policy('home', keys=('home',))
 def home(request):
     """
     Returns all artworks that are representative for each artist and that are 
     active.
     Only one artwork can be representative per artist.
+    
+    The artworks are precomputed cards from `artlaasya.homegrid`, read from 
+    the cache in one lookup.  An empty catalogue renders an empty grid.
     """
-    _artworks = get_list_or_404(Artwork.artworks.representative().active())
+    _artworks = get_home_grid()
     
     return render_to_response('t_home.html', 
                               {'artworks': _artworks}, 
@@ -140,20 +180,25 @@ def home(request):
 # /home
 
 
+@cache_policy('artist', keys=('artist-{artist_name}', 'events'))
 def artist(request, artist_name=None):
     """
-    Returns an artist and all active artworks for that artist.
+    Returns an artist, all active artworks for that artist and the artist's 
+    upcoming events, in three queries however many artworks there are.
+    An artist without active artworks is shown with none.
     """
-    _artist = get_object_or_404(Artist.artists.active(), slug=artist_name)
-    _artworks = get_list_or_404(Artwork.artworks.active(), artist=_artist)
+    _artist = get_object_or_404(Artist.artists.active().detailed(), 
+                                slug=artist_name)
     
     return render_to_response('t_artist.html', 
                               {'artist': _artist, 
-                               'artworks': _artworks}, 
+                               'artworks': _artist.active_artworks, 
+                               'events': _artist.upcoming_events}, 
                               context_instance=RequestContext(request))
 # /artist
 
 
+@cache_policy('artists', keys=('artists',))
 def artists(request, artist_genre=None):
     """
     Returns either only new, only contemporary, only traditional, or all 
@@ -166,24 +211,28 @@ def artists(request, artist_genre=None):
         _artworks = get_list_or_404(Artwork.artworks.recent(
                                                    ).representative(
                                                    ).active(
-                                                   ).orderly(),
+                                                   ).orderly(
+                                                   ).for_listing(),
                                                    artist__is_active=True)
     elif (artist_genre == 'all'):
         _artworks = get_list_or_404(Artwork.artworks.representative(
                                                    ).active(
-                                                   ).orderly(),
+                                                   ).orderly(
+                                                   ).for_listing(),
                                                    artist__is_active=True)
     elif (artist_genre == 'contemporary'):
         _artworks = get_list_or_404(Artwork.artworks.contemporary(
                                                    ).representative(
                                                    ).active(
-                                                   ).orderly(),
+                                                   ).orderly(
+                                                   ).for_listing(),
                                                    artist__is_active=True)
     elif (artist_genre == 'traditional'):
         _artworks = get_list_or_404(Artwork.artworks.traditional(
                                                    ).representative(
                                                    ).active(
-                                                   ).orderly(),
+                                                   ).orderly(
+                                                   ).for_listing(),
                                                    artist__is_active=True)
     
     return render_to_response('t_artists.html', 
@@ -192,24 +241,35 @@ def artists(request, artist_genre=None):
 # /artists
 
 
+@cache_policy('artwork', keys=('artwork-{artwork_title}', 
+                               'artist-{artist_name}', 
+                               'artworks'))
 def artwork(request, artist_name=None, artwork_title=None):
     """
-    Returns the specified artwork for the specified artist and all additional 
-    artworks by that artist that are active.
+    Returns the specified artwork for the specified artist, all additional 
+    artworks by that artist that are active, and similar artworks by any 
+    artist.
     """
-    _selected_artwork = get_object_or_404(Artwork.artworks.active(), 
+    _selected_artwork = get_object_or_404(Artwork.artworks.active(
+                                                   ).select_related('artist'), 
                                           slug=artwork_title)
     
-    _other_artworks = Artwork.artworks.filter(artist__slug=artist_name).exclude(
-                                              slug=artwork_title).active()
+    _other_artworks = Artwork.artworks.filter(artist=_selected_artwork.artist
+                                     ).exclude(pk=_selected_artwork.pk
+                                     ).active(
+                                     ).for_listing()
+    
+    _recommended_artworks = get_recommendations(_selected_artwork)
     
     return render_to_response('t_artwork.html', 
                               {'other_artworks': _other_artworks,
+                               'recommended_artworks': _recommended_artworks,
                                'selected_artwork': _selected_artwork}, 
                               context_instance=RequestContext(request))
 # /artwork
 
 
+@cache_policy('artworks', keys=('artworks',), max_age=0, etag=False)
 def artworks(request, artwork_genre=None):
     """
     Returns either only new, only contemporary, only traditional, or all 
@@ -231,7 +291,8 @@ def artworks(request, artwork_genre=None):
     and the second to retrieve all artworks for each artist.
     
     Artists are retrieved per genre, then shuffled, then merged if all or new, 
-    and finally artworks are retrieved for the artists.
+    and finally artworks are loaded for the artists as the template iterates, 
+    a chunk of artists per query.
     
     It is slower than the more straightforward solution of linking genre to 
     artist too, but is compliant with requirements...
@@ -261,9 +322,7 @@ def artworks(request, artwork_genre=None):
         _alternating_new = merge_lists(_contemporary_new, _traditional_new)
         
         #Gather all artworks for each artist.
-        _artworks = []
-        for _artist in _alternating_new:
-            _artworks.extend(Artwork.artworks.filter(artist__slug=_artist))
+        _artworks = ArtworksOfArtists(_alternating_new)
     else:
         #Find ALL contemporary artists.
         _contemporary_all = list(Artwork.artworks.contemporary(
@@ -288,19 +347,18 @@ def artworks(request, artwork_genre=None):
             _alternating_all = merge_lists(_contemporary_all, _traditional_all)
             
             #Gather all artworks for each artist.
-            _artworks = []
-            for _artist in _alternating_all:
-                _artworks.extend(Artwork.artworks.filter(artist__slug=_artist))
+            _artworks = ArtworksOfArtists(_alternating_all)
         elif (artwork_genre == 'contemporary'):
             #If ONLY contemporary, gather only the contemporary artworks.
-            _artworks = []
-            for _artist in _contemporary_all:
-                _artworks.extend(Artwork.artworks.filter(artist__slug=_artist))
+            _artworks = ArtworksOfArtists(_contemporary_all)
         elif (artwork_genre == 'traditional'):
             #If ONLY traditional, gather only the traditional artworks.
-            _artworks = []
-            for _artist in _traditional_all:
-                _artworks.extend(Artwork.artworks.filter(artist__slug=_artist))
+            _artworks = ArtworksOfArtists(_traditional_all)
+        else:
+            raise Http404("No such genre.")
+    
+    if not _artworks:
+        raise Http404("No artworks.")
     
     return render_to_response('t_artworks.html', 
                               {'artworks': _artworks}, 
@@ -308,11 +366,70 @@ def artworks(request, artwork_genre=None):
 # /artworks
 
 
+@cache_policy('artworks_by_price', keys=('artworks',))
+def artworks_by_price(request):
+    """
+    Returns a page of active artworks with displayed prices, optionally 
+    limited to a price band or a `min`/`max` range, sorted by price.
+    
+    Pages are addressed with an `after` cursor of the form `price:pk` taken 
+    from the last artwork on the previous page, so deep pages cost the same 
+    as the first.
+    
+    The project's `t_artworks_by_price.html` is given the page's 
+    `artworks`, with artists joined; `price_bands`, the band names; the 
+    selected `band` and `sort` ('price' or '-price'); and `next_cursor`, 
+    the `after` value of the next page, or None on the last.
+    """
+    _band = request.GET.get('band')
+    _descending = (request.GET.get('sort') == '-price')
+    
+    try:
+        _minimum = int(request.GET['min']) if request.GET.get('min') else None
+        _maximum = int(request.GET['max']) if request.GET.get('max') else None
+    except ValueError:
+        raise Http404("Invalid price range.")
+    
+    if _band:
+        _artworks = Artwork.artworks.price_band(_band)
+    else:
+        _artworks = Artwork.artworks.price_between(_minimum, _maximum)
+    _artworks = _artworks.active().filter(artist__is_active=True
+                                 ).select_related('artist'
+                                 ).by_price(_descending)
+    
+    if request.GET.get('after'):
+        try:
+            _price, _pk = [int(_part) for _part in 
+                           request.GET['after'].split(':', 1)]
+        except ValueError:
+            raise Http404("Invalid page cursor.")
+        _artworks = _artworks.price_after(_price, _pk, _descending)
+    
+    _artworks = list(_artworks[:ARTWORKS_PER_PAGE + 1])
+    _next_cursor = None
+    if len(_artworks) > ARTWORKS_PER_PAGE:
+        _artworks = _artworks[:ARTWORKS_PER_PAGE]
+        _next_cursor = '%d:%d' % (_artworks[-1].price, _artworks[-1].pk)
+    
+    return render_to_response('t_artworks_by_price.html', 
+                              {'artworks': _artworks, 
+                               'price_bands': [_b[0] for _b in PRICE_BANDS], 
+                               'band': _band, 
+                               'sort': '-price' if _descending else 'price', 
+                               'next_cursor': _next_cursor}, 
+                              context_instance=RequestContext(request))
+# /artworks_by_price
+
+
+@cache_policy('learn', keys=('genre-{artwork_genre}',))
 def learn(request, artwork_genre=None):
     """
     Returns an art genre.
     """
-    _genre = get_object_or_404(Genre, slug=artwork_genre)
+    _genre = genre_registry.get_by_slug(artwork_genre)
+    if _genre is None:
+        raise Http404("No genre matches the given query.")
     
     return render_to_response('t_learn.html', 
                               {'genre': _genre}, 
@@ -320,6 +437,7 @@ def learn(request, artwork_genre=None):
 # /learn
 
 
+@cache_policy('event', keys=('event-{event_title}', 'events'))
 def event(request, event_title=None):
     """
     Returns an active event.
@@ -332,18 +450,138 @@ def event(request, event_title=None):
 #end event
 
 
-def events(request):
-    """
-    Returns all active events.
+@cache_policy('events', keys=('events',))
+def events(request, event_period=None):
     """
-    _events = get_list_or_404(Event.events.active())
+    Returns a page of active events; either all, only upcoming, only ongoing, 
+    or only past events.
+    
+    Raises 404 if there are no matching events or the page is out of range.
+    """
+    if (event_period == 'upcoming'):
+        _events = Event.events.active().upcoming()
+    elif (event_period == 'ongoing'):
+        _events = Event.events.active().ongoing()
+    elif (event_period == 'past'):
+        _events = Event.events.active().past()
+    else:
+        _events = Event.events.active()
+    
+    _paginator = Paginator(_events, EVENTS_PER_PAGE, 
+                           allow_empty_first_page=False)
+    try:
+        _page = _paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        _page = _paginator.page(1) if _paginator.count else None
+    except EmptyPage:
+        _page = None
+    if _page is None:
+        raise Http404("No events found.")
     
     return render_to_response('t_events.html', 
-                              {'events': _events}, 
+                              {'events': _page.object_list, 
+                               'page': _page, 
+                               'event_period': event_period}, 
                               context_instance=RequestContext(request))
 #end events
 
 
+@cache_policy('events_calendar', keys=('events',))
+def events_calendar(request, year=None, month=None):
+    """
+    Returns a month grid of active events, built from a single query for 
+    every event overlapping the month.
+    
+    Defaults to the current month.
+    
+    The project's `t_events_calendar.html` is given `weeks`, a list of 
+    weeks starting on Sunday, each a list of seven days as dicts of `date`, 
+    `in_month` and `events` (dicts of `title`, `slug`, `type`, 
+    `start_date`, `end_date`, `time` and `location`); and `month`, 
+    `previous_month` and `next_month`, the first day of each.
+    """
+    _today = date.today()
+    _year = int(year) if year else _today.year
+    _month = int(month) if month else _today.month
+    if not (1 <= _month <= 12):
+        raise Http404("No such month.")
+    # The neighbouring months must be representable too.
+    if not (MINYEAR < _year < MAXYEAR):
+        raise Http404("No such year.")
+    
+    _events = Event.events.active().in_month(_year, _month).order_by(
+                                   'start_date').values('title',
+                                                        'slug',
+                                                        'type',
+                                                        'start_date',
+                                                        'end_date',
+                                                        'time',
+                                                        'location')
+    
+    _weeks = calendar.Calendar(calendar.SUNDAY).monthdatescalendar(_year, 
+                                                                   _month)
+    _days = dict((_day, []) for _week in _weeks for _day in _week)
+    for _event in _events:
+        for _day in _days:
+            if _event['start_date'] <= _day <= _event['end_date']:
+                _days[_day].append(_event)
+    
+    _grid = [[{'date': _day, 
+               'in_month': _day.month == _month, 
+               'events': _days[_day]} for _day in _week] for _week in _weeks]
+    
+    _first = date(_year, _month, 1)
+    _previous = date(_year - 1, 12, 1) if _month == 1 else \
+                date(_year, _month - 1, 1)
+    _next = date(_year + 1, 1, 1) if _month == 12 else \
+            date(_year, _month + 1, 1)
+    
+    return render_to_response('t_events_calendar.html', 
+                              {'weeks': _grid, 
+                               'month': _first, 
+                               'previous_month': _previous, 
+                               'next_month': _next}, 
+                              context_instance=RequestContext(request))
+#end events_calendar
+
+
+def reserve(request, event_title=None):
+    """
+    Reserves seats at an active event.
+    
+    Renders the reservation form on GET, and on a valid POST attempts the 
+    reservation, reporting either the reservation or the reason it failed.
+    
+    The project's `t_reservation.html` is given the `event`, the `form` 
+    (`email`, `name` and `seats`), and after a POST either the saved 
+    `reservation` or an `error` message; both are None otherwise.
+    """
+    _event = get_object_or_404(Event.events.active(), slug=event_title)
+    _reservation = None
+    _error = None
+    
+    if request.method == 'POST':
+        _form = ReservationForm(request.POST)
+        if _form.is_valid():
+            try:
+                _reservation = reserve_seats(_event, 
+                                             _form.cleaned_data['email'], 
+                                             _form.cleaned_data['seats'], 
+                                             _form.cleaned_data['name'])
+            except ReservationError as e:
+                _error = str(e)
+    else:
+        _form = ReservationForm()
+    
+    return render_to_response('t_reservation.html', 
+                              {'event': _event, 
+                               'form': _form, 
+                               'reservation': _reservation, 
+                               'error': _error}, 
+                              context_instance=RequestContext(request))
+#end reserve
+
+
 class search(TemplateView):
     """
     Returns a simple search template.
@@ -355,32 +593,55 @@ class search(TemplateView):
 def searching(request):
     """
     Simple search function.
+    
+    Artworks are ranked by where the terms were found (title, then artist 
+    name, genre, medium and description) and paginated; highlighted titles 
+    and snippets are produced for the current page only.
+    
+    A `color` parameter, e.g. '#a03020', limits artworks to those with the 
+    colour in their palette, or on its own lists them by closeness.
     """
     query_string = ''
+    color = parse_color(request.GET.get('color'))
+    artworks_page = None
     artworks_found = None
     artists_found = None
     if ('q' in request.GET) and request.GET['q'].strip():
         query_string = request.GET['q']
         
-        artwork_query = get_query(query_string, ['title',
-                                                 'genre__name',
-                                                 'medium_description',
-                                                 'description',])
-        
-        artworks_found = Artwork.artworks.filter(artwork_query).active().orderly()
-        
-        artist_query = get_query(query_string, ['first_name', 
-                                                'last_name',])
+        artworks_page = search_artworks(query_string, 
+                                        request.GET.get('page', 1), 
+                                        ARTWORKS_PER_PAGE, 
+                                        color)
+        artworks_found = artworks_page.object_list
         
-        artists_found = Artist.artists.filter(artist_query).active().orderly()
+        artists_found = search_artists(query_string)
+    elif color is not None:
+        artworks_page = search_artworks_by_color(color, 
+                                                 request.GET.get('page', 1), 
+                                                 ARTWORKS_PER_PAGE)
+        artworks_found = artworks_page.object_list
     
     return render_to_response('t_search_results.html', 
                               {'query_string': query_string, 
+                               'color': ('#%02x%02x%02x' % color 
+                                         if color is not None else ''), 
+                               'artworks_page': artworks_page, 
                                'artworks_found': artworks_found, 
                                'artists_found': artists_found}, 
                               context_instance=RequestContext(request))
 # /searching
 
 
+def typeahead(request):
+    """
+    Returns JSON suggestions of artist names, artwork titles and genre names 
+    starting with the `q` parameter, answered from the in-memory index.
+    """
+    return JsonResponse({'results': 
+                         typeahead_index.lookup(request.GET.get('q', ''))})
+# /typeahead
+
+
 #EOF - artlaasya views
 